@@ -1,17 +1,66 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import os
 import numpy as np
-import datetime
+
+from src.artifacts import artifact_version, find_artifact, read_table, table_columns
+from src.clinics import clinic_dir, load_index as load_clinic_index
+from src.dashboard import (
+    COLUNAS_RISCO, FAIXA_VALOR, FORMATO_RESUMO, LIMITE_PONTOS_SCATTER, RESUMO, RiskIndex, add_idade,
+    build_summary, load_model_metadata, load_summary, map_categorical, sample_region,
+)
 
 # --- CONFIGURAÇÃO INICIAL E CARREGAMENTO DE DADOS ---
 
 # Diretório base onde está o app.py
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+DATA_DIR = os.environ.get("DASHBOARD_DATA_DIR", os.path.join(BASE_DIR, "data"))
+
+st.set_page_config(
+    page_title="Dashboard de Otimização Clínica (ML)",
+    layout="wide"
+)
+
+# Várias clínicas (process-clinics.py): o índice consolidado lista as partições e o app passa a
+# ler só os artefatos da clínica escolhida (todos os caminhos abaixo partem de DATA_DIR)
+INDICE_CLINICAS = load_clinic_index(DATA_DIR)
+if INDICE_CLINICAS and INDICE_CLINICAS['clinicas']:
+    CLINICAS = {c['clinica']: c for c in INDICE_CLINICAS['clinicas']}
+    clinica = st.sidebar.selectbox(
+        "Clínica", list(CLINICAS),
+        format_func=lambda c: c if CLINICAS[c]['situacao'] == 'ok' else f"{c} ({CLINICAS[c]['situacao']})"
+    )
+    info_clinica = CLINICAS[clinica]
+    if info_clinica['situacao'] == 'ok':
+        st.sidebar.caption(f"{info_clinica.get('pacientes', 0):,} pacientes · processada em "
+                           f"{info_clinica['processado_em'].replace('T', ' ')}".replace(",", "."))
+    else:
+        st.sidebar.warning(f"Última execução falhou: {info_clinica.get('erro')}")
+    DATA_DIR = clinic_dir(DATA_DIR, info_clinica['pasta'])
+
 # Caminho correto do arquivo final (versão atualizada do projeto)
-PATH_DATASET_FINAL = os.path.join(BASE_DIR, "data", "pacientes_engajamento_score.csv")
+# O Parquet gerado pelo process-data.py tem prioridade; o CSV é usado se for o único disponível
+PATH_DATASET_FINAL = find_artifact("pacientes_engajamento_score", DATA_DIR) or os.path.join(DATA_DIR, "pacientes_engajamento_score.csv")
+# Resumo pré-calculado pelo process-data.py (KPIs, agregados por cluster, listas de risco, densidade)
+PATH_RESUMO = os.path.join(DATA_DIR, RESUMO)
+# Banco gerado com process-data.py --backend sqlite: páginas e buscas de paciente por consulta indexada
+PATH_BANCO = os.path.join(DATA_DIR, "clinica.db")
+# Índice de pacientes semelhantes (KD-tree sobre o RFM em escala log), gravado pelo pipeline
+PATH_SIMILARES = os.path.join(DATA_DIR, "indice_similares.joblib")
+# Cubo (médico x plano x mês x cluster) com consultas, receita e pacientes distintos
+PATH_CUBO = find_artifact("cubo_consultas", DATA_DIR)
+# Modelos versionados; a avaliação (validação cruzada e importâncias) fica nos metadados da versão
+MODELS_DIR = os.path.join(DATA_DIR, "models")
+
+# Apenas as colunas usadas pelo dashboard são lidas (a idade já vem calculada pelo pipeline)
+COLUNAS_DASHBOARD = [
+    'id_paciente', 'nome', 'idade', 'plano_saude',
+    'recencia_dias', 'valor_monetario', 'frequencia_prevista_reg', 'cluster_rfm',
+]
+
+# Acima deste número de pacientes ativos, o gráfico 1 mostra a densidade agregada (WebGL)
+LIMITE_PONTOS = int(os.environ.get("DASHBOARD_LIMITE_PONTOS", LIMITE_PONTOS_SCATTER))
 
 # Mapeamentos
 CLUSTER_RFM_MAP = {
@@ -23,6 +72,7 @@ CLUSTER_RFM_MAP = {
     0: "RFM 0 - Baixo Valor e Baixa Atividade",
 }
 CLUSTER_MAP_ORDER = sorted(CLUSTER_RFM_MAP.keys())
+CLUSTER_RFM_REVERSE_MAP = {desc: cluster for cluster, desc in CLUSTER_RFM_MAP.items()}
 
 CLUSTER_COLOR_MAP = {
     "RFM 1 - Valor Alto e Ativo": '#1f77b4',  
@@ -32,62 +82,120 @@ CLUSTER_COLOR_MAP = {
     "Inativo / Sem Histórico (R$ 0)": '#cccccc', 
 }
 
-PLANO_MAP = {
-    0: 'Plano Popular (R$ 0)',
-    1: 'Plano Executivo (R$ 100)',
-    2: 'Plano Premium (R$ 500)'
+FEATURE_MAP = {
+    'recencia_dias': 'Recência',
+    'frequencia_consultas': 'Frequência',
+    'valor_monetario': 'Valor Monetário',
 }
-PLANO_REVERSE_MAP = {'Popular': 0, 'Executivo': 1, 'Premium': 2}
 
+# Os caches são indexados pela versão (data de gravação + tamanho) dos arquivos:
+# uma nova execução do pipeline invalida o cache sem reiniciar o app.
 @st.cache_data
-def load_data():
+def load_data(versao):
     if not os.path.exists(PATH_DATASET_FINAL):
         st.error(f" O arquivo final não foi encontrado:\n{PATH_DATASET_FINAL}")
-        return pd.DataFrame(), 0, 0
+        return pd.DataFrame()
     try:
-        df_final = pd.read_csv(PATH_DATASET_FINAL)
+        # Arquivos gerados antes da coluna idade: calcula a partir de data_nascimento
+        sem_idade = 'idade' not in table_columns(PATH_DATASET_FINAL)
+        colunas = [c if c != 'idade' or not sem_idade else 'data_nascimento' for c in COLUNAS_DASHBOARD]
+        df_final = read_table(PATH_DATASET_FINAL, columns=colunas)
     except Exception as e:
-        st.error(f" Erro ao carregar o dataset_final.csv:\n{e}")
-        return pd.DataFrame(), 0, 0
-
-    # Recálculo da idade
-    DATA_HOJE_FIXA = pd.to_datetime("2025-05-20")
-    df_final['data_nascimento'] = pd.to_datetime(df_final['data_nascimento'], errors='coerce')
-    df_final['idade'] = (DATA_HOJE_FIXA - df_final['data_nascimento']).dt.days // 365
+        st.error(f" Erro ao carregar o {os.path.basename(PATH_DATASET_FINAL)}:\n{e}")
+        return pd.DataFrame()
+    if sem_idade:
+        df_final = add_idade(df_final).drop(columns='data_nascimento')
 
-    # Mapeia plano
-    df_final['plano_saude_cod'] = df_final['plano_saude'].map(PLANO_REVERSE_MAP)
-    df_final['plano_desc'] = df_final['plano_saude_cod'].map(PLANO_MAP)
+    # Mapeia cluster (category: cada descrição é guardada uma vez)
+    df_final['cluster_rfm_desc'] = map_categorical(df_final['cluster_rfm'], CLUSTER_RFM_MAP, "Inativo / Não Classificado")
 
-    # Mapeia cluster
-    df_final['cluster_rfm_desc'] = df_final['cluster_rfm'].map(CLUSTER_RFM_MAP).fillna("Inativo / Não Classificado")
+    return df_final
 
-    # KPIs
-    df_ativos = df_final[df_final['valor_monetario'] > 0]
-    avg_recency = df_ativos['recencia_dias'].mean().round(0) if not df_ativos.empty else 0
-    num_pacientes_ativos = len(df_ativos)
 
-    return df_final, avg_recency, num_pacientes_ativos
+@st.cache_data
+def load_resumo(versao_resumo, versao_dados):
+    # Usa o resumo gravado pelo pipeline; se faltar ou for mais antigo que os dados
+    # (pipeline anterior a ele), calcula a partir da tabela completa uma única vez
+    if versao_resumo is not None and os.path.getmtime(PATH_RESUMO) >= os.path.getmtime(PATH_DATASET_FINAL):
+        resumo = load_summary(PATH_RESUMO)
+        if resumo.get('formato') == FORMATO_RESUMO:
+            return resumo
+    df_final = load_data(versao_dados)
+    if df_final.empty:
+        return None
+    return build_summary(df_final)
+
+@st.cache_resource
+def load_risk_index(versao_dados):
+    # Ordenação completa feita uma vez por versão dos dados; cada página depois custa O(k)
+    return RiskIndex(load_data(versao_dados))
+
+@st.cache_resource
+def load_banco(versao_banco):
+    # SQLAlchemy só é importado quando existe o banco (não pesa na partida a frio sem ele)
+    from src.database import get_engine, has_table
+
+    engine = get_engine(PATH_BANCO)
+    return engine if has_table(engine, "scores") else None
+
+
+def banco_atual():
+    # O banco só é usado quando foi gravado depois do arquivo final (mesma execução do pipeline)
+    if not os.path.exists(PATH_BANCO) or os.path.getmtime(PATH_BANCO) < os.path.getmtime(PATH_DATASET_FINAL):
+        return None
+    return load_banco(artifact_version(PATH_BANCO))
+
+@st.cache_resource
+def load_similares(versao_indice):
+    from src.similarity import load_index
+
+    return load_index(DATA_DIR)
+
+
+def similares_atual():
+    # Mesma regra do banco: o índice guarda posições do arquivo final e só vale se for mais recente que ele
+    if not os.path.exists(PATH_SIMILARES) or os.path.getmtime(PATH_SIMILARES) < os.path.getmtime(PATH_DATASET_FINAL):
+        return None
+    return load_similares(artifact_version(PATH_SIMILARES))
 
-# --- ESTRUTURA DO STREAMLIT APP ---
+@st.cache_data
+def load_cubo(versao_cubo):
+    # Poucas dezenas de milhares de linhas: cada filtro dos painéis é uma agregação instantânea
+    return read_table(PATH_CUBO)
 
-df_dados, avg_recency_ativos, num_pacientes_ativos = load_data()
+@st.cache_data
+def load_avaliacao(versao_modelo):
+    metadata = load_model_metadata(MODELS_DIR)
+    return (metadata or {}).get('avaliacao')
 
-st.set_page_config(
-    page_title="Dashboard de Otimização Clínica (ML)",
-    layout="wide"
-)
+# --- ESTRUTURA DO STREAMLIT APP ---
 
-if not df_dados.empty:
+versao_dados = artifact_version(PATH_DATASET_FINAL)
+if versao_dados is None:
+    st.error(f" O arquivo final não foi encontrado:\n{PATH_DATASET_FINAL}")
+    resumo = None
+else:
+    resumo = load_resumo(artifact_version(PATH_RESUMO), versao_dados)
+avaliacao = load_avaliacao(artifact_version(os.path.join(MODELS_DIR, "LATEST")))
+if avaliacao:
+    importancias = sorted(avaliacao['importancia_permutacao'].items(), key=lambda item: -item[1]['percentual'])
+    principal, principal_pct = FEATURE_MAP.get(importancias[0][0], importancias[0][0]), importancias[0][1]['percentual']
+    texto_importancia = (f"A variável **{principal}** responde por **{principal_pct:.1%}** da importância por permutação "
+                         f"(validação cruzada) desta previsão.")
+else:
+    texto_importancia = "A importância de cada variável é calculada a cada treino (rode o process-data.py)."
+
+if resumo is not None:
+    kpis = resumo['kpis']
     st.title("Dashboard de Otimização de Engajamento Clínico")
     st.subheader("Análise de Clusters e Previsão de Frequência")
-    st.markdown("""
+    st.markdown(f"""
     Este dashboard é uma **solução de intervenção de risco** que utiliza Machine Learning (não-supervisionado e regressão) para ajudar a clínica a priorizar quais pacientes precisam de contato imediato.
     O principal objetivo é **transformar a inatividade (Recência) em receita acionável**.
 
     **Como funciona a análise:**
     1. **Segmentação (K-Means RFM):** Os pacientes são agrupados em perfis com base na Recência (dias sem consulta), Frequência (média de consultas por ano) e Valor Monetário.
-    2. **Previsão:** Um modelo de Regressão cria um **Score de Engajamento** (Consultas/Ano Previstas). A variável **Recência** foi identificada com **98.5% de importância** para esta previsão.
+    2. **Previsão:** Um modelo de Regressão cria um **Score de Engajamento** (Consultas/Ano Previstas). {texto_importancia}
     3. **Ação:** Os gráficos e a tabela final combinam esses insights para mostrar quem está sumido e quem tem o maior valor potencial de ser perdido.
     """)
     # --- FIM DA DESCRIÇÃO LONGA ---
@@ -96,28 +204,28 @@ if not df_dados.empty:
     col1, col2, col3 = st.columns(3)
     col1.metric(
         label="Pacientes Ativos (com consultas)",
-        value=f"{num_pacientes_ativos:,}".replace(",", "."),
-        delta=f"Total na Base: {len(df_dados):,}".replace(",", "."),
+        value=f"{kpis['pacientes_ativos']:,}".replace(",", "."),
+        delta=f"Total na Base: {kpis['pacientes']:,}".replace(",", "."),
         delta_color="off"
     )
     col2.metric(
         label="Recência Média de ATIVOS (Dias)",
-        value=f"{avg_recency_ativos:.0f} dias",
+        value=f"{kpis['recencia_media_ativos']:.0f} dias",
         delta_color="off",
         help="Média de dias desde a última consulta, considerando apenas pacientes que já realizaram consultas (Valor Total > R$0)."
     )
     col3.metric(
         label="Score Médio de Engajamento Previsto",
-        value=f"{df_dados['frequencia_prevista_reg'].mean():.2f} consultas/ano",
+        value=f"{kpis['score_medio']:.2f} consultas/ano",
         delta_color="off",
         help="Frequência anual média de consultas prevista pelo modelo de Regressão."
     )
     st.divider()
 
-    # --- FILTRAGEM DE DADOS PARA O GRÁFICO (Ativos + Sem Histórico) ---
-    df_ativos_grafico = df_dados[df_dados['cluster_rfm'] != -1].copy()
-
     # 2. Gráfico Principal (Dispersão: Recência vs. Monetário com Cluster RFM)
+    # Plotly só é importado aqui: título e KPIs já aparecem antes desse custo na partida a frio
+    import plotly.express as px
+
     st.header("1. Risco de Evasão por Cluster")
     st.markdown(
     """
@@ -131,22 +239,85 @@ if not df_dados.empty:
 )
 
 
-    # Criando o gráfico interativo com Plotly: Cor pelo NOVO Cluster RFM
-    fig = px.scatter(
-        df_ativos_grafico,
-        x='recencia_dias',
-        y='valor_monetario',
-        color='cluster_rfm_desc',
-        color_discrete_map=CLUSTER_COLOR_MAP,
-        log_y=True,
-        size='frequencia_prevista_reg',
-        hover_data=['nome', 'idade', 'plano_saude', 'frequencia_prevista_reg', 'cluster_rfm_desc'],
-        # Adicionando cluster_rfm_desc no hover
-        title='Recência vs. Valor Monetário por Cluster'
-    )
+    max_recency_ativa = kpis['max_recencia']
+    range_valor_log = list(np.log10(FAIXA_VALOR))
+    hover_paciente = ['nome', 'idade', 'plano_saude', 'frequencia_prevista_reg', 'cluster_rfm_desc']
+    eixo_x, eixo_y = [0, max_recency_ativa + 10], range_valor_log
+
+    if kpis['pacientes_classificados'] <= LIMITE_PONTOS:
+        # --- FILTRAGEM DE DADOS PARA O GRÁFICO (Ativos + Sem Histórico) ---
+        df_dados = load_data(versao_dados)
+        df_ativos_grafico = df_dados[df_dados['cluster_rfm'] != -1]
+
+        # Criando o gráfico interativo com Plotly: Cor pelo NOVO Cluster RFM
+        fig = px.scatter(
+            df_ativos_grafico,
+            x='recencia_dias',
+            y='valor_monetario',
+            color='cluster_rfm_desc',
+            color_discrete_map=CLUSTER_COLOR_MAP,
+            log_y=True,
+            size='frequencia_prevista_reg',
+            hover_data=hover_paciente,
+            # Adicionando cluster_rfm_desc no hover
+            title='Recência vs. Valor Monetário por Cluster'
+        )
+        fig.update_traces(marker=dict(size=10, opacity=0.8, line=dict(width=1, color='DarkSlateGrey')))
+    else:
+        # Base grande: um marcador por paciente deixaria o payload com megabytes.
+        # Densidade: uma célula (recência x valor) por cluster, desenhada em WebGL.
+        # Região: os pacientes de um recorte, com detalhes no hover (amostra limitada).
+        modo_grafico = st.radio(
+            "Visualização",
+            ["Densidade (todos os pacientes)", "Região com detalhes (amostra)"],
+            horizontal=True,
+            help=f"Com mais de {LIMITE_PONTOS:,} pacientes ativos, o gráfico mostra a densidade agregada. "
+                 "Escolha uma região para ver os pacientes individualmente.".replace(",", ".")
+        )
+        if modo_grafico.startswith("Densidade"):
+            # Grade pré-calculada pelo pipeline (tamanho fixo, qualquer que seja a base)
+            df_grade = pd.DataFrame(resumo['grade'])
+            df_grade['cluster_rfm_desc'] = df_grade['cluster_rfm'].map(CLUSTER_RFM_MAP).fillna("Inativo / Não Classificado")
+            fig = px.scatter(
+                df_grade,
+                x='recencia_dias',
+                y='valor_monetario',
+                color='cluster_rfm_desc',
+                color_discrete_map=CLUSTER_COLOR_MAP,
+                log_y=True,
+                size='pacientes',
+                size_max=30,
+                render_mode='webgl',
+                hover_data={'pacientes': ':,', 'frequencia_prevista_reg': ':.2f',
+                            'x_min': ':.0f', 'x_max': ':.0f', 'y_min': ':.0f', 'y_max': ':.0f'},
+                title=f"Recência vs. Valor Monetário por Cluster (densidade de {kpis['pacientes_classificados']:,} pacientes)".replace(",", ".")
+            )
+            fig.update_traces(marker=dict(opacity=0.7, line=dict(width=0)))
+        else:
+            # Só este modo precisa da tabela completa (carregada uma vez por versão dos dados)
+            df_dados = load_data(versao_dados)
+            max_valor = int(df_dados['valor_monetario'].max())
+            col_x, col_y = st.columns(2)
+            range_x = col_x.slider("Recência (dias)", 0, int(max_recency_ativa), (0, int(max_recency_ativa)))
+            range_y = col_y.slider("Valor Total Gasto (R$)", 0, max_valor, (0, max_valor))
+            df_regiao = sample_region(df_dados[df_dados['cluster_rfm'] != -1], 'recencia_dias', 'valor_monetario',
+                                      range_x, range_y)
+            fig = px.scatter(
+                df_regiao,
+                x='recencia_dias',
+                y='valor_monetario',
+                color='cluster_rfm_desc',
+                color_discrete_map=CLUSTER_COLOR_MAP,
+                log_y=True,
+                render_mode='webgl',
+                hover_data=hover_paciente,
+                title=f'Recência vs. Valor Monetário por Cluster ({len(df_regiao):,} pacientes da região)'.replace(",", ".")
+            )
+            fig.update_traces(marker=dict(size=7, opacity=0.8))
+            eixo_x = [range_x[0], range_x[1] + 1]
+            eixo_y = [np.log10(max(range_y[0], 50)), np.log10(max(range_y[1], 50) * 1.1)]
 
     # --- AJUSTES FINAIS DE LAYOUT ---
-    max_recency_ativa = df_ativos_grafico['recencia_dias'].max() if not df_ativos_grafico.empty else 400
     fig.update_layout(
         xaxis_title="Recência (dias desde a última consulta)",
         yaxis_title="Valor Total Gasto (R$)",
@@ -154,9 +325,8 @@ if not df_dados.empty:
         height=450,
         margin=dict(t=50, b=0, l=0, r=0)
     )
-    fig.update_xaxes(range=[0, max_recency_ativa + 10])
-    fig.update_yaxes(range=[np.log10(50), np.log10(6000)])
-    fig.update_traces(marker=dict(size=10, opacity=0.8, line=dict(width=1, color='DarkSlateGrey')))
+    fig.update_xaxes(range=eixo_x)
+    fig.update_yaxes(range=eixo_y)
 
     st.plotly_chart(fig, use_container_width=True)
 
@@ -175,14 +345,28 @@ if not df_dados.empty:
     - **Frequência histórica**: consistência e padrão de uso ao longo do tempo.
 
     Assim, mesmo com scores de engajamento quase idênticos, os clusters podem ter **riscos e prioridades muito diferentes**, pois o risco de churn deriva do conjunto das variáveis RFM e não de um único indicador.
-
-    O modelo de regressão apresentou um **R² em torno de 47%**.
     """
 )
+    if avaliacao:
+        st.markdown(
+            f"O modelo de regressão apresentou **R² de {avaliacao['r2_medio']:.3f} ± {avaliacao['r2_desvio']:.3f}** "
+            f"(MAE {avaliacao['mae_medio']:.2f}) em validação cruzada com {avaliacao['folds']} folds "
+            f"sobre {avaliacao['linhas']:,} pacientes. Importância por permutação: ".replace(",", ".")
+            + " · ".join(f"{FEATURE_MAP.get(f, f)} {v['percentual']:.1%}" for f, v in importancias) + "."
+        )
+        if avaliacao.get('alvo_nas_features'):
+            st.warning(
+                f"A variável prevista ({FEATURE_MAP.get(avaliacao['alvo'], avaliacao['alvo'])}) também é entrada do modelo: "
+                "o R² alto reflete isso, não uma previsão do engajamento futuro."
+            )
+    else:
+        st.caption("Métricas do modelo indisponíveis: rode o process-data.py para treinar e avaliar.")
 
 
-    # Calculando o Score Médio por Cluster (excluindo Inativos -1)
-    df_cluster_score = df_dados[df_dados['cluster_rfm'] != -1].groupby('cluster_rfm_desc')['frequencia_prevista_reg'].mean().reset_index()
+    # Score Médio por Cluster (excluindo Inativos -1), já agregado no resumo
+    df_cluster_score = pd.DataFrame(resumo['clusters'])
+    df_cluster_score['cluster_rfm_desc'] = df_cluster_score['cluster_rfm'].map(CLUSTER_RFM_MAP).fillna("Inativo / Não Classificado")
+    df_cluster_score = df_cluster_score[['cluster_rfm_desc', 'score_medio']]
     df_cluster_score.columns = ['Perfil RFM', 'Score Médio Previsto (Consultas/Ano)']
     df_cluster_score = df_cluster_score.sort_values(by='Score Médio Previsto (Consultas/Ano)', ascending=False)
 
@@ -206,7 +390,7 @@ if not df_dados.empty:
     st.divider()  # Adiciona um divisor após a seção 1 completa
 
     # 3. Análise Acionável: Tabela de Pacientes Críticos
-    st.header("3. Top 10 Pacientes com Maior Inatividade e Maior Valor Histórico")
+    st.header("3. Pacientes com Maior Inatividade e Maior Valor Histórico")
     st.markdown("""
 Esta lista apresenta os pacientes ordenados pela combinação de:
 
@@ -220,22 +404,42 @@ O objetivo é facilitar análises operacionais dentro de cada Perfil RFM.
     # Filtro de Seleção do NOVO Cluster
     selected_cluster_rfm = st.selectbox(
         "Selecione um Perfil RFM para Análise Detalhada:",
-        options=["Todos os Perfis"] + [CLUSTER_RFM_MAP[k] for k in CLUSTER_MAP_ORDER],
+        # O RiskIndex deixa de fora os pacientes sem classificação (cluster -1)
+        options=["Todos os Perfis"] + [CLUSTER_RFM_MAP[k] for k in CLUSTER_MAP_ORDER if k != -1],
         format_func=lambda x: x if x != "Todos os Perfis" else x,
         help="Use os Novos Clusters RFM para focar em grupos com comportamento transacional específico."
     )
 
+    # Pacientes que sumiram (Alta Recência) e eram valiosos (Monetário), excluindo pacientes
+    # com recência muito alta que ainda não consultaram (cluster -1)
     if selected_cluster_rfm != "Todos os Perfis":
-        df_filtered = df_dados[df_dados['cluster_rfm_desc'] == selected_cluster_rfm]
+        chave_risco = str(CLUSTER_RFM_REVERSE_MAP[selected_cluster_rfm])
+        total_risco = next((c['pacientes'] for c in resumo['clusters'] if str(c['cluster_rfm']) == chave_risco), 0)
     else:
-        df_filtered = df_dados.copy()
-
-    # Filtra e Ranqueia: Pacientes que sumiram (Alta Recência) e eram valiosos (Monetário)
-    # Excluindo pacientes com recência muito alta que ainda não consultaram (cluster -1)
-    df_risco = df_filtered[df_filtered['cluster_rfm'] != -1].sort_values(
-        by=['recencia_dias', 'valor_monetario'],
-        ascending=[False, False]
-    ).head(10)  # <--- CORRIGIDO: Agora exibe os 10 mais críticos
+        chave_risco = "todos"
+        total_risco = kpis['pacientes_classificados']
+
+    col_k, col_pagina, col_total = st.columns([1, 1, 2])
+    k_risco = col_k.selectbox("Pacientes por página", [10, 25, 50, 100], index=0)
+    n_paginas = max(1, -(-total_risco // k_risco))
+    pagina = col_pagina.number_input("Página", min_value=1, max_value=n_paginas, value=1, step=1) - 1
+    col_total.caption(f"{total_risco:,} pacientes no perfil · página {pagina + 1} de {n_paginas:,}".replace(",", "."))
+
+    # As primeiras posições já vêm ordenadas no resumo; além delas, usa o banco (consulta pelo
+    # índice de risco) quando existir ou o índice pré-ordenado em memória
+    banco = banco_atual()
+    if (pagina + 1) * k_risco <= resumo['top_n']:
+        df_risco = pd.DataFrame(resumo['top_risco'].get(chave_risco, []), columns=COLUNAS_RISCO)
+        df_risco = df_risco.iloc[pagina * k_risco:(pagina + 1) * k_risco].copy()
+    elif banco is not None:
+        from src.database import risk_page
+
+        cluster_risco = None if chave_risco == "todos" else int(chave_risco)
+        df_risco = risk_page(banco, COLUNAS_RISCO, cluster_risco, pagina, k_risco)
+    else:
+        df_risco = load_risk_index(versao_dados).page(chave_risco, pagina, k_risco)[COLUNAS_RISCO].copy()
+    df_risco.index = pd.RangeIndex(pagina * k_risco + 1, pagina * k_risco + 1 + len(df_risco), name="Posição")
+    df_risco['cluster_rfm_desc'] = df_risco['cluster_rfm'].map(CLUSTER_RFM_MAP)
 
     df_display = df_risco[['id_paciente', 'nome', 'cluster_rfm_desc', 'idade', 'plano_saude', 'recencia_dias', 'valor_monetario', 'frequencia_prevista_reg']].copy()
     df_display.columns = [
@@ -249,14 +453,99 @@ O objetivo é facilitar análises operacionais dentro de cada Perfil RFM.
 
     st.dataframe(df_display, use_container_width=True)
 
-    # 4. Conclusão para Aula
+    if banco is not None:
+        from src.database import get_patient
+
+        id_busca = st.number_input("Buscar paciente por ID", min_value=0, value=None, step=1,
+                                   help="Consulta direta na tabela de scores do banco (data/clinica.db).")
+        if id_busca is not None:
+            df_paciente = get_patient(banco, id_busca, COLUNAS_RISCO)
+            if df_paciente.empty:
+                st.warning(f"Paciente {id_busca} não encontrado (sem consultas ou inexistente).")
+            else:
+                df_paciente['cluster_rfm'] = df_paciente['cluster_rfm'].map(CLUSTER_RFM_MAP)
+                st.dataframe(df_paciente, use_container_width=True, hide_index=True)
+
+    # Pacientes semelhantes: vizinhos mais próximos no RFM (campanhas de retenção por semelhança)
+    indice_similares = similares_atual()
+    if indice_similares is not None:
+        st.subheader("Pacientes Semelhantes")
+        col_id, col_k_similares = st.columns([3, 1])
+        id_referencia = col_id.number_input(
+            "ID do paciente de referência", min_value=0, value=None, step=1,
+            help="Pacientes com Recência, Frequência e Valor Monetário mais próximos (escala log, padronizada)."
+        )
+        k_similares = col_k_similares.selectbox("Quantidade", [5, 10, 25, 50], index=1)
+        if id_referencia is not None:
+            similares = indice_similares.similar(int(id_referencia), k_similares)
+            if similares is None:
+                st.warning(f"Paciente {id_referencia} fora do índice (sem consultas, não classificado ou inexistente).")
+            else:
+                _, posicoes, distancias = similares
+                df_similares = load_data(versao_dados).iloc[posicoes][COLUNAS_RISCO].copy()
+                df_similares['cluster_rfm'] = df_similares['cluster_rfm'].map(CLUSTER_RFM_MAP)
+                df_similares['distancia'] = distancias.round(3)
+                st.dataframe(df_similares, use_container_width=True, hide_index=True)
+
+    # 4. Especialidades e médicos, a partir do cubo pré-agregado (sem ler as consultas)
+    if PATH_CUBO is not None:
+        st.divider()
+        st.header("4. Receita por Especialidade e Carga dos Médicos")
+        cubo = load_cubo(artifact_version(PATH_CUBO))
+        if os.path.getmtime(PATH_CUBO) < os.path.getmtime(PATH_DATASET_FINAL):
+            st.caption("Cubo da última execução completa do pipeline: atualizações incrementais ainda não entram nele.")
+        if cubo.empty:
+            st.info("O cubo de consultas está vazio: rode o process-data.py com consultas para ver esta seção.")
+        else:
+            meses = sorted(cubo['mes'].unique())
+            col_meses, col_planos, col_perfis = st.columns([2, 1, 1])
+            mes_inicio, mes_fim = col_meses.select_slider(
+                "Período (mês da consulta)", options=meses, value=(meses[0], meses[-1]),
+                format_func=lambda m: pd.Timestamp(m).strftime("%m/%Y")
+            ) if len(meses) > 1 else (meses[0], meses[0])
+            planos = col_planos.multiselect("Planos", list(cubo['plano_saude'].cat.categories),
+                                            default=list(cubo['plano_saude'].cat.categories))
+            perfis = col_perfis.multiselect("Perfis RFM", [CLUSTER_RFM_MAP[k] for k in CLUSTER_MAP_ORDER],
+                                            default=[CLUSTER_RFM_MAP[k] for k in CLUSTER_MAP_ORDER])
+
+            filtro = (cubo['mes'] >= mes_inicio) & (cubo['mes'] <= mes_fim) & cubo['plano_saude'].isin(planos) \
+                & cubo['cluster_rfm'].isin([CLUSTER_RFM_REVERSE_MAP[p] for p in perfis])
+            df_cubo = cubo[filtro]
+
+            df_especialidade = df_cubo.groupby('especialidade', observed=True).agg(
+                receita=('receita', 'sum'), consultas=('consultas', 'sum')
+            ).reset_index().sort_values('receita', ascending=False)
+            fig_especialidade = px.bar(
+                df_especialidade, x='especialidade', y='receita', text='receita',
+                hover_data={'consultas': ':,'},
+                labels={'especialidade': 'Especialidade', 'receita': 'Receita (R$)', 'consultas': 'Consultas'},
+                title='Receita por Especialidade'
+            )
+            fig_especialidade.update_traces(texttemplate='R$ %{text:,.0f}', textposition='outside')
+            fig_especialidade.update_layout(height=400, margin=dict(t=50, b=0, l=0, r=0))
+            st.plotly_chart(fig_especialidade, use_container_width=True)
+
+            # Plano e cluster são do paciente: os distintos somam entre eles, mas não entre meses
+            um_mes = mes_inicio == mes_fim
+            coluna_pacientes = 'Pacientes Distintos' if um_mes else 'Pacientes-Mês'
+            df_medicos = df_cubo.groupby(['id_medico', 'especialidade'], observed=True).agg(
+                consultas=('consultas', 'sum'), receita=('receita', 'sum'), pacientes=('pacientes', 'sum')
+            ).reset_index().sort_values(['consultas', 'receita'], ascending=False).head(20)
+            df_medicos.columns = ['ID Médico', 'Especialidade', 'Consultas', 'Receita (R$)', coluna_pacientes]
+            df_medicos['Receita (R$)'] = df_medicos['Receita (R$)'].map('R$ {:,.2f}'.format)
+            st.markdown("**Médicos com maior carga no período**")
+            st.dataframe(df_medicos, use_container_width=True, hide_index=True)
+            if not um_mes:
+                st.caption("Pacientes-Mês: soma dos pacientes distintos de cada mês (um paciente atendido em dois meses conta duas vezes).")
+
+    # 5. Conclusão para Aula
     st.markdown("---")
     st.info(
-        """
+        f"""
         O projeto busca resolver o problema de evasão (Churn) de pacientes, transformando grandes volumes de dados brutos em uma estratégia de intervenção clara e priorizada.
 
         **Principais entregas para a tomada de decisão:**
-        1. **Fator de Risco:** O modelo de **Regressão (Random Forest)** confirmou que a **Recência** (tempo sem consulta) é o fator mais importante, contribuindo com **98.5%** para a previsão de engajamento futuro.
+        1. **Fator de Risco:** O modelo de **Regressão (Random Forest)** é avaliado a cada treino. {texto_importancia}
         2. **Clusterização:** O modelo **K-Means** criou perfis baseados na matriz **RFM: Recência, Frequência e Valor Monetário**.
            * Ação prática: Direcionar campanhas específicas para cada grupo, priorizando clientes com alta Recência e alto Valor Monetário com ofertas personalizadas.
         3. **Top 10**: A lista de pacientes da seção 3 prioriza os pacientes com a maior Recência.
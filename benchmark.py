@@ -0,0 +1,185 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+from src.batch_scoring import score_batch
+from src.generators import NUM_CONSULTAS, NUM_MEDICOS, NUM_PACIENTES, SEED, generate_all
+from src.profiling import RunReport, format_stage
+from src.rfm import REF_DATE, load_state
+from src.scripts import load_process_data
+
+# Benchmark de ponta a ponta em clínicas sintéticas de tamanho 1x, 10x, 100x...
+# (1x = 47.295 pacientes, 500 médicos e 97.083 consultas, a base padrão do generate-df.py).
+# Cada etapa é medida (tempo de parede, CPU, pico de RSS, linhas) e o resultado é comparado
+# com uma baseline gravada: etapas mais lentas ou mais pesadas que a tolerância são
+# listadas como regressão e o script termina com código 1.
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(PROJECT_ROOT, "benchmarks", "baseline.json")
+RESULTADO = os.path.join(PROJECT_ROOT, "data", "benchmark", "resultado.json")
+# Data fixa da geração: a mesma escala gera sempre a mesma base
+HOJE = REF_DATE
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Mede geração, pipeline, pontuação e dashboard em várias escalas.")
+    parser.add_argument("--escalas", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--saida", default=RESULTADO, help="JSON com o resultado desta execução.")
+    parser.add_argument("--baseline", default=BASELINE, help="JSON de referência para a comparação.")
+    parser.add_argument("--salvar-baseline", action="store_true", help="Grava este resultado como nova baseline.")
+    parser.add_argument("--tolerancia", type=float, default=0.25,
+                        help="Aumento relativo (tempo ou pico de memória) a partir do qual a etapa é regressão.")
+    parser.add_argument("--min-segundos", type=float, default=0.2,
+                        help="Diferenças de tempo menores que isto não contam como regressão (ruído).")
+    parser.add_argument("--min-mb", type=float, default=50,
+                        help="Diferenças de pico de memória menores que isto não contam como regressão.")
+    parser.add_argument("--escala-streaming", type=int, default=100,
+                        help="A partir desta escala o pipeline lê as consultas em blocos (--chunksize do process-data).")
+    parser.add_argument("--chunksize", type=int, default=1_000_000)
+    parser.add_argument("--faker", action="store_true",
+                        help="Gera pacientes e médicos com o Faker linha a linha (modo padrão do generate-df.py). "
+                             "Sem isso, usa o modo --pool, viável em 100x.")
+    parser.add_argument("--sem-dashboard", action="store_true", help="Não mede o app.py (dispensa o Streamlit).")
+    parser.add_argument("--work-dir", default=None, help="Pasta para as bases geradas (padrão: temporária).")
+    parser.add_argument("--manter-dados", action="store_true")
+    return parser.parse_args()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_generation(report, data_dir, escala, pool):
+    generate_all(data_dir, NUM_PACIENTES * escala, NUM_MEDICOS * escala, NUM_CONSULTAS * escala, seed=SEED,
+                 hoje=HOJE, pool=pool, report=report)
+
+
+def run_pipeline(report, data_dir, process_data, chunksize=None):
+    # O modo completo do process-data.py, com as etapas dele medidas neste relatório
+    argv = ["--data-dir", data_dir, "--ref-date", REF_DATE] + (["--chunksize", str(chunksize)] if chunksize else [])
+    models_dir = os.path.join(data_dir, "models")
+    with contextlib.redirect_stdout(io.StringIO()):
+        process_data.run_full(process_data.parse_args(argv), data_dir, models_dir, report)
+    return models_dir
+
+
+def run_scoring(report, data_dir, process_data, models_dir):
+    acumulador, ref_date = load_state(os.path.join(data_dir, process_data.ESTADO_RFM))
+    rfm = acumulador.to_frame(ref_date)
+    with report.stage("pontuar_lote", linhas_entrada=len(rfm)) as etapa:
+        _, linhas = score_batch(rfm, "scores_batch", data_dir, models_dir)
+        etapa.linhas_saida = linhas
+
+
+def run_dashboard(report, data_dir):
+    from streamlit.testing.v1 import AppTest
+
+    os.environ["DASHBOARD_DATA_DIR"] = data_dir
+    app = AppTest.from_file(os.path.join(PROJECT_ROOT, "app.py"), default_timeout=600)
+    with report.stage("dashboard_primeira_execucao"):
+        app.run()
+    if app.exception:
+        raise RuntimeError(f" O app falhou:\n{app.exception[0].value}")
+    if len(app.radio):
+        # Base grande: a visão de região é a única que carrega a tabela completa
+        with report.stage("dashboard_regiao"):
+            app.radio[0].set_value(app.radio[0].options[1]).run()
+
+
+def run_scale(escala, work_dir, args, process_data):
+    data_dir = os.path.join(work_dir, f"{escala}x")
+    os.makedirs(data_dir, exist_ok=True)
+    chunksize = args.chunksize if escala >= args.escala_streaming else None
+    report = RunReport(escala=escala, chunksize=chunksize, pool=not args.faker)
+
+    run_generation(report, data_dir, escala, pool=not args.faker)
+    models_dir = run_pipeline(report, data_dir, process_data, chunksize)
+    run_scoring(report, data_dir, process_data, models_dir)
+    if not args.sem_dashboard:
+        run_dashboard(report, data_dir)
+
+    if not args.manter_dados:
+        shutil.rmtree(data_dir)
+    return report.to_dict()
+
+
+def compare(resultado, baseline, tolerancia, min_segundos, min_mb):
+    regressoes = []
+    print(f"\n--- Comparação com a baseline ({baseline.get('commit')}, {baseline.get('data')}) ---")
+    for escala, atual in resultado["escalas"].items():
+        if escala not in baseline.get("escalas", {}):
+            print(f" {escala:>4}x sem referência na baseline (grave uma com --salvar-baseline)")
+            continue
+        referencia = {e["etapa"]: e for e in baseline["escalas"][escala]["etapas"]}
+        for etapa in atual["etapas"]:
+            ref = referencia.get(etapa["etapa"])
+            if ref is None:
+                continue
+            delta_t = etapa["parede_s"] - ref["parede_s"]
+            delta_m = etapa["pico_rss_mb"] - ref["pico_rss_mb"]
+            lento = delta_t > min_segundos and etapa["parede_s"] > ref["parede_s"] * (1 + tolerancia)
+            pesado = delta_m > min_mb and etapa["pico_rss_mb"] > ref["pico_rss_mb"] * (1 + tolerancia)
+            marca = "  << REGRESSÃO" if lento or pesado else ""
+            print(f" {escala:>4}x {etapa['etapa']:<30} {ref['parede_s']:8.2f}s -> {etapa['parede_s']:8.2f}s"
+                  f" | {ref['pico_rss_mb']:7.0f} MB -> {etapa['pico_rss_mb']:7.0f} MB{marca}")
+            if marca:
+                regressoes.append({"escala": int(escala), "etapa": etapa["etapa"],
+                                   "parede_s": [ref["parede_s"], etapa["parede_s"]],
+                                   "pico_rss_mb": [ref["pico_rss_mb"], etapa["pico_rss_mb"]]})
+    if baseline.get("maquina") != resultado["maquina"]:
+        print(" Atenção: a baseline foi medida em outra máquina/ambiente; compare com cautela.")
+    return regressoes
+
+
+def main():
+    args = parse_args()
+    process_data = load_process_data()
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="benchmark-")
+
+    resultado = {"data": datetime.now().isoformat(timespec="seconds"), "commit": git_commit(),
+                 "maquina": None, "escalas": {}}
+    try:
+        for escala in args.escalas:
+            print(f"\n Escala {escala}x ({NUM_PACIENTES * escala:,} pacientes, {NUM_CONSULTAS * escala:,} consultas)...")
+            dados = run_scale(escala, work_dir, args, process_data)
+            resultado["maquina"] = dados.pop("maquina")
+            resultado["escalas"][str(escala)] = dados
+            for etapa in dados["etapas"]:
+                print(format_stage(etapa))
+    finally:
+        if not args.work_dir and not args.manter_dados:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    regressoes = []
+    if os.path.exists(args.baseline) and not args.salvar_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressoes = compare(resultado, baseline, args.tolerancia, args.min_segundos, args.min_mb)
+        resultado["comparacao"] = {"baseline": os.path.relpath(args.baseline, PROJECT_ROOT),
+                                   "tolerancia": args.tolerancia, "regressoes": regressoes}
+
+    destinos = [args.saida] + ([args.baseline] if args.salvar_baseline else [])
+    for path in destinos:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+        print("\n" + path)
+
+    if regressoes:
+        print(f"\n {len(regressoes)} regressão(ões) acima de {args.tolerancia:.0%}.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
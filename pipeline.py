@@ -0,0 +1,247 @@
+import argparse
+import json
+import os
+from datetime import date
+
+import joblib
+
+from src.artifacts import find_artifact, iter_table, load_table, save_table
+from src.dag import Etapa, Pipeline
+from src.dashboard import RESUMO
+from src.dataset import CHUNKSIZE_CUBO, CUBO, DIM_MEDICOS, DIM_PACIENTES, FATO, build_cube
+from src.generators import NUM_CONSULTAS, NUM_MEDICOS, NUM_PACIENTES, SEED, generate_all
+from src.models import (
+    AMOSTRA_AVALIACAO, CLUSTER_ENGINES, CV_FOLDS, FEATURES, REPETICOES_IMPORTANCIA, evaluate_model, save_models,
+    score_rfm,
+)
+from src.profiling import RunReport, format_stage
+from src.rfm import REF_DATE, RFMAccumulator, save_state
+from src.scripts import load_process_data
+from src.similarity import INDICE
+
+# Geração -> dataset_final -> RFM -> clusters / treino -> pontuação -> exportação como etapas
+# com entradas e saídas declaradas (src/dag.py). Só roda o que mudou: mudar o K, por exemplo,
+# refaz clusters, pontuação, cubo e exportação, mas não a geração, o RFM, o treino nem a avaliação.
+# As etapas chamam as mesmas funções do process-data.py (leitura, dataset_final, clusterização,
+# treino e arquivo final); o backend sqlite só existe no process-data.py.
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(PROJECT_ROOT, "data")
+
+# Artefatos intermediários (modelos e scores antes da junção com os pacientes)
+PASTA_ETAPAS = "pipeline"
+RELATORIO = "relatorio_execucao.json"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Roda o pipeline completo pulando as etapas cujas entradas, "
+                                                 "parâmetros e código não mudaram.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--sem-gerar", action="store_true",
+                        help="Usa os dados_* já existentes em --data-dir como entrada (não gera a base sintética).")
+    parser.add_argument("--num-pacientes", type=int, default=NUM_PACIENTES)
+    parser.add_argument("--num-medicos", type=int, default=NUM_MEDICOS)
+    parser.add_argument("--num-consultas", type=int, default=NUM_CONSULTAS)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--hoje", default=None,
+                        help="Data de referência da geração (padrão: hoje, então a base muda de um dia para o outro).")
+    parser.add_argument("--pool", action="store_true", help="Geração por amostragem vetorizada (ver generate-df.py).")
+    parser.add_argument("--ref-date", default=REF_DATE)
+    parser.add_argument("--dataset-final", choices=["explodido", "estrela"], default="explodido",
+                        help="Formato do dataset_final (ver process-data.py).")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="Lê as consultas em blocos deste tamanho no dataset_final, no RFM e no cubo.")
+    parser.add_argument("--csv", action="store_true",
+                        help="Exporta também dataset_final.csv e pacientes_engajamento_score.csv.")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--cluster-engine", choices=CLUSTER_ENGINES, default="kmeans")
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--cv-folds", type=int, default=CV_FOLDS)
+    parser.add_argument("--amostra-avaliacao", type=int, default=AMOSTRA_AVALIACAO)
+    parser.add_argument("--ate", nargs="+", default=None, metavar="ETAPA",
+                        help="Roda só o necessário para estas etapas (padrão: todas).")
+    parser.add_argument("--forcar", nargs="+", default=[], metavar="ETAPA",
+                        help="Executa estas etapas mesmo com a chave em cache.")
+    parser.add_argument("--simular", action="store_true", help="Só mostra o que seria executado.")
+    parser.add_argument("--relatorio", default=None,
+                        help=f"JSON com tempo e memória das etapas executadas (padrão: <data-dir>/{RELATORIO}).")
+    return parser.parse_args()
+
+
+# --- ETAPAS ---
+def gerar(data_dir, num_pacientes, num_medicos, num_consultas, seed, hoje, pool):
+    generate_all(data_dir, num_pacientes, num_medicos, num_consultas, seed=seed, hoje=hoje, pool=pool)
+
+
+def integrar(data_dir, dataset_final, csv, chunksize, report):
+    processo = load_process_data()
+    args = processo.parse_args(["--data-dir", data_dir, "--dataset-final", dataset_final] + (["--csv"] if csv else []))
+    if chunksize:
+        df_pacientes = load_table("dados_pacientes", data_dir)
+        df_medicos = load_table("dados_medicos", data_dir)
+        with report.stage("dataset_final_em_blocos"):
+            processo.process_consultas_in_chunks(data_dir, df_pacientes, df_medicos, chunksize, args.formato,
+                                                 csv=csv, estrela=dataset_final == "estrela")
+    else:
+        with report.stage("carregar") as etapa:
+            df_pacientes, df_consultas, df_medicos = processo.load_inputs(data_dir)
+            etapa.linhas_saida = len(df_pacientes) + len(df_consultas) + len(df_medicos)
+        processo.save_dataset_final(df_pacientes, df_consultas, df_medicos, data_dir, args, report=report)
+
+
+def calcular_rfm(data_dir, ref_date, chunksize, report):
+    colunas = ["id_paciente", "data_consulta", "valor_consulta"]
+    with report.stage("rfm") as etapa:
+        acumulador = RFMAccumulator()
+        if chunksize:
+            for chunk in iter_table(find_artifact("dados_consultas", data_dir), chunksize, columns=colunas):
+                acumulador.update_frame(chunk)
+        else:
+            acumulador.update_frame(load_table("dados_consultas", data_dir, columns=colunas))
+        rfm = acumulador.to_frame(ref_date)
+        etapa.linhas_saida = len(rfm)
+    save_state(acumulador, os.path.join(data_dir, "rfm_estado.parquet"), ref_date)
+    save_table(rfm, "rfm", data_dir)
+
+
+def clusterizar(data_dir, k, cluster_engine, report):
+    # Sem alinhar aos centróides de models/LATEST (o process-data.py alinha): o LATEST é saída do
+    # exportar, e lê-lo aqui faria a etapa depender da própria saída. Os ids saem só do rfm e do K.
+    _, kmeans = load_process_data().cluster_rfm(load_table("rfm", data_dir), cluster_engine, k=k, report=report)
+    joblib.dump(kmeans, os.path.join(data_dir, PASTA_ETAPAS, "kmeans.joblib"))
+
+
+def treinar(data_dir, n_jobs, report):
+    _, model = load_process_data().train_engagement(load_table("rfm", data_dir), n_jobs=n_jobs, report=report)
+    joblib.dump(model, os.path.join(data_dir, PASTA_ETAPAS, "random_forest.joblib"))
+
+
+def avaliar(data_dir, folds, amostra, repeticoes, random_state, n_jobs, report):
+    rfm = load_table("rfm", data_dir)
+    with report.stage("avaliacao", linhas_entrada=len(rfm)):
+        avaliacao = evaluate_model(rfm[FEATURES], rfm["frequencia_consultas"], n_splits=folds, amostra=amostra,
+                                   n_repeats=repeticoes, n_jobs=n_jobs, random_state=random_state)
+    # O tempo muda a cada execução: fora do arquivo, para não invalidar a exportação à toa
+    avaliacao.pop("segundos")
+    with open(os.path.join(data_dir, PASTA_ETAPAS, "avaliacao.json"), "w", encoding="utf-8") as f:
+        json.dump(avaliacao, f, ensure_ascii=False, indent=2)
+
+
+def pontuar(data_dir, report):
+    kmeans = joblib.load(os.path.join(data_dir, PASTA_ETAPAS, "kmeans.joblib"))
+    model = joblib.load(os.path.join(data_dir, PASTA_ETAPAS, "random_forest.joblib"))
+    rfm = load_table("rfm", data_dir)
+    with report.stage("pontuar", linhas_entrada=len(rfm)) as etapa:
+        scores = score_rfm(rfm, kmeans, model)
+        etapa.linhas_saida = len(scores)
+    save_table(scores, "scores", os.path.join(data_dir, PASTA_ETAPAS))
+
+
+def cubo(data_dir, chunksize, report):
+    scores = load_table("scores", os.path.join(data_dir, PASTA_ETAPAS), columns=["id_paciente", "cluster_rfm"])
+    with report.stage("cubo", linhas_entrada=len(scores)) as etapa:
+        df_cubo = build_cube(data_dir, scores, chunksize or CHUNKSIZE_CUBO)
+        etapa.linhas_saida = len(df_cubo)
+    save_table(df_cubo, CUBO, data_dir)
+
+
+def exportar(data_dir, ref_date, cluster_engine, csv, report):
+    scores = load_table("scores", os.path.join(data_dir, PASTA_ETAPAS))
+    # Mesma versão de modelos que o process-data.py grava (usada pelo score-batch e pelo serviço)
+    kmeans = joblib.load(os.path.join(data_dir, PASTA_ETAPAS, "kmeans.joblib"))
+    model = joblib.load(os.path.join(data_dir, PASTA_ETAPAS, "random_forest.joblib"))
+    with open(os.path.join(data_dir, PASTA_ETAPAS, "avaliacao.json"), encoding="utf-8") as f:
+        avaliacao = json.load(f)
+    with report.stage("salvar_modelos"):
+        save_models(kmeans, model, scores[FEATURES], os.path.join(data_dir, "models"), ref_date=ref_date,
+                    cluster_engine=cluster_engine, avaliacao=avaliacao)
+    load_process_data().save_final(scores, load_table("dados_pacientes", data_dir), data_dir, csv=csv, report=report)
+
+
+def build_pipeline(args, report):
+    os.makedirs(os.path.join(args.data_dir, PASTA_ETAPAS), exist_ok=True)
+    if args.sem_gerar:
+        # Dados de fora do pipeline: o arquivo existente (Parquet, Feather ou CSV) é a entrada
+        dados = {}
+        for nome in ("dados_pacientes", "dados_medicos", "dados_consultas"):
+            path = find_artifact(nome, args.data_dir)
+            if path is None:
+                raise FileNotFoundError(f" Arquivo não encontrado:\n{os.path.join(args.data_dir, nome)}")
+            dados[nome] = os.path.basename(path)
+        etapas = []
+    else:
+        dados = {nome: nome + ".parquet" for nome in ("dados_pacientes", "dados_medicos", "dados_consultas")}
+        etapas = [Etapa("gerar", gerar, saidas=list(dados.values()), codigo=["src/generators.py"], params={
+            "num_pacientes": args.num_pacientes, "num_medicos": args.num_medicos,
+            "num_consultas": args.num_consultas, "seed": args.seed, "pool": args.pool,
+            "hoje": args.hoje or date.today().isoformat(),
+        })]
+
+    intermediario = lambda nome: os.path.join(PASTA_ETAPAS, nome)  # noqa: E731
+    processo = "process-data.py"
+    # O relatório é só das etapas executadas nesta chamada (não entra na chave)
+    comum = {"report": report}
+    if args.dataset_final == "estrela":
+        saidas_dataset = [FATO + ".parquet", DIM_PACIENTES + ".parquet", DIM_MEDICOS + ".parquet"]
+    else:
+        saidas_dataset = ["dataset_final.parquet"]
+    if args.csv:
+        saidas_dataset.append("dataset_final.csv")
+    saidas_final = ["pacientes_engajamento_score.parquet"] + (["pacientes_engajamento_score.csv"] if args.csv else [])
+    etapas += [
+        Etapa("dataset_final", integrar, entradas=list(dados.values()), saidas=saidas_dataset,
+              params={"dataset_final": args.dataset_final, "csv": args.csv},
+              opcoes={"chunksize": args.chunksize, **comum}, codigo=[processo, "src/dataset.py"]),
+        Etapa("rfm", calcular_rfm, entradas=[dados["dados_consultas"]], saidas=["rfm.parquet", "rfm_estado.parquet"],
+              params={"ref_date": args.ref_date}, opcoes={"chunksize": args.chunksize, **comum},
+              codigo=["src/rfm.py"]),
+        Etapa("clusters", clusterizar, entradas=["rfm.parquet"], saidas=[intermediario("kmeans.joblib")],
+              params={"k": args.k, "cluster_engine": args.cluster_engine}, opcoes=comum,
+              codigo=[processo, "src/models.py"]),
+        Etapa("treino", treinar, entradas=["rfm.parquet"], saidas=[intermediario("random_forest.joblib")],
+              opcoes={"n_jobs": args.n_jobs, **comum}, codigo=[processo]),
+        Etapa("avaliacao", avaliar, entradas=["rfm.parquet"], saidas=[intermediario("avaliacao.json")],
+              params={"folds": args.cv_folds, "amostra": args.amostra_avaliacao,
+                      "repeticoes": REPETICOES_IMPORTANCIA, "random_state": 42},
+              opcoes={"n_jobs": args.n_jobs, **comum}, codigo=["src/models.py"]),
+        Etapa("pontuar", pontuar, entradas=["rfm.parquet", intermediario("kmeans.joblib"),
+                                            intermediario("random_forest.joblib")],
+              saidas=[intermediario("scores.parquet")], opcoes=comum, codigo=["src/models.py"]),
+        Etapa("cubo", cubo, entradas=[dados["dados_consultas"], dados["dados_pacientes"], dados["dados_medicos"],
+                                      intermediario("scores.parquet")],
+              saidas=[CUBO + ".parquet"], opcoes={"chunksize": args.chunksize, **comum}, codigo=["src/dataset.py"]),
+        Etapa("exportar", exportar, entradas=[intermediario("scores.parquet"), intermediario("avaliacao.json"),
+                                              dados["dados_pacientes"]],
+              saidas=saidas_final + [RESUMO, INDICE, "models/LATEST"],
+              params={"ref_date": args.ref_date, "cluster_engine": args.cluster_engine, "csv": args.csv},
+              opcoes=comum, codigo=[processo, "src/dashboard.py", "src/similarity.py"]),
+    ]
+    return Pipeline(etapas, args.data_dir)
+
+
+def main():
+    args = parse_args()
+    report = RunReport(modo="pipeline", data_dir=os.path.abspath(args.data_dir), chunksize=args.chunksize,
+                       dataset_final=args.dataset_final, cluster_engine=args.cluster_engine, k=args.k,
+                       ref_date=args.ref_date)
+    pipeline = build_pipeline(args, report)
+    desconhecidas = [e for e in (args.ate or []) + args.forcar if e not in pipeline.etapas]
+    if desconhecidas:
+        raise SystemExit(f" Etapas desconhecidas: {', '.join(desconhecidas)} (disponíveis: {', '.join(pipeline.etapas)})")
+
+    print(" Pasta de dados:", args.data_dir)
+    resultado = pipeline.run(args.ate, forcar=args.forcar, simular=args.simular)
+    print("\n--- Etapas ---")
+    for nome, situacao, segundos in resultado:
+        print(f"   {nome:<15} {situacao:<12} {segundos:8.2f}s")
+    executadas = sum(situacao in ("executada", "executaria") for _, situacao, _ in resultado)
+    print(f"\n {executadas} de {len(resultado)} etapa(s) {'seriam executadas' if args.simular else 'executadas'}.")
+    etapas = report.to_dict()["etapas"]
+    if etapas:
+        print("\n--- Tempo e memória por etapa ---")
+        for etapa in etapas:
+            print(format_stage(etapa))
+        print(report.save(args.relatorio or os.path.join(args.data_dir, RELATORIO)))
+
+
+if __name__ == "__main__":
+    main()
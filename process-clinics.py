@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import time
+from contextlib import redirect_stderr, redirect_stdout
+from datetime import datetime
+
+from src.artifacts import DATA_DIR
+from src.clinics import INDICE, LOG, clinic_dir, clinics_root, discover, run_partitions, save_index
+from src.dashboard import RESUMO
+from src.generators import NUM_CONSULTAS, NUM_MEDICOS, NUM_PACIENTES, SEED, generate_all
+from src.scripts import load_process_data
+
+# Várias clínicas, cada uma uma partição em data/clinicas/<clinica>/ processada pelo
+# process-data.py completo (RFM, clusterização, treino, pontuação, arquivo final) num pool
+# de processos: no máximo --workers partições ao mesmo tempo, cada uma num único núcleo e
+# com até --limite-memoria-mb de memória. Sem dados compartilhados entre partições, a vazão
+# cresce quase linearmente com os núcleos até o limite de memória da máquina.
+#
+# Argumentos desconhecidos vão para o process-data.py de cada clínica, ex.:
+#   python process-clinics.py --workers 4 --k 5 --chunksize 500000
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Processa várias clínicas (partições) em paralelo e atualiza o "
+                                                 "índice consolidado usado pelo dashboard.")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Raiz; as clínicas ficam em <data-dir>/clinicas/.")
+    parser.add_argument("--clinicas", nargs="+", default=None, help="Clínicas a processar (padrão: todas as existentes).")
+    parser.add_argument("--workers", type=int, default=None, help="Partições simultâneas (padrão: núcleos da máquina).")
+    parser.add_argument("--limite-memoria-mb", type=int, default=None,
+                        help="Memória (heap/arrays) máxima por partição; acima dela a clínica falha sozinha (sem_memoria).")
+    parser.add_argument("--gerar", type=int, default=None, metavar="N",
+                        help="Gera antes N clínicas sintéticas (clinica_01, clinica_02, ...), uma semente por clínica.")
+    parser.add_argument("--num-pacientes", type=int, default=NUM_PACIENTES)
+    parser.add_argument("--num-medicos", type=int, default=NUM_MEDICOS)
+    parser.add_argument("--num-consultas", type=int, default=NUM_CONSULTAS)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--hoje", default=None)
+    parser.add_argument("--pool", action="store_true", help="Geração por amostragem vetorizada (ver generate-df.py).")
+    return parser.parse_known_args()
+
+
+def summarize(clinica, data_dir, segundos):
+    # Entrada do índice: o que o dashboard precisa para listar a clínica sem abrir os artefatos dela
+    entrada = {"clinica": clinica, "pasta": clinica, "situacao": "ok",
+               "processado_em": datetime.now().isoformat(timespec="seconds"), "segundos": round(segundos, 2)}
+    path_relatorio = os.path.join(data_dir, "relatorio_execucao.json")
+    if os.path.exists(path_relatorio):
+        with open(path_relatorio, encoding="utf-8") as f:
+            etapas = json.load(f)["etapas"]
+        entrada["pico_rss_mb"] = max((e["pico_rss_mb"] for e in etapas), default=None)
+    path_resumo = os.path.join(data_dir, RESUMO)
+    if os.path.exists(path_resumo):
+        with open(path_resumo, encoding="utf-8") as f:
+            kpis = json.load(f)["kpis"]
+        entrada.update(pacientes=kpis["pacientes"], pacientes_ativos=kpis["pacientes_ativos"],
+                       score_medio=round(kpis["score_medio"], 4))
+    path_latest = os.path.join(data_dir, "models", "LATEST")
+    if os.path.exists(path_latest):
+        with open(path_latest, encoding="utf-8") as f:
+            entrada["modelo"] = f.read().strip()
+    return entrada
+
+
+def process_clinic(clinica, data_dir, argv, gerar=None):
+    # Roda num processo do pool; a saída do process-data.py vai para o log da partição
+    inicio = time.perf_counter()
+    os.makedirs(data_dir, exist_ok=True)
+    with open(os.path.join(data_dir, LOG), "w", encoding="utf-8") as log, redirect_stdout(log), redirect_stderr(log):
+        if gerar is not None:
+            generate_all(data_dir, **gerar)
+        # Um núcleo por partição (um --n-jobs explícito em argv tem precedência)
+        load_process_data().main(["--data-dir", data_dir, "--n-jobs", "1", *argv])
+    return summarize(clinica, data_dir, time.perf_counter() - inicio)
+
+
+def main():
+    args, argv = parse_args()
+    raiz = args.data_dir
+    tarefas = {}
+    if args.gerar:
+        for i in range(1, args.gerar + 1):
+            clinica = f"clinica_{i:02d}"
+            gerar = {"num_pacientes": args.num_pacientes, "num_medicos": args.num_medicos,
+                     "num_consultas": args.num_consultas, "seed": args.seed + i, "hoje": args.hoje, "pool": args.pool}
+            tarefas[clinica] = {"clinica": clinica, "data_dir": clinic_dir(raiz, clinica), "argv": argv, "gerar": gerar}
+    for clinica in args.clinicas or ([] if args.gerar else discover(raiz)):
+        tarefas.setdefault(clinica, {"clinica": clinica, "data_dir": clinic_dir(raiz, clinica), "argv": argv})
+    if not tarefas:
+        raise SystemExit(f" Nenhuma clínica em {clinics_root(raiz)} (use --gerar N ou crie as pastas com os dados_*).")
+
+    print(" Pasta das clínicas:", clinics_root(raiz))
+    print(f" Clínicas: {len(tarefas)} | workers: {args.workers or os.cpu_count()}"
+          f" | limite por partição: {f'{args.limite_memoria_mb} MB' if args.limite_memoria_mb else 'sem limite'}")
+    inicio = time.perf_counter()
+    resultados = []
+    for clinica, situacao, resultado in run_partitions(process_clinic, tarefas, args.workers, args.limite_memoria_mb):
+        if situacao != "ok":
+            resultado = {"clinica": clinica, "pasta": clinica, "situacao": situacao, "erro": resultado,
+                         "processado_em": datetime.now().isoformat(timespec="seconds")}
+        resultados.append(resultado)
+        # Índice atualizado a cada partição concluída: o dashboard já vê as clínicas prontas
+        save_index(raiz, [resultado])
+        detalhe = f"{resultado['segundos']:8.2f}s  pico {resultado.get('pico_rss_mb') or 0:7.0f} MB" \
+            if situacao == "ok" else resultado["erro"]
+        print(f"   {clinica:<20} {situacao:<12} {detalhe}", flush=True)
+
+    total = time.perf_counter() - inicio
+    ok = [r for r in resultados if r["situacao"] == "ok"]
+    soma = sum(r["segundos"] for r in ok)
+    print(f"\n {len(ok)} de {len(resultados)} clínica(s) processadas em {total:.2f}s "
+          f"(soma das partições: {soma:.2f}s, {soma / total if total else 0:.1f}x em paralelo)")
+    print(os.path.join(clinics_root(raiz), INDICE))
+    if len(ok) < len(resultados):
+        print(f" Logs das clínicas com falha: {os.path.join(clinics_root(raiz), '<clinica>', LOG)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
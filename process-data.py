@@ -1,11 +1,30 @@
+import argparse
 import os
+from contextlib import ExitStack
+
+import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
 from sklearn.ensemble import RandomForestRegressor
-from datetime import datetime
-########## Importações necessárias para as validações ######### (para quem for rodar os comentários)
-# from sklearn.metrics import silhouette_score 
-# import matplotlib.pyplot as plt
+
+from src.artifacts import (
+    FORMATO_PADRAO, BatchWriter, append_table, find_artifact, iter_table, load_table, read_table, save_table,
+)
+from src.dashboard import add_idade, save_summary
+from src.database import (
+    CHUNKSIZE, append_consultas, compute_rfm_sql, database_path, get_engine, has_table, load_database,
+    load_pacientes, save_scores, update_scores,
+)
+from src.dataset import (
+    CHUNKSIZE_CUBO, CUBO, DIM_MEDICOS, DIM_PACIENTES, FATO, build_cube, compact_dimension, compact_fato, explode,
+    remove_stale, save_dimensions, save_star,
+)
+from src.models import (
+    AMOSTRA_AVALIACAO, CLUSTER_ENGINES, CV_FOLDS, FEATURES, SILHOUETTE_SAMPLE, evaluate_model, fit_clusters,
+    load_centroids, load_models, save_models, score_rfm, sweep_k,
+)
+from src.profiling import NullReport, RunReport, format_stage
+from src.rfm import REF_DATE, RFMAccumulator, load_state, ref_day_number, save_state, shift_recency
+from src.similarity import SimilarityIndex, save_index
 
 # 1. CAMINHO DO PROJETO
 PROJECT_ROOT = os.path.abspath(
@@ -14,179 +33,517 @@ PROJECT_ROOT = os.path.abspath(
 
 DATA_DIR = os.path.join(PROJECT_ROOT, "data")
 
-print(" Diretório do projeto:", PROJECT_ROOT)
-print(" Pasta de dados:", DATA_DIR)
-
-# arquivos
-path_pacientes  = os.path.join(DATA_DIR, "dados_pacientes.csv")
-path_consultas  = os.path.join(DATA_DIR, "dados_consultas.csv")
-path_medicos    = os.path.join(DATA_DIR, "dados_medicos.csv")
-
-print("\nCarregando arquivos...")
+# Estado RFM por paciente (última data, contagem, soma) salvo a cada execução
+ESTADO_RFM = "rfm_estado.parquet"
+
+# Relatório de tempo/memória por etapa gravado a cada execução
+RELATORIO = "relatorio_execucao.json"
+# Etapas medidas (nomes aceitos por --perfil)
+ETAPAS = ["carregar", "carregar_banco", "integrar", "gravar_dataset_final", "dataset_final_em_blocos", "rfm",
+          "estado_rfm", "selecao_k", "clusterizacao", "treino", "predicao", "avaliacao", "salvar_modelos",
+          "juntar_pacientes", "gravar_arquivo_final", "resumo_dashboard", "indice_similares", "cubo",
+          "gravar_scores_banco", "consultas_novas", "atualizar_rfm", "pontuar_afetados", "gravar_consultas_novas"]
+
+COLUNAS_PACIENTE_FINAL = ['id_paciente', 'nome', 'data_nascimento', 'sexo', 'plano_saude', 'cidade',
+                          'possui_doenca_cronica', 'data_cadastro']
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Integra os dados, calcula RFM e treina os modelos.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--formato", choices=["parquet", "feather"], default=FORMATO_PADRAO,
+                        help="Formato colunar dos artefatos gerados.")
+    parser.add_argument("--ref-date", default=None,
+                        help=f"Data de referência (AAAA-MM-DD) para o cálculo da Recência (padrão: {REF_DATE}; "
+                             "no modo incremental, a da última execução ou a da consulta nova mais recente, "
+                             "a maior).")
+    parser.add_argument("--models-dir", default=None,
+                        help="Pasta dos modelos treinados (padrão: <data-dir>/models).")
+    parser.add_argument("--cluster-engine", choices=CLUSTER_ENGINES, default="kmeans",
+                        help="kmeans: K-Means completo; minibatch: MiniBatchKMeans para milhões de pacientes; "
+                             "warm: parte dos centróides da última execução. Em todos, os ids de cluster "
+                             "são alinhados aos da execução anterior.")
+    parser.add_argument("--k", type=int, default=4,
+                        help="Número de clusters RFM (padrão: 4, escolha de negócio).")
+    parser.add_argument("--validar-k", action="store_true",
+                        help="Roda a seleção de K (inércia e silhueta para K=1..10) antes de treinar "
+                             "e grava data/selecao_k.csv.")
+    parser.add_argument("--selecionar-k", action="store_true",
+                        help="Roda apenas a seleção de K sobre o RFM atual e encerra.")
+    parser.add_argument("--silhouette-sample", type=int, default=SILHOUETTE_SAMPLE,
+                        help="Tamanho da amostra estratificada para a silhueta exata.")
+    parser.add_argument("--n-jobs", type=int, default=-1,
+                        help="Núcleos usados no treino do Random Forest e na seleção de K (-1 = todos).")
+    parser.add_argument("--cv-folds", type=int, default=CV_FOLDS,
+                        help="Folds da validação cruzada do Random Forest (gravada nos metadados do modelo).")
+    parser.add_argument("--amostra-avaliacao", type=int, default=AMOSTRA_AVALIACAO,
+                        help="Pacientes amostrados para a validação cruzada e a importância por permutação.")
+    parser.add_argument("--sem-avaliacao", action="store_true",
+                        help="Não roda a validação cruzada (o dashboard fica sem as métricas do modelo).")
+    parser.add_argument("--incremental", metavar="ARQUIVO_CONSULTAS", default=None,
+                        help="Atualiza RFM e scores apenas dos pacientes presentes neste arquivo de consultas "
+                             "novas, usando o estado e os modelos salvos na última execução completa.")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="Modo streaming: lê as consultas em blocos deste tamanho, mantendo em memória "
+                             "apenas os agregados por paciente.")
+    parser.add_argument("--dataset-final", choices=["explodido", "estrela"], default="explodido",
+                        help="explodido: uma tabela com todas as colunas (strings como category); "
+                             "estrela: tabela fato de consultas + dimensões de pacientes e médicos.")
+    parser.add_argument("--csv", action="store_true",
+                        help="Exporta também dataset_final.csv e pacientes_engajamento_score.csv.")
+    parser.add_argument("--backend", choices=["arquivos", "sqlite"], default="arquivos",
+                        help="sqlite: carrega pacientes/médicos/consultas num banco local indexado (data/clinica.db), "
+                             "calcula o RFM com GROUP BY no banco e grava os scores numa tabela consultável.")
+    parser.add_argument("--relatorio", default=None,
+                        help="JSON com tempo, CPU, pico de memória e linhas por etapa "
+                             f"(padrão: <data-dir>/{RELATORIO}).")
+    parser.add_argument("--perfil", choices=ETAPAS, default=None,
+                        help="Roda a etapa indicada sob o cProfile (.prof + resumo .txt).")
+    parser.add_argument("--perfil-saida", default=None,
+                        help="Caminho do .prof (padrão: <data-dir>/perfil_<etapa>.prof).")
+    return parser.parse_args(argv)
 
-if not os.path.exists(path_pacientes):
-    raise FileNotFoundError(f" Arquivo não encontrado:\n{path_pacientes}")
-
-if not os.path.exists(path_consultas):
-    raise FileNotFoundError(f" Arquivo não encontrado:\n{path_consultas}")
-
-if not os.path.exists(path_medicos):
-    raise FileNotFoundError(f" Arquivo não encontrado:\n{path_medicos}")
 
 # 2. CARREGAR DADOS
-df_pacientes = pd.read_csv(path_pacientes)
-df_consultas = pd.read_csv(path_consultas)
-df_medicos   = pd.read_csv(path_medicos)
-
-print(" Arquivos carregados!")
-print(f" Pacientes:  {len(df_pacientes)}")
-print(f" Consultas:  {len(df_consultas)}")
-print(f" Médicos:  {len(df_medicos)}")
-
-# 3. INTEGRAR DADOS
-print("\n Integrando datasets...")
-
-df = df_consultas.merge(df_pacientes, on="id_paciente", how="left")
-df = df.merge(df_medicos, on="id_medico", how="left")
-
-print(" Integração concluída!")
-print(f" Registros totais: {len(df)}")
-
-# 4. SALVAR DATASET FINAL COMPLETO
-dataset_final_path = os.path.join(DATA_DIR, "dataset_final.csv")
-df.to_csv(dataset_final_path, index=False)
+def load_inputs(data_dir):
+    # Lê Parquet/Feather quando existir (tipado, memory-mapped); senão, o CSV gerado
+    print("\nCarregando arquivos...")
+    df_pacientes = load_table("dados_pacientes", data_dir)
+    df_consultas = load_table("dados_consultas", data_dir)
+    df_medicos   = load_table("dados_medicos", data_dir)
 
-print("\n dataset_final.csv salvo!")
-print(dataset_final_path)
+    print(" Arquivos carregados!")
+    print(f" Pacientes:  {len(df_pacientes)}")
+    print(f" Consultas:  {len(df_consultas)}")
+    print(f" Médicos:  {len(df_medicos)}")
+    return df_pacientes, df_consultas, df_medicos
 
-# 5. RFM
-print("\n Calculando RFM...")
 
-df_consultas["data_consulta"] = pd.to_datetime(df_consultas["data_consulta"])
-ref_date = datetime(2025, 11, 22)
-
-rfm = df_consultas.groupby("id_paciente").agg({
-    "data_consulta": lambda x: (ref_date - x.max()).days,   # Recência
-    "valor_consulta": "sum"                                 # Monetário
-}).reset_index()
-
-# Frequência = número de consultas (contagem de linhas)
-frequencia = df_consultas.groupby("id_paciente").size().reset_index(name="frequencia_consultas")
-
-rfm = rfm.merge(frequencia, on="id_paciente", how="left")
-
-rfm.columns = [
-    "id_paciente",
-    "recencia_dias",
-    "valor_monetario",
-    "frequencia_consultas"
-]
-
-print(" RFM calculado!")
-
-
-# 6. CLUSTER + RANDOM FOREST
-print("\n Machine Learning...")
+# 3. INTEGRAR DADOS
+def build_dataset_final(df_pacientes, df_consultas, df_medicos):
+    # Junção por posição (array indexado pelo id) sobre dimensões com strings em category:
+    # cada linha de consulta recebe só códigos inteiros, não cópias das strings
+    print("\n Integrando datasets...")
+
+    df = explode(compact_fato(df_consultas), compact_dimension(df_pacientes), compact_dimension(df_medicos))
+
+    print(" Integração concluída!")
+    print(f" Registros totais: {len(df)}")
+    return df
+
+
+# 4. SALVAR DATASET FINAL
+def save_dataset_final(df_pacientes, df_consultas, df_medicos, data_dir, args, report=None):
+    report = report or NullReport()
+    remove_stale(data_dir, estrela=args.dataset_final == "estrela")
+    if args.dataset_final == "estrela":
+        print("\n Gravando dataset_final em esquema estrela (fato + dimensões)...")
+        with report.stage("gravar_dataset_final", linhas_entrada=len(df_consultas)) as etapa:
+            paths = save_star(df_consultas, df_pacientes, df_medicos, data_dir, formato=args.formato)
+            etapa.linhas_saida = len(df_consultas)
+        if args.csv:
+            with report.stage("integrar", linhas_entrada=len(df_consultas)) as etapa:
+                df = build_dataset_final(df_pacientes, df_consultas, df_medicos)
+                save_table(df, "dataset_final", data_dir, formato="csv")
+                etapa.linhas_saida = len(df)
+    else:
+        with report.stage("integrar", linhas_entrada=len(df_consultas)) as etapa:
+            df = build_dataset_final(df_pacientes, df_consultas, df_medicos)
+            etapa.linhas_saida = len(df)
+        with report.stage("gravar_dataset_final", linhas_entrada=len(df)) as etapa:
+            paths = [save_table(df, "dataset_final", data_dir, formato=args.formato, csv=args.csv)]
+            etapa.linhas_saida = len(df)
+
+    print("\n dataset_final salvo!")
+    for path in paths:
+        print(path)
+
+
+# 2-5. MODO STREAMING (consultas maiores que a memória)
+def process_consultas_in_chunks(data_dir, df_pacientes, df_medicos, chunksize, formato, csv=False, estrela=False):
+    # Cada bloco atualiza os agregados parciais por paciente (última data, contagem, soma)
+    # e é integrado e gravado no dataset_final antes do próximo ser lido. A memória fica
+    # limitada pelo número de pacientes, não pelo número de consultas.
+    path_consultas = find_artifact("dados_consultas", data_dir)
+    if path_consultas is None:
+        raise FileNotFoundError(f" Arquivo não encontrado:\n{os.path.join(data_dir, 'dados_consultas')}")
+
+    print(f"\n Lendo consultas em blocos de {chunksize} linhas...")
+    acumulador = RFMAccumulator(int(df_pacientes["id_paciente"].max()) + 1)
+    dim_pacientes = compact_dimension(df_pacientes)
+    dim_medicos = compact_dimension(df_medicos)
+    remove_stale(data_dir, estrela)
+    with ExitStack() as stack:
+        if estrela:
+            save_dimensions(df_pacientes, df_medicos, data_dir, formato=formato)
+        writers = [stack.enter_context(BatchWriter(FATO if estrela else "dataset_final", data_dir, formato=formato))]
+        if csv:
+            writers.append(stack.enter_context(BatchWriter("dataset_final", data_dir, formato="csv")))
+
+        for chunk in iter_table(path_consultas, chunksize):
+            acumulador.update_frame(chunk)
+            fato = compact_fato(chunk)
+            df = explode(fato, dim_pacientes, dim_medicos) if (csv or not estrela) else None
+            writers[0].write(fato if estrela else df)
+            for writer in writers[1:]:
+                writer.write(df)
+
+    print(f" Consultas processadas: {writers[0].linhas}")
+    print("\n dataset_final salvo!")
+    print(writers[0].path)
+    return acumulador
 
-# Definindo as variáveis para o modelo RFM
-X = rfm[["recencia_dias", "frequencia_consultas", "valor_monetario"]]
-y = rfm["frequencia_consultas"]
 
 # ==============================================================================
-# 🌟 CÓDIGO DE VALIDAÇÃO DE CLUSTERS (Elbow Method e Silhouette Score)
+# 🌟 VALIDAÇÃO DE CLUSTERS (Elbow Method e Silhouette Score)
 #
 # A análise estatística indicou K=2 como o ideal.
 # No entanto, K=4 foi escolhido para o projeto para oferecer granularidade acionável
 # ao negócio (VIPS, OBS. Moderada, OBS. Leve e Baixo Impacto).
 # O Silhouette Score de K=4 (~0.61) é considerado robusto.
+# Exemplo dos resultados para 41.284 pacientes: K=2 (0.8384), K=4 (0.6176)
+#
+# Os K candidatos (1 a 10) são treinados em paralelo. A silhueta exata é O(N^2), por isso
+# é calculada numa amostra estratificada por cluster; a silhueta simplificada (por
+# centróides) usa a população inteira.
 # ==============================================================================
+def select_k(rfm, data_dir, args):
+    print("\n Rodando seleção de K (Elbow + Silhouette, K=1 a K=10)...")
+    resultados = sweep_k(rfm[FEATURES], engine=args.cluster_engine, sample_size=args.silhouette_sample,
+                         n_jobs=args.n_jobs)
+    path = os.path.join(data_dir, "selecao_k.csv")
+    resultados.to_csv(path, index=False)
 
+    print("\n--- Resultados (inércia e Silhouette Score) ---")
+    for linha in resultados.itertuples():
+        print(f"K = {linha.k}: Inércia = {linha.inercia:,.0f} | Silhouette (amostra) = {linha.silhouette_amostra:.4f}"
+              f" | Silhouette (centróides) = {linha.silhouette_simplificada:.4f}")
+    print(path)
+    return resultados
 
-# ------------------ MÉTODO DO COTOVELO (ELBOW METHOD) ------------------
-# Descomente para rodar a validação da inércia (WCSS)
-#wcss = []
-#k_range = range(1, 11)
-#print("\n Rodando Elbow Method (K=1 a K=10)...")
-#for k in k_range:
-#    if k <= len(X):
-#        kmeans_model = KMeans(n_clusters=k, init='k-means++', random_state=42, n_init=10)
-#        kmeans_model.fit(X)
-#        wcss.append(kmeans_model.inertia_)
-#    else:
-#        wcss.append(None)
-
-# # Plotagem do Elbow Method
-#if 'plt' in globals():
-#    plt.figure(figsize=(10, 6))
-#    plt.plot(k_range, wcss, marker='o', linestyle='--')
-#    plt.title('Método do Cotovelo (WCSS vs K)')
-#    plt.xlabel('Número de Clusters (K)') 
-#    plt.ylabel('WCSS (Inertia)')
-#    plt.xticks(k_range)
-#    plt.grid(True)
-#    plt.show()
-#else:
-#    print("ATENÇÃO: Importe 'matplotlib.pyplot as plt' para visualizar o gráfico do Elbow.")
-# ------------------------------------------------------------------------
-
-
-# ------------------ COEFICIENTE DE SILHUETA (SILHOUETTE SCORE) ------------------
-# Descomente para rodar a validação da qualidade de separação dos clusters
-#silhouette_scores = {}
-#k_range_sil = range(2, 11)
-#print("\nRodando Silhouette Score (K=2 a K=10)...")
-#
-#for k in k_range_sil:
-#    kmeans_model = KMeans(n_clusters=k, init='k-means++', random_state=42, n_init=10)
-#    cluster_labels = kmeans_model.fit_predict(X)
-#
-#     # O cálculo é O(N^2) e pode ser lento para grandes datasets
-#    score = silhouette_score(X, cluster_labels)
-#    silhouette_scores[k] = score
-#
-#print("\n--- Resultados do Silhouette Score ---")
-#for k, score in silhouette_scores.items():
-#    print(f"K = {k}: Score = {score:.4f}")
-# # Exemplo dos resultados para 41.284 pacientes: K=2 (0.8384), K=4 (0.6176)
-#
-# # Plotagem do Silhouette Score
-#if 'plt' in globals():
-#    plt.figure(figsize=(10, 6))
-#    plt.plot(list(silhouette_scores.keys()), list(silhouette_scores.values()), marker='o', linestyle='-')
-#    plt.title('Silhouette Score vs K')
-#    plt.xlabel('Número de Clusters (K)')
-#    plt.ylabel('Silhouette Score Médio')
-#    plt.xticks(list(silhouette_scores.keys()))
-#    plt.grid(True)
-#    plt.show()
-# else:
-#    print("ATENÇÃO: Importe 'matplotlib.pyplot as plt' para visualizar o gráfico da Silhueta.")
-# ----------------------------------------------------------------------------------
-
-
-# --- CLUSTERIZAÇÃO RFM FINAL (K=4) ---
-# K=4 é a escolha de negócio, validada pelo Silhouette Score > 0.60
-K_ESCOLHIDO = 4
-print(f"\n Aplicando K-Means com K={K_ESCOLHIDO} (Escolha de Negócio)...")
-kmeans = KMeans(n_clusters=K_ESCOLHIDO, random_state=42, n_init=10)
-rfm["cluster_rfm"] = kmeans.fit_predict(X)
-
-
-# --- TREINAMENTO DO MODELO PREDITIVO (Random Forest Regressor) ---
-# Modelo para prever a Frequência de Consultas (Score de Engajamento)
-print(" Treinando Random Forest Regressor para Score de Engajamento...")
-model = RandomForestRegressor(random_state=42)
-model.fit(X, y)
-rfm["frequencia_prevista_reg"] = model.predict(X)
-
-# Inclui informações do paciente
-rfm = rfm.merge(df_pacientes[['id_paciente', 'nome', 'data_nascimento', 'sexo', 'plano_saude', 'cidade', 'possui_doenca_cronica', 'data_cadastro']],
-                on='id_paciente', how='left')
-
-# Salvar arquivo final com todas as colunas necessárias
-final_path = os.path.join(DATA_DIR, "pacientes_engajamento_score.csv")
-rfm.to_csv(final_path, index=False)
-
-print("\n Arquivo final salvo!")
-print(final_path)
-print(" Pacientes processados:", len(rfm))
\ No newline at end of file
+
+# 6. CLUSTER + RANDOM FOREST
+def cluster_rfm(rfm, cluster_engine="kmeans", centroides_anteriores=None, k=4, report=None):
+    report = report or NullReport()
+    X = rfm[FEATURES]
+
+    # --- CLUSTERIZAÇÃO RFM FINAL (K=4) ---
+    # K=4 é a escolha de negócio, validada pelo Silhouette Score > 0.60 (ver select_k / --validar-k)
+    K_ESCOLHIDO = k
+    print(f"\n Aplicando K-Means com K={K_ESCOLHIDO} (Escolha de Negócio, motor: {cluster_engine})...")
+    with report.stage("clusterizacao", linhas_entrada=len(X)) as etapa:
+        kmeans = fit_clusters(X, K_ESCOLHIDO, engine=cluster_engine, centroides_anteriores=centroides_anteriores)
+        rfm["cluster_rfm"] = kmeans.labels_
+        etapa.linhas_saida = len(rfm)
+    print(f" Iterações até convergir: {kmeans.n_iter_}")
+    return rfm, kmeans
+
+
+def train_engagement(rfm, n_jobs=-1, report=None):
+    report = report or NullReport()
+    X = rfm[FEATURES]
+    y = rfm["frequencia_consultas"]
+
+    # --- TREINAMENTO DO MODELO PREDITIVO (Random Forest Regressor) ---
+    # Modelo para prever a Frequência de Consultas (Score de Engajamento)
+    print(" Treinando Random Forest Regressor para Score de Engajamento...")
+    with report.stage("treino", linhas_entrada=len(X)):
+        model = RandomForestRegressor(random_state=42, n_jobs=n_jobs)
+        model.fit(X, y)
+    with report.stage("predicao", linhas_entrada=len(X)) as etapa:
+        rfm["frequencia_prevista_reg"] = model.predict(X)
+        etapa.linhas_saida = len(rfm)
+    return rfm, model
+
+
+def train_and_score(rfm, cluster_engine="kmeans", centroides_anteriores=None, k=4, n_jobs=-1, report=None):
+    print("\n Machine Learning...")
+    rfm, kmeans = cluster_rfm(rfm, cluster_engine, centroides_anteriores, k=k, report=report)
+    rfm, model = train_engagement(rfm, n_jobs=n_jobs, report=report)
+    return rfm, kmeans, model
+
+
+# 6b. AVALIAÇÃO (validação cruzada + importância por permutação, gravadas com o modelo)
+def evaluate(rfm, args, report=None):
+    report = report or NullReport()
+    print(f"\n Avaliando o Random Forest ({args.cv_folds} folds, "
+          f"amostra de até {args.amostra_avaliacao} pacientes)...")
+    with report.stage("avaliacao", linhas_entrada=len(rfm)):
+        avaliacao = evaluate_model(rfm[FEATURES], rfm["frequencia_consultas"], n_splits=args.cv_folds,
+                                   amostra=args.amostra_avaliacao, n_jobs=args.n_jobs)
+    print(f" R² (validação cruzada): {avaliacao['r2_medio']:.4f} ± {avaliacao['r2_desvio']:.4f}"
+          f" | MAE: {avaliacao['mae_medio']:.4f}")
+    for feature, valores in avaliacao["importancia_permutacao"].items():
+        print(f"   {feature:<22} {valores['percentual']:7.1%}  (queda de R² {valores['queda_r2']:.4f})")
+    if avaliacao["alvo_nas_features"]:
+        print(" Atenção: o alvo (frequencia_consultas) também é variável de entrada do modelo.")
+    return avaliacao
+
+
+# 7. ARQUIVO FINAL
+def save_final(rfm, df_pacientes, data_dir, formato=FORMATO_PADRAO, csv=False, report=None):
+    report = report or NullReport()
+    with report.stage("juntar_pacientes", linhas_entrada=len(rfm)) as etapa:
+        # Inclui informações do paciente
+        rfm = rfm.merge(df_pacientes[COLUNAS_PACIENTE_FINAL], on='id_paciente', how='left')
+        # Colunas derivadas usadas pelo dashboard ficam prontas no arquivo final
+        rfm = add_idade(rfm)
+        etapa.linhas_saida = len(rfm)
+
+    # Salvar arquivo final com todas as colunas necessárias
+    with report.stage("gravar_arquivo_final", linhas_entrada=len(rfm)) as etapa:
+        final_path = save_table(rfm, "pacientes_engajamento_score", data_dir, formato=formato, csv=csv)
+        etapa.linhas_saida = len(rfm)
+    # Gravado depois do arquivo final: o app só usa o resumo quando ele é mais recente que os dados
+    with report.stage("resumo_dashboard", linhas_entrada=len(rfm)):
+        resumo_path = save_summary(rfm, data_dir)
+    with report.stage("indice_similares", linhas_entrada=len(rfm)) as etapa:
+        indice = SimilarityIndex(rfm)
+        save_index(indice, data_dir)
+        etapa.linhas_saida = len(indice)
+    return rfm, final_path, resumo_path
+
+
+# 8. ATUALIZAÇÃO INCREMENTAL
+def run_incremental(args, data_dir, models_dir, report):
+    # Só os pacientes presentes no arquivo de consultas novas são recalculados e re-pontuados.
+    # Para os demais, a Recência é deslocada pela diferença entre as datas de referência.
+    acumulador, ref_antiga = load_state(os.path.join(data_dir, ESTADO_RFM))
+    kmeans, model, _ = load_models(models_dir)
+
+    print(f"\n Lendo consultas novas: {args.incremental}")
+    with report.stage("consultas_novas") as etapa:
+        delta = read_table(args.incremental, nome="dados_consultas")
+        df_pacientes = load_table("dados_pacientes", data_dir)
+        # Consultas de pacientes fora do cadastro ficam de fora (sem dados para o arquivo final)
+        conhecidas = delta["id_paciente"].isin(df_pacientes["id_paciente"])
+        desconhecidos = np.unique(delta.loc[~conhecidas, "id_paciente"].to_numpy())
+        delta = delta[conhecidas].reset_index(drop=True)
+        tocados = np.unique(delta["id_paciente"].to_numpy())
+        etapa.linhas_saida = len(delta)
+    print(f" Consultas novas: {len(delta)} | Pacientes afetados: {len(tocados)}")
+    if len(desconhecidos):
+        print(f" Aviso: {int((~conhecidas).sum())} consulta(s) ignoradas de {len(desconhecidos)} paciente(s) "
+              f"fora de dados_pacientes: {desconhecidos[:10].tolist()}{' ...' if len(desconhecidos) > 10 else ''}")
+
+    # A referência anda até a consulta mais recente (Recência nunca negativa); uma data explícita
+    # anterior às consultas novas é recusada
+    ultima = str(delta["data_consulta"].max().date()) if len(delta) else ref_antiga
+    ref_nova = args.ref_date or max(str(pd.Timestamp(ref_antiga).date()), ultima)
+    if ref_day_number(ref_nova) < ref_day_number(ultima):
+        raise SystemExit(f" --ref-date {ref_nova} é anterior à consulta nova mais recente ({ultima}).")
+
+    print(f"\n Atualizando RFM ({ref_antiga} -> {ref_nova})...")
+    with report.stage("atualizar_rfm") as etapa:
+        acumulador.update_frame(delta)
+        scores = load_table("pacientes_engajamento_score", data_dir)
+        scores = shift_recency(scores, ref_antiga, ref_nova).set_index("id_paciente")
+        etapa.linhas_saida = len(scores)
+    with report.stage("pontuar_afetados", linhas_entrada=len(tocados)) as etapa:
+        novos = score_rfm(acumulador.to_frame(ref_nova, ids=tocados), kmeans, model).set_index("id_paciente")
+        etapa.linhas_saida = len(novos)
+
+    with report.stage("juntar_pacientes", linhas_entrada=len(scores)) as etapa:
+        existentes = novos.index.intersection(scores.index)
+        scores.loc[existentes, novos.columns] = novos.loc[existentes]
+
+        # Pacientes com a primeira consulta entram com os dados cadastrais
+        faltando = novos.index.difference(scores.index)
+        if len(faltando):
+            cadastro = df_pacientes.loc[df_pacientes["id_paciente"].isin(faltando), COLUNAS_PACIENTE_FINAL]
+            scores = pd.concat([scores, novos.loc[faltando].join(cadastro.set_index("id_paciente"))])
+
+        scores = add_idade(scores.reset_index())
+        etapa.linhas_saida = len(scores)
+    with report.stage("gravar_arquivo_final", linhas_entrada=len(scores)) as etapa:
+        final_path = save_table(scores, "pacientes_engajamento_score", data_dir, formato=args.formato, csv=args.csv)
+        etapa.linhas_saida = len(scores)
+    # Gravado depois do arquivo final: o app só usa o resumo quando ele é mais recente que os dados
+    with report.stage("resumo_dashboard", linhas_entrada=len(scores)):
+        resumo_path = save_summary(scores, data_dir)
+    # A escala (média/desvio do log) muda com a Recência de todos: o índice é refeito inteiro (O(N log N), rápido)
+    with report.stage("indice_similares", linhas_entrada=len(scores)) as etapa:
+        indice = SimilarityIndex(scores)
+        save_index(indice, data_dir)
+        etapa.linhas_saida = len(indice)
+    # O cubo não é tocado: a mudança de cluster de um paciente afetado move todo o histórico
+    # dele entre células, e os pacientes distintos por célula não somam sem esse histórico.
+    # Ele fica com a última execução completa (o dashboard avisa quando está mais antigo).
+
+    if args.backend == "sqlite":
+        # No banco não há regravação completa: as consultas novas são inseridas, a Recência de
+        # todos anda com um UPDATE e só as linhas dos pacientes afetados são regravadas
+        engine = get_engine(database_path(data_dir))
+        if not has_table(engine, "scores"):
+            raise FileNotFoundError(f" Banco sem a tabela de scores (rode o pipeline completo com --backend sqlite):\n"
+                                    f"{database_path(data_dir)}")
+        with report.stage("gravar_scores_banco", linhas_entrada=len(delta)) as etapa:
+            append_consultas(engine, delta)
+            afetados = scores[scores["id_paciente"].isin(novos.index)]
+            etapa.linhas_saida = update_scores(engine, afetados, ref_day_number(ref_nova) - ref_day_number(ref_antiga))
+        print(database_path(data_dir))
+
+    # As consultas novas passam a fazer parte das entradas (a próxima execução completa as inclui)
+    # e do dataset_final, gravadas como partes novas (sem regravar o histórico); o estado RFM é
+    # gravado por último, para que uma falha antes dele não faça a mesma remessa ser somada
+    # duas vezes ao rodar de novo
+    with report.stage("gravar_consultas_novas", linhas_entrada=len(delta)) as etapa:
+        paths_consultas = append_table(delta, "dados_consultas", data_dir)
+        if find_artifact(FATO, data_dir) is not None:
+            append_table(compact_fato(delta), FATO, data_dir)
+            # Dimensões só são regravadas quando a remessa traz um paciente ou médico que não está nelas
+            dim_pacientes = load_table(DIM_PACIENTES, data_dir, columns=["id_paciente"])["id_paciente"]
+            dim_medicos = load_table(DIM_MEDICOS, data_dir, columns=["id_medico"])["id_medico"]
+            if not (delta["id_paciente"].isin(dim_pacientes).all() and delta["id_medico"].isin(dim_medicos).all()):
+                save_dimensions(df_pacientes, load_table("dados_medicos", data_dir), data_dir, formato=args.formato)
+        elif find_artifact("dataset_final", data_dir) is not None:
+            df_medicos = load_table("dados_medicos", data_dir)
+            append_table(build_dataset_final(df_pacientes, delta, df_medicos), "dataset_final", data_dir)
+        etapa.linhas_saida = len(delta)
+    with report.stage("estado_rfm"):
+        save_state(acumulador, os.path.join(data_dir, ESTADO_RFM), ref_nova)
+
+    print("\n Arquivo final atualizado!")
+    print(final_path)
+    print(resumo_path)
+    for path in paths_consultas:
+        print(path)
+    print(f" Pacientes re-pontuados: {len(novos)} (novos: {len(faltando)})")
+
+
+def run_full(args, data_dir, models_dir, report):
+    ref_date = args.ref_date or REF_DATE
+
+    if args.backend == "sqlite":
+        # O dataset_final passa a ser uma view do banco (junção feita pelo SQLite), não um arquivo
+        engine = get_engine(database_path(data_dir))
+        print(f"\n Carregando dados no banco: {database_path(data_dir)}")
+        with report.stage("carregar_banco") as etapa:
+            linhas = load_database(data_dir, engine, args.chunksize or CHUNKSIZE)
+            etapa.linhas_saida = sum(linhas.values())
+        print(f" Pacientes:  {linhas['pacientes']}")
+        print(f" Consultas:  {linhas['consultas']}")
+        print(f" Médicos:  {linhas['medicos']}")
+
+        print("\n Calculando RFM no banco (GROUP BY)...")
+        with report.stage("rfm", linhas_entrada=linhas["consultas"]) as etapa:
+            rfm = compute_rfm_sql(engine, ref_date)
+            acumulador = RFMAccumulator.from_frame(rfm, ref_date)
+            etapa.linhas_saida = len(rfm)
+        print(" RFM calculado!")
+        df_pacientes = load_pacientes(engine, COLUNAS_PACIENTE_FINAL)
+    elif args.chunksize:
+        print("\nCarregando pacientes e médicos...")
+        with report.stage("carregar") as etapa:
+            df_pacientes = load_table("dados_pacientes", data_dir)
+            df_medicos = load_table("dados_medicos", data_dir)
+            etapa.linhas_saida = len(df_pacientes) + len(df_medicos)
+        with report.stage("dataset_final_em_blocos") as etapa:
+            acumulador = process_consultas_in_chunks(data_dir, df_pacientes, df_medicos, args.chunksize, args.formato,
+                                                     csv=args.csv, estrela=args.dataset_final == "estrela")
+            etapa.linhas_saida = int(acumulador.frequencia.sum())
+        print("\n Calculando RFM a partir dos agregados parciais...")
+        with report.stage("rfm", linhas_entrada=etapa.linhas_saida) as etapa:
+            rfm = acumulador.to_frame(ref_date)
+            etapa.linhas_saida = len(rfm)
+        print(" RFM calculado!")
+    else:
+        with report.stage("carregar") as etapa:
+            df_pacientes, df_consultas, df_medicos = load_inputs(data_dir)
+            etapa.linhas_saida = len(df_pacientes) + len(df_consultas) + len(df_medicos)
+
+        # 3-4. INTEGRAR E SALVAR DATASET FINAL
+        save_dataset_final(df_pacientes, df_consultas, df_medicos, data_dir, args, report=report)
+
+        # 5. RFM (R, F e M numa única agregação vetorizada sobre os dias inteiros)
+        print("\n Calculando RFM...")
+        with report.stage("rfm", linhas_entrada=len(df_consultas)) as etapa:
+            acumulador = RFMAccumulator().update_frame(df_consultas)
+            rfm = acumulador.to_frame(ref_date)
+            etapa.linhas_saida = len(rfm)
+        print(" RFM calculado!")
+        del df_consultas
+
+    with report.stage("estado_rfm"):
+        save_state(acumulador, os.path.join(data_dir, ESTADO_RFM), ref_date)
+
+    if args.validar_k:
+        with report.stage("selecao_k", linhas_entrada=len(rfm)):
+            select_k(rfm, data_dir, args)
+
+    rfm, kmeans, model = train_and_score(rfm, args.cluster_engine, load_centroids(models_dir), k=args.k,
+                                         n_jobs=args.n_jobs, report=report)
+    avaliacao = None
+    if not args.sem_avaliacao:
+        avaliacao = evaluate(rfm, args, report)
+    with report.stage("salvar_modelos"):
+        path_modelos = save_models(kmeans, model, rfm[FEATURES], models_dir, ref_date=ref_date,
+                                   cluster_engine=args.cluster_engine, avaliacao=avaliacao)
+    print(f" Modelos salvos em: {path_modelos}")
+
+    rfm, final_path, resumo_path = save_final(rfm, df_pacientes, data_dir, formato=args.formato, csv=args.csv,
+                                              report=report)
+    if args.backend == "sqlite":
+        with report.stage("gravar_scores_banco", linhas_entrada=len(rfm)) as etapa:
+            etapa.linhas_saida = save_scores(engine, rfm)
+
+    # Cubo para os painéis por especialidade/médico: as consultas são relidas em blocos (só 4 colunas)
+    print("\n Montando o cubo de consultas (médico x plano x mês x cluster)...")
+    with report.stage("cubo", linhas_entrada=len(rfm)) as etapa:
+        cubo = build_cube(data_dir, rfm[["id_paciente", "cluster_rfm"]], args.chunksize or CHUNKSIZE_CUBO)
+        cubo_path = save_table(cubo, CUBO, data_dir, formato=args.formato)
+        etapa.linhas_saida = len(cubo)
+
+    print("\n Arquivo final salvo!")
+    print(final_path)
+    print(resumo_path)
+    print(cubo_path)
+    if args.backend == "sqlite":
+        print(database_path(data_dir))
+    print(" Pacientes processados:", len(rfm))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    data_dir = args.data_dir
+    models_dir = args.models_dir or os.path.join(data_dir, "models")
+
+    print(" Diretório do projeto:", PROJECT_ROOT)
+    print(" Pasta de dados:", data_dir)
+
+    modo = "incremental" if args.incremental else "selecionar_k" if args.selecionar_k else "completo"
+    perfil = None
+    if args.perfil:
+        perfil = (args.perfil, args.perfil_saida or os.path.join(data_dir, f"perfil_{args.perfil}.prof"))
+    report = RunReport(perfil=perfil, modo=modo, data_dir=os.path.abspath(data_dir), formato=args.formato,
+                       chunksize=args.chunksize, backend=args.backend, dataset_final=args.dataset_final,
+                       cluster_engine=args.cluster_engine, k=args.k, ref_date=args.ref_date)
+
+    if args.incremental:
+        run_incremental(args, data_dir, models_dir, report)
+    elif args.selecionar_k:
+        # Usa o estado RFM da última execução quando existir (não relê as consultas)
+        path_estado = os.path.join(data_dir, ESTADO_RFM)
+        with report.stage("rfm") as etapa:
+            if os.path.exists(path_estado):
+                acumulador, ref_estado = load_state(path_estado)
+                rfm = acumulador.to_frame(args.ref_date or ref_estado)
+            else:
+                df_consultas = load_table("dados_consultas", data_dir)
+                rfm = RFMAccumulator().update_frame(df_consultas).to_frame(args.ref_date or REF_DATE)
+            etapa.linhas_saida = len(rfm)
+        with report.stage("selecao_k", linhas_entrada=len(rfm)):
+            select_k(rfm, data_dir, args)
+    else:
+        run_full(args, data_dir, models_dir, report)
+
+    print("\n--- Tempo e memória por etapa ---")
+    for etapa in report.to_dict()["etapas"]:
+        print(format_stage(etapa))
+    print(report.save(args.relatorio or os.path.join(data_dir, RELATORIO)))
+    if perfil:
+        print(f" Perfil da etapa {perfil[0]}: {perfil[1]} (resumo em {os.path.splitext(perfil[1])[0]}.txt)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import time
+
+import pandas as pd
+
+from src.artifacts import DATA_DIR, FORMATO_PADRAO, load_table, save_table
+from src.rfm import RFMSnapshots
+
+# RFM "como era" em várias datas de corte, para treinar e validar previsões de churn com
+# rótulos reais: para cada (paciente, corte), as features usam só as consultas até o corte
+# e o rótulo olha as consultas do horizonte seguinte. As consultas são ordenadas uma vez;
+# cada corte é uma busca binária por paciente (src/rfm.RFMSnapshots), sem novo groupby.
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Gera a tabela longa de RFM por paciente em várias datas de corte.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--datas", nargs="+", default=None, metavar="AAAA-MM-DD",
+                        help="Datas de corte explícitas (em vez de --inicio/--fim/--frequencia).")
+    parser.add_argument("--inicio", default=None, help="Primeiro corte (padrão: 1 ano antes da última consulta).")
+    parser.add_argument("--fim", default=None, help="Último corte (padrão: a data da última consulta).")
+    parser.add_argument("--frequencia", default="MS",
+                        help="Intervalo entre cortes no formato do pandas (MS = início de cada mês, W = semanal).")
+    parser.add_argument("--horizonte-dias", type=int, default=180,
+                        help="Janela à frente do rótulo de churn (0 = sem rótulo).")
+    parser.add_argument("--saida", default="rfm_snapshots", help="Nome do artefato de saída em --data-dir.")
+    parser.add_argument("--formato", choices=["parquet", "feather", "csv"], default=FORMATO_PADRAO)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    inicio = time.perf_counter()
+    df_consultas = load_table("dados_consultas", args.data_dir, columns=["id_paciente", "data_consulta", "valor_consulta"])
+    snapshots = RFMSnapshots.from_frame(df_consultas)
+    ultima = pd.Timestamp(df_consultas["data_consulta"].max())
+    print(f" Consultas: {len(df_consultas)} | Pacientes: {len(snapshots.pacientes)} | Última consulta: {ultima.date()}")
+    del df_consultas
+
+    if args.datas:
+        datas = pd.to_datetime(args.datas)
+    else:
+        fim = pd.Timestamp(args.fim) if args.fim else ultima
+        datas = pd.date_range(args.inicio or fim - pd.DateOffset(years=1), fim, freq=args.frequencia)
+    if len(datas) == 0:
+        raise SystemExit(" Nenhuma data de corte no intervalo informado.")
+
+    tabela = snapshots.long_table(datas, horizonte_dias=args.horizonte_dias or None)
+    path = save_table(tabela, args.saida, args.data_dir, formato=args.formato)
+    print(f" Cortes: {len(datas)} ({datas[0].date()} a {datas[-1].date()}) | Linhas: {len(tabela)}"
+          f" | {time.perf_counter() - inicio:.1f}s")
+
+    if args.horizonte_dias:
+        print(f"\n--- Churn em {args.horizonte_dias} dias por corte (só cortes com o horizonte completo) ---")
+        completos = tabela[tabela["rotulo_completo"]]
+        resumo = completos.groupby("data_corte").agg(pacientes=("id_paciente", "size"), churn=("churn", "mean"))
+        for linha in resumo.itertuples():
+            print(f" {linha.Index.date()}: {linha.pacientes:>9,} pacientes | churn {linha.churn:.1%}")
+    print(path)
+
+
+if __name__ == "__main__":
+    main()
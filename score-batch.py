@@ -0,0 +1,60 @@
+import argparse
+import json
+import os
+import time
+
+from src.artifacts import DATA_DIR, FORMATO_PADRAO
+from src.batch_scoring import CHUNKSIZE, score_batch
+from src.models import resolve_version
+from src.rfm import load_state
+
+# Pontuação em lote com os modelos já treinados pelo process-data.py.
+# Treino e pontuação rodam de forma independente: este script nunca re-treina.
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pontua uma tabela RFM com os modelos salvos (K-Means + Random Forest).")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--models-dir", default=None, help="Pasta dos modelos (padrão: <data-dir>/models).")
+    parser.add_argument("--versao", default=None, help="Versão do modelo (padrão: a mais recente, em LATEST).")
+    parser.add_argument("--entrada", default=None,
+                        help="Tabela RFM (Parquet/Feather/CSV com id_paciente, recencia_dias, frequencia_consultas, "
+                             "valor_monetario). Padrão: o estado RFM salvo (rfm_estado.parquet) na --ref-date.")
+    parser.add_argument("--ref-date", default=None,
+                        help="Data de referência para montar o RFM a partir do estado (padrão: a do estado).")
+    parser.add_argument("--saida", default="scores_batch", help="Nome do artefato de saída em --data-dir.")
+    parser.add_argument("--formato", choices=["parquet", "feather", "csv"], default=FORMATO_PADRAO)
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    parser.add_argument("--workers", type=int, default=None, help="Processos do pool (padrão: todos os núcleos).")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    models_dir = args.models_dir or os.path.join(args.data_dir, "models")
+    path_versao = resolve_version(models_dir, args.versao)
+    if path_versao is None:
+        raise FileNotFoundError(f" Modelos não encontrados em:\n{models_dir}\nRode o process-data.py completo antes.")
+    with open(os.path.join(path_versao, "metadata.json"), encoding="utf-8") as f:
+        versao = json.load(f)["versao"]
+    print(" Versão do modelo:", versao)
+
+    if args.entrada:
+        fonte = args.entrada
+        print(" Entrada:", fonte)
+    else:
+        acumulador, ref_estado = load_state(os.path.join(args.data_dir, "rfm_estado.parquet"))
+        fonte = acumulador.to_frame(args.ref_date or ref_estado)
+        print(f" Entrada: estado RFM ({len(fonte)} pacientes, ref. {args.ref_date or ref_estado})")
+
+    inicio = time.perf_counter()
+    path, linhas = score_batch(fonte, args.saida, args.data_dir, models_dir, versao,
+                               chunksize=args.chunksize, workers=args.workers, formato=args.formato)
+    segundos = time.perf_counter() - inicio
+
+    print(f"\n Pacientes pontuados: {linhas} em {segundos:.1f}s ({linhas / max(segundos, 1e-9):,.0f}/s)")
+    print(path)
+
+
+if __name__ == "__main__":
+    main()
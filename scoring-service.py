@@ -0,0 +1,122 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+from src.artifacts import DATA_DIR
+from src.models import load_models
+from src.rfm import load_state
+from src.scoring_service import MAX_BATCH, MAX_WAIT_MS, PatientIndex, make_server, run_load
+from src.similarity import load_index
+
+# Serviço local de pontuação: carrega K-Means e Random Forest uma vez e responde
+#   GET  /pacientes/<id>  -> RFM do paciente (estado salvo) + cluster e score
+#   GET  /pacientes/<id>/similares?k=10 -> pacientes mais parecidos (índice do pipeline)
+#   POST /score           -> cluster e score para RFM informado (objeto ou lista)
+#   GET  /health, /stats
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serviço local de pontuação de engajamento e cluster RFM.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    serve = sub.add_parser("serve", help="Sobe o serviço HTTP.")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8502)
+    serve.add_argument("--data-dir", default=DATA_DIR)
+    serve.add_argument("--models-dir", default=None, help="Padrão: <data-dir>/models.")
+    serve.add_argument("--versao", default=None, help="Versão do modelo (padrão: a mais recente).")
+    serve.add_argument("--ref-date", default=None, help="Data de referência da Recência (padrão: a do estado RFM).")
+    serve.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    serve.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+
+    carga = sub.add_parser("loadtest", help="Gerador de carga: mede p50/p99 e vazão.")
+    carga.add_argument("--url", default=None,
+                       help="host:porta de um serviço já no ar. Sem isso, sobe um serviço temporário.")
+    carga.add_argument("--data-dir", default=DATA_DIR)
+    carga.add_argument("--total", type=int, default=2000)
+    carga.add_argument("--concorrencia", type=int, default=16)
+    carga.add_argument("--modo", choices=["paciente", "rfm"], default="paciente",
+                       help="paciente: GET /pacientes/<id>; rfm: POST /score.")
+    return parser.parse_args()
+
+
+def serve(args):
+    models_dir = args.models_dir or os.path.join(args.data_dir, "models")
+    kmeans, model, metadata = load_models(models_dir, args.versao)
+    pacientes = None
+    path_estado = os.path.join(args.data_dir, "rfm_estado.parquet")
+    if os.path.exists(path_estado):
+        acumulador, ref_estado = load_state(path_estado)
+        pacientes = PatientIndex(acumulador, args.ref_date or ref_estado)
+
+    servidor = make_server(args.host, args.port, kmeans, model, pacientes, similares=load_index(args.data_dir),
+                           info={"versao": metadata.get("versao"), "ref_date": pacientes.ref_date if pacientes else None},
+                           max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    print(f" Serviço de pontuação em http://{args.host}:{servidor.server_port} (modelo {metadata.get('versao')})", flush=True)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _esperar(host, port, timeout=60):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        try:
+            with urllib.request.urlopen(f"http://{host}:{port}/health", timeout=1) as r:
+                return json.load(r)
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"serviço não respondeu em {host}:{port}")
+
+
+def loadtest(args):
+    processo = None
+    if args.url:
+        host, port = args.url.rsplit(":", 1)
+        port = int(port)
+    else:
+        # Serviço em processo separado, para o cliente não disputar o GIL com o servidor
+        host, port = "127.0.0.1", _porta_livre()
+        processo = subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve", "--port", str(port),
+                                     "--data-dir", args.data_dir], stdout=subprocess.DEVNULL)
+    try:
+        _esperar(host, port)
+        ids = None
+        if args.modo == "paciente":
+            acumulador, _ = load_state(os.path.join(args.data_dir, "rfm_estado.parquet"))
+            ids = acumulador.patient_ids()
+        resultado = run_load(host, port, total=args.total, concorrencia=args.concorrencia, ids=ids)
+        with urllib.request.urlopen(f"http://{host}:{port}/stats") as r:
+            resultado["media_por_lote"] = round(json.load(r)["media_por_lote"], 2)
+    finally:
+        if processo is not None:
+            processo.terminate()
+            processo.wait()
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
+    return resultado
+
+
+def main():
+    args = parse_args()
+    if args.comando == "serve":
+        serve(args)
+    else:
+        loadtest(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+import os
+import shutil
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+DATA_DIR = os.path.join(PROJECT_ROOT, 'data')
+
+# Formato padrão dos artefatos do pipeline. CSV fica apenas como exportação opcional.
+FORMATO_PADRAO = 'parquet'
+EXTENSOES = {'parquet': '.parquet', 'feather': '.feather', 'csv': '.csv'}
+# Ordem de preferência na leitura: os formatos colunares primeiro
+ORDEM_LEITURA = ('parquet', 'feather', 'csv')
+
+# Tipos de cada tabela do pipeline. Datas são gravadas como date32 e strings repetidas
+# como dicionário (category), para que a leitura não precise reinterpretar texto.
+SCHEMAS = {
+    'dados_pacientes': {
+        'id_paciente': 'int32',
+        'nome': 'string',
+        'sexo': 'category',
+        'data_nascimento': 'date',
+        'cidade': 'category',
+        'plano_saude': 'category',
+        'possui_doenca_cronica': 'bool',
+        'data_cadastro': 'date',
+    },
+    'dados_medicos': {
+        'id_medico': 'int32',
+        'nome': 'string',
+        'sexo': 'category',
+        'especialidade': 'category',
+        'crm': 'string',
+        'cidade': 'category',
+        'telefone': 'string',
+    },
+    'dados_consultas': {
+        'id_paciente': 'int32',
+        'id_medico': 'int32',
+        'data_consulta': 'date',
+        'valor_consulta': 'int32',
+    },
+    # dataset_final explodido e artefatos do modo estrela: só as datas têm tipo fixo,
+    # os inteiros já chegam reduzidos e as strings como category
+    'dataset_final': {'data_consulta': 'date', 'data_nascimento': 'date', 'data_cadastro': 'date'},
+    'dataset_final_fato': {'data_consulta': 'date'},
+    'dataset_final_dim_pacientes': {'data_nascimento': 'date', 'data_cadastro': 'date'},
+    'dataset_final_dim_medicos': {},
+    # RFM por (paciente, data de corte) do rfm-backtest.py, com o rótulo de churn à frente
+    'rfm_snapshots': {
+        'id_paciente': 'int32',
+        'data_corte': 'date',
+        'recencia_dias': 'int32',
+        'valor_monetario': 'int64',
+        'frequencia_consultas': 'int32',
+        'consultas_futuras': 'int32',
+    },
+    # Cubo (médico, plano, mês, cluster) do process-data.py, lido pelos painéis do dashboard
+    'cubo_consultas': {
+        'especialidade': 'category',
+        'id_medico': 'int32',
+        'plano_saude': 'category',
+        'mes': 'date',
+        'cluster_rfm': 'int32',
+        'consultas': 'int32',
+        'receita': 'int64',
+        'pacientes': 'int32',
+    },
+    'pacientes_engajamento_score': {
+        'id_paciente': 'int32',
+        'recencia_dias': 'int32',
+        'valor_monetario': 'int64',
+        'frequencia_consultas': 'int32',
+        'cluster_rfm': 'int32',
+        'frequencia_prevista_reg': 'float64',
+        'nome': 'string',
+        'data_nascimento': 'date',
+        'sexo': 'category',
+        'plano_saude': 'category',
+        'cidade': 'category',
+        'possui_doenca_cronica': 'bool',
+        'data_cadastro': 'date',
+        'idade': 'Int16',
+    },
+}
+
+
+def artifact_path(nome, data_dir=DATA_DIR, formato=FORMATO_PADRAO):
+    return os.path.join(data_dir, nome + EXTENSOES[formato])
+
+
+# Tabelas que recebem acréscimos (modo incremental) viram uma pasta <nome>/ com uma parte por
+# remessa, lidas juntas pelo pyarrow.dataset: acrescentar não regrava o histórico
+PREFIXO_PARTE = 'part-'
+
+
+def dataset_path(nome, data_dir=DATA_DIR):
+    return os.path.join(data_dir, nome)
+
+
+def _parts(path):
+    return sorted(os.path.join(path, f) for f in os.listdir(path)
+                  if f.startswith(PREFIXO_PARTE) and f.endswith(('.parquet', '.feather')))
+
+
+def _is_dataset(path):
+    return os.path.isdir(path) and bool(_parts(path))
+
+
+def _dataset(path):
+    partes = _parts(path)
+    return ds.dataset(partes, format='parquet' if partes[0].endswith('.parquet') else 'ipc')
+
+
+def remove_dataset(nome, data_dir=DATA_DIR):
+    # Uma pasta de partes de uma versão anterior seria lida no lugar da tabela regravada
+    path = dataset_path(nome, data_dir)
+    if _is_dataset(path):
+        shutil.rmtree(path)
+
+
+def find_artifact(nome, data_dir=DATA_DIR):
+    # Prioriza a pasta de partes e os formatos colunares; o CSV só é usado quando é o único disponível
+    if _is_dataset(dataset_path(nome, data_dir)):
+        return dataset_path(nome, data_dir)
+    for formato in ORDEM_LEITURA:
+        path = artifact_path(nome, data_dir, formato)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def remove_shadowing(nome, data_dir=DATA_DIR, formato=FORMATO_PADRAO):
+    # Apaga só as cópias que find_artifact leria no lugar da nova: as colunares de formato prioritário,
+    # gravadas pelo próprio pipeline. O CSV (versionado no repositório) vem por último e nunca é apagado
+    for outro in ORDEM_LEITURA[:ORDEM_LEITURA.index(formato)]:
+        path = artifact_path(nome, data_dir, outro)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def artifact_version(path):
+    # Identifica o conteúdo atual do arquivo (chave de cache); muda a cada regravação
+    if path is None or not os.path.exists(path):
+        return None
+    if os.path.isdir(path):
+        # Pasta de partes: muda quando uma parte é acrescentada ou regravada
+        infos = [os.stat(parte) for parte in _parts(path)]
+        return f"{max(i.st_mtime_ns for i in infos)}-{sum(i.st_size for i in infos)}-{len(infos)}"
+    info = os.stat(path)
+    return f"{info.st_mtime_ns}-{info.st_size}"
+
+
+def apply_schema(df, nome):
+    schema = SCHEMAS.get(nome, {})
+    df = df.copy()
+    for coluna, tipo in schema.items():
+        if coluna not in df.columns:
+            continue
+        if tipo == 'date':
+            df[coluna] = pd.to_datetime(df[coluna], errors='coerce').astype('datetime64[s]')
+        elif tipo == 'bool' and df[coluna].dtype != bool:
+            df[coluna] = df[coluna].astype(str).map({'True': True, 'False': False}).astype(bool)
+        else:
+            df[coluna] = df[coluna].astype(tipo)
+    return df
+
+
+def _to_arrow(df, nome):
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    # datetime64 do pandas vira timestamp; as colunas de data do schema são gravadas como date32
+    # e os dicionários usam sempre índice int32, para o schema ser o mesmo em todos os lotes
+    datas = [c for c, tipo in SCHEMAS.get(nome, {}).items() if tipo == 'date']
+    for i, campo in enumerate(tabela.schema):
+        if campo.name in datas:
+            tabela = tabela.set_column(i, campo.name, tabela.column(i).cast(pa.date32()))
+        elif pa.types.is_dictionary(campo.type):
+            tabela = tabela.set_column(i, campo.name, tabela.column(i).cast(pa.dictionary(pa.int32(), campo.type.value_type)))
+    return tabela
+
+
+def _to_pandas(tabela):
+    # date_as_object=False mantém as datas como datetime64 (sem objetos Python por linha)
+    return tabela.to_pandas(date_as_object=False)
+
+
+def write_table(df, path, nome):
+    # nome identifica o schema da tabela; o formato vem da extensão do arquivo
+    df = apply_schema(df, nome)
+    if path.endswith('.parquet'):
+        pq.write_table(_to_arrow(df, nome), path)
+    elif path.endswith(('.feather', '.arrow')):
+        feather.write_feather(_to_arrow(df, nome), path)
+    else:
+        df.to_csv(path, index=False, encoding='utf-8', errors='replace')
+    return path
+
+
+def save_table(df, nome, data_dir=DATA_DIR, formato=FORMATO_PADRAO, csv=False):
+    os.makedirs(data_dir, exist_ok=True)
+    remove_dataset(nome, data_dir)
+    path = write_table(df, artifact_path(nome, data_dir, formato), nome)
+    if csv and formato != 'csv':
+        write_table(df, artifact_path(nome, data_dir, 'csv'), nome)
+    return path
+
+
+def read_table(path, columns=None, nome=None):
+    # Leitura memory-mapped e com projeção de colunas para os formatos colunares.
+    # No CSV, os tipos vêm do schema de `nome` (padrão: o nome do arquivo).
+    if os.path.isdir(path):
+        return _to_pandas(_dataset(path).to_table(columns=columns))
+    if path.endswith('.parquet'):
+        return _to_pandas(pq.read_table(path, columns=columns, memory_map=True))
+    if path.endswith(('.feather', '.arrow')):
+        return _to_pandas(feather.read_table(path, columns=columns, memory_map=True))
+    nome = nome or os.path.splitext(os.path.basename(path))[0]
+    df = pd.read_csv(path, usecols=columns)
+    return apply_schema(df, nome)
+
+
+def table_columns(path):
+    # Colunas de um artefato sem ler os dados (só o schema/cabeçalho)
+    if os.path.isdir(path):
+        return _dataset(path).schema.names
+    if path.endswith('.parquet'):
+        return pq.read_schema(path, memory_map=True).names
+    if path.endswith(('.feather', '.arrow')):
+        with pa.memory_map(path) as fonte:
+            return pa.ipc.open_file(fonte).schema.names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def iter_table(path, chunksize, columns=None):
+    # Leitura em blocos de até chunksize linhas, sem carregar o arquivo inteiro
+    if os.path.isdir(path):
+        for lote in _dataset(path).to_batches(columns=columns, batch_size=chunksize):
+            yield _to_pandas(pa.Table.from_batches([lote]))
+    elif path.endswith('.parquet'):
+        arquivo = pq.ParquetFile(path, memory_map=True)
+        for lote in arquivo.iter_batches(batch_size=chunksize, columns=columns):
+            yield _to_pandas(pa.Table.from_batches([lote]))
+    elif path.endswith(('.feather', '.arrow')):
+        with pa.memory_map(path) as fonte:
+            leitor = pa.ipc.open_file(fonte)
+            for i in range(leitor.num_record_batches):
+                lote = pa.Table.from_batches([leitor.get_batch(i)])
+                if columns is not None:
+                    lote = lote.select(columns)
+                for inicio in range(0, lote.num_rows, chunksize):
+                    yield _to_pandas(lote.slice(inicio, chunksize))
+    else:
+        nome = os.path.splitext(os.path.basename(path))[0]
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=chunksize):
+            yield apply_schema(chunk, nome)
+
+
+def load_table(nome, data_dir=DATA_DIR, columns=None):
+    path = find_artifact(nome, data_dir)
+    if path is None:
+        raise FileNotFoundError(f" Arquivo não encontrado:\n{artifact_path(nome, data_dir)} (ou .csv)")
+    return read_table(path, columns=columns)
+
+
+class BatchWriter:
+    """Grava um artefato lote a lote, sem manter a tabela inteira em memória."""
+
+    def __init__(self, nome, data_dir=DATA_DIR, formato=FORMATO_PADRAO):
+        os.makedirs(data_dir, exist_ok=True)
+        remove_dataset(nome, data_dir)
+        self.nome = nome
+        self.formato = formato
+        self.path = artifact_path(nome, data_dir, formato)
+        self.linhas = 0
+        self._writer = None
+        self._schema = None
+
+    def write(self, df):
+        df = apply_schema(df, self.nome)
+        if self.formato == 'csv':
+            df.to_csv(self.path, index=False, mode='a' if self.linhas else 'w',
+                      header=not self.linhas, encoding='utf-8', errors='replace')
+        else:
+            tabela = _to_arrow(df, self.nome)
+            if self._writer is None:
+                self._schema = tabela.schema
+                if self.formato == 'parquet':
+                    self._writer = pq.ParquetWriter(self.path, tabela.schema)
+                else:
+                    self._writer = pa.ipc.new_file(self.path, tabela.schema)
+            elif tabela.schema != self._schema:
+                # Ex.: coluna só com nulos num lote; os tipos do primeiro lote valem para o arquivo
+                tabela = tabela.cast(self._schema)
+            self._writer.write_table(tabela)
+        self.linhas += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def append_table(df, nome, data_dir=DATA_DIR):
+    """Acrescenta as linhas de `df` ao artefato `nome` (e à exportação CSV, se existir).
+
+    O custo é o da remessa, não o do histórico: no CSV as linhas vão para o fim do arquivo;
+    a versão colunar vira uma pasta de partes (o arquivo único passa a ser a primeira parte,
+    só renomeado) e a remessa é gravada como uma parte nova.
+    """
+    paths = []
+    path = find_artifact(nome, data_dir)
+    if path is not None and not path.endswith('.csv'):
+        pasta = dataset_path(nome, data_dir)
+        if not os.path.isdir(path):
+            os.makedirs(pasta, exist_ok=True)
+            os.replace(path, os.path.join(pasta, PREFIXO_PARTE + '0' * 20 + os.path.splitext(path)[1]))
+        primeira = _parts(pasta)[0]
+        schema = _dataset(pasta).schema
+        # Tipos da primeira parte (ex.: coluna só com nulos na remessa), para as partes serem lidas juntas
+        tabela = _to_arrow(apply_schema(df[schema.names], nome), nome).cast(schema)
+        destino = os.path.join(pasta, f"{PREFIXO_PARTE}{datetime.now():%Y%m%d%H%M%S%f}{os.path.splitext(primeira)[1]}")
+        if destino.endswith('.parquet'):
+            pq.write_table(tabela, destino + '.tmp')
+        else:
+            feather.write_feather(tabela, destino + '.tmp')
+        os.replace(destino + '.tmp', destino)
+        paths.append(destino)
+    path_csv = artifact_path(nome, data_dir, 'csv')
+    if os.path.exists(path_csv):
+        apply_schema(df[table_columns(path_csv)], nome).to_csv(path_csv, index=False, mode='a', header=False,
+                                                                encoding='utf-8', errors='replace')
+        paths.append(path_csv)
+    return paths
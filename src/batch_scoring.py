@@ -0,0 +1,53 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .artifacts import DATA_DIR, BatchWriter, iter_table
+from .models import FEATURES, MODELS_DIR, load_models, score_rfm
+
+CHUNKSIZE = 500_000
+
+# Modelos carregados uma única vez por processo do pool (no initializer)
+_modelos_worker = None
+
+
+def _init_worker(models_dir, versao):
+    global _modelos_worker
+    kmeans, model, _ = load_models(models_dir, versao)
+    # O paralelismo vem do pool; cada worker prevê num único núcleo
+    model.set_params(n_jobs=1)
+    _modelos_worker = (kmeans, model)
+
+
+def _score_chunk(df):
+    kmeans, model = _modelos_worker
+    return score_rfm(df, kmeans, model)
+
+
+def _iter_chunks(fonte, chunksize):
+    # fonte: caminho de um artefato RFM (Parquet/Feather/CSV) ou um DataFrame já em memória
+    colunas = ["id_paciente"] + FEATURES
+    if isinstance(fonte, str):
+        yield from iter_table(fonte, chunksize, columns=colunas)
+    else:
+        for inicio in range(0, len(fonte), chunksize):
+            yield fonte.iloc[inicio:inicio + chunksize][colunas]
+
+
+def score_batch(fonte, nome_saida="scores_batch", data_dir=DATA_DIR, models_dir=MODELS_DIR, versao=None,
+                chunksize=CHUNKSIZE, workers=None, formato="parquet"):
+    """Pontua uma tabela RFM em blocos vetorizados distribuídos num pool de processos.
+
+    Os blocos são gravados na ordem de entrada; no máximo 2 blocos por worker ficam em memória.
+    """
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(models_dir, versao)) as executor, \
+            BatchWriter(nome_saida, data_dir, formato=formato) as writer:
+        pendentes = deque()
+        for chunk in _iter_chunks(fonte, chunksize):
+            pendentes.append(executor.submit(_score_chunk, chunk))
+            if len(pendentes) >= 2 * workers:
+                writer.write(pendentes.popleft().result())
+        while pendentes:
+            writer.write(pendentes.popleft().result())
+    return writer.path, writer.linhas
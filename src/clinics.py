@@ -0,0 +1,116 @@
+import json
+import multiprocessing
+import os
+import resource
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from .artifacts import DATA_DIR, find_artifact
+
+# Modo multi-clínica: cada clínica é uma partição em <raiz>/clinicas/<clinica>/ com a mesma
+# estrutura de uma pasta data/ (entradas, dataset_final, modelos, arquivo final, resumo...).
+# O índice consolidado <raiz>/clinicas/indice.json lista as partições com a situação da
+# última execução e os KPIs principais; o dashboard escolhe a clínica por ele e só carrega
+# os artefatos daquela partição.
+CLINICAS = "clinicas"
+INDICE = "indice.json"
+LOG = "process-data.log"
+# Importados uma vez pelo servidor de processos do pool (herdados por todas as partições)
+PRELOAD = ["__main__", "numpy", "pandas", "pyarrow.parquet", "sklearn.cluster", "sklearn.ensemble", "joblib"]
+
+
+def clinics_root(raiz=DATA_DIR):
+    return os.path.join(raiz, CLINICAS)
+
+
+def clinic_dir(raiz, clinica):
+    return os.path.join(clinics_root(raiz), clinica)
+
+
+def discover(raiz=DATA_DIR):
+    # Partições existentes: subpastas com o arquivo de consultas
+    pasta = clinics_root(raiz)
+    if not os.path.isdir(pasta):
+        return []
+    return sorted(nome for nome in os.listdir(pasta)
+                  if find_artifact("dados_consultas", os.path.join(pasta, nome)) is not None)
+
+
+def partition_size(data_dir):
+    # Tamanho em bytes das consultas: ordem de execução (maiores primeiro) e estimativa de carga
+    path = find_artifact("dados_consultas", data_dir)
+    if path is None:
+        return 0
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def load_index(raiz=DATA_DIR):
+    path = os.path.join(clinics_root(raiz), INDICE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_index(raiz, clinicas):
+    # Mantém as clínicas que não rodaram nesta execução; gravação atômica (o app pode estar lendo)
+    indice = load_index(raiz) or {"clinicas": []}
+    por_nome = {c["clinica"]: c for c in indice["clinicas"]}
+    por_nome.update({c["clinica"]: c for c in clinicas})
+    indice = {"atualizado_em": datetime.now().isoformat(timespec="seconds"),
+              "clinicas": [por_nome[nome] for nome in sorted(por_nome)]}
+    path = os.path.join(clinics_root(raiz), INDICE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(indice, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def _init_worker(limite_mb):
+    # Um núcleo por partição: o paralelismo vem do pool, não das threads do BLAS/OpenMP
+    from threadpoolctl import threadpool_limits
+
+    threadpool_limits(1)
+    if limite_mb:
+        # Limite do segmento de dados (heap e mapeamentos anônimos, onde ficam os arrays; as
+        # bibliotecas carregadas não contam): acima dele as alocações falham com MemoryError
+        # dentro da partição, sem derrubar as outras nem a máquina
+        limite = int(limite_mb) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_DATA, (limite, limite))
+
+
+def run_partitions(funcao, tarefas, workers=None, limite_mb=None):
+    """Roda `funcao(**kwargs)` para cada clínica de `tarefas` ({clinica: kwargs}) num pool limitado.
+
+    Cada partição roda num processo novo (max_tasks_per_child=1), com no máximo `limite_mb` MB de
+    dados. As maiores (kwargs["data_dir"]) saem primeiro, para o pool não terminar
+    esperando uma partição grande sozinha. Devolve (clinica, situacao, resultado ou mensagem)
+    conforme terminam, com situacao em "ok", "sem_memoria" ou "erro".
+    """
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tarefas) or 1))
+    ordem = sorted(tarefas, key=lambda c: -partition_size(tarefas[c].get("data_dir", "")))
+    # forkserver: cada processo novo nasce de um servidor que já importou o script e as
+    # bibliotecas (spawn reimportaria pandas/sklearn a cada partição)
+    contexto = multiprocessing.get_context("forkserver")
+    contexto.set_forkserver_preload(PRELOAD)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=contexto, max_tasks_per_child=1,
+                             initializer=_init_worker, initargs=(limite_mb,)) as executor:
+        futuros = {executor.submit(funcao, **tarefas[clinica]): clinica for clinica in ordem}
+        for futuro in as_completed(futuros):
+            clinica = futuros[futuro]
+            try:
+                yield clinica, "ok", futuro.result()
+            except MemoryError:
+                yield clinica, "sem_memoria", f"limite de {limite_mb} MB excedido"
+            except BrokenProcessPool as e:
+                # Processo morto de fora (ex.: OOM killer); as partições pendentes também falham
+                yield clinica, "erro", f"processo encerrado: {e}"
+            except SystemExit as e:
+                # Não é Exception: saída do argparse ou validação do process-data.py que encerra a partição
+                yield clinica, "erro", f"SystemExit: {e.code}"
+            except Exception as e:  # o erro de uma partição não interrompe as demais
+                yield clinica, "erro", f"{type(e).__name__}: {e}"
@@ -0,0 +1,216 @@
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import time
+
+from .artifacts import PROJECT_ROOT, artifact_version
+
+# Pipeline em etapas com entradas e saídas declaradas. Cada etapa tem uma chave: o hash das
+# entradas (conteúdo dos arquivos), dos parâmetros e do código dela. Se a chave e as saídas
+# atuais batem com a última execução, a etapa é pulada; se a chave já foi vista antes, as
+# saídas voltam do cache (objetos/<chave>); senão a etapa roda e as saídas vão para o cache.
+# Como as chaves usam o conteúdo das saídas das etapas anteriores, uma etapa que regrava
+# exatamente os mesmos bytes não invalida as seguintes.
+CACHE = ".pipeline_cache"
+# Entradas do cache mantidas por etapa (as mais antigas são apagadas)
+MANTER_POR_ETAPA = 3
+
+
+def sha256_file(path, bloco=1 << 20):
+    h = hashlib.sha256()
+    if os.path.isdir(path):
+        # Tabela em partes (ver artifacts.append_table): hash das partes, em ordem
+        for parte in sorted(os.listdir(path)):
+            h.update(parte.encode())
+            h.update(sha256_file(os.path.join(path, parte), bloco).encode())
+        return h.hexdigest()
+    with open(path, "rb") as f:
+        while dados := f.read(bloco):
+            h.update(dados)
+    return h.hexdigest()
+
+
+class HashCache:
+    """Hash do conteúdo por arquivo, recalculado só quando muda a data de gravação ou o tamanho."""
+
+    def __init__(self, path):
+        self.path = path
+        self._hashes = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self._hashes = json.load(f)
+
+    def digest(self, path):
+        versao = artifact_version(path)
+        chave = os.path.abspath(path)
+        registro = self._hashes.get(chave)
+        if registro is None or registro["versao"] != versao:
+            registro = {"versao": versao, "sha256": sha256_file(path)}
+            self._hashes[chave] = registro
+        return registro["sha256"]
+
+    def save(self):
+        # Só arquivos que ainda existem
+        self._hashes = {p: r for p, r in self._hashes.items() if os.path.exists(p)}
+        _write_json(self.path, self._hashes)
+
+
+def _write_json(path, dados):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(dados, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _link_or_copy(origem, destino):
+    # Hard link (sem cópia) quando origem e destino estão no mesmo sistema de arquivos
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    if os.path.exists(destino):
+        os.remove(destino)
+    try:
+        os.link(origem, destino)
+    except OSError:
+        shutil.copy2(origem, destino)
+
+
+class Etapa:
+    """Uma etapa do pipeline: `funcao(data_dir, **params, **opcoes)` lê `entradas` e grava `saidas`
+    (caminhos relativos a data_dir).
+
+    `params` entram na chave; `opcoes` não (ex.: número de processos, que não muda o resultado).
+    `codigo` lista os módulos (relativos à raiz do projeto) cujo conteúdo também entra na chave,
+    além do código-fonte da própria função.
+    """
+
+    def __init__(self, nome, funcao, entradas=(), saidas=(), params=None, opcoes=None, codigo=()):
+        self.nome = nome
+        self.funcao = funcao
+        self.entradas = list(entradas)
+        self.saidas = list(saidas)
+        self.params = params or {}
+        self.opcoes = opcoes or {}
+        self.codigo = list(codigo)
+
+
+class Pipeline:
+    def __init__(self, etapas, data_dir):
+        self.etapas = {etapa.nome: etapa for etapa in etapas}
+        self.data_dir = data_dir
+        self.cache_dir = os.path.join(data_dir, CACHE)
+        self.hashes = HashCache(os.path.join(self.cache_dir, "hashes.json"))
+        self._path_estado = os.path.join(self.cache_dir, "estado.json")
+        self.estado = {}
+        if os.path.exists(self._path_estado):
+            with open(self._path_estado, encoding="utf-8") as f:
+                self.estado = json.load(f)
+        self._produtor = {saida: etapa.nome for etapa in etapas for saida in etapa.saidas}
+
+    def _path(self, relativo):
+        return os.path.join(self.data_dir, relativo)
+
+    def dependencies(self, nome):
+        return [self._produtor[e] for e in self.etapas[nome].entradas if e in self._produtor]
+
+    def required(self, alvos):
+        # Etapas necessárias para os alvos, na ordem de declaração (já topológica)
+        necessarias = set()
+        pendentes = list(alvos)
+        while pendentes:
+            nome = pendentes.pop()
+            if nome not in necessarias:
+                necessarias.add(nome)
+                pendentes.extend(self.dependencies(nome))
+        return [nome for nome in self.etapas if nome in necessarias]
+
+    def key(self, etapa):
+        faltando = [e for e in etapa.entradas if not os.path.exists(self._path(e))]
+        if faltando:
+            raise FileNotFoundError(f" Entradas da etapa {etapa.nome} não encontradas: {', '.join(faltando)}")
+        codigo = {modulo: self.hashes.digest(os.path.join(PROJECT_ROOT, modulo)) for modulo in etapa.codigo}
+        codigo["funcao"] = hashlib.sha256(inspect.getsource(etapa.funcao).encode()).hexdigest()
+        conteudo = {
+            "etapa": etapa.nome,
+            "params": etapa.params,
+            "entradas": {e: self.hashes.digest(self._path(e)) for e in etapa.entradas},
+            "codigo": codigo,
+        }
+        return hashlib.sha256(json.dumps(conteudo, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _outputs_match(self, saidas, esperado, base):
+        return all(os.path.exists(os.path.join(base, s)) and self.hashes.digest(os.path.join(base, s)) == esperado[s]
+                   for s in saidas)
+
+    def _store(self, etapa, chave):
+        objeto = os.path.join(self.cache_dir, "objetos", etapa.nome, chave)
+        for saida in etapa.saidas:
+            _link_or_copy(self._path(saida), os.path.join(objeto, saida))
+        saidas = {s: self.hashes.digest(self._path(s)) for s in etapa.saidas}
+        _write_json(os.path.join(objeto, "saidas.json"), saidas)
+        self._prune(etapa.nome, manter=chave)
+        return saidas
+
+    def _restore(self, etapa, chave):
+        # Confere o conteúdo antes: um hard link pode ter sido sobrescrito no lugar por outro script
+        objeto = os.path.join(self.cache_dir, "objetos", etapa.nome, chave)
+        path_saidas = os.path.join(objeto, "saidas.json")
+        if not os.path.exists(path_saidas):
+            return None
+        with open(path_saidas, encoding="utf-8") as f:
+            saidas = json.load(f)
+        if not self._outputs_match(etapa.saidas, saidas, objeto):
+            shutil.rmtree(objeto, ignore_errors=True)
+            return None
+        for saida in etapa.saidas:
+            _link_or_copy(os.path.join(objeto, saida), self._path(saida))
+        os.utime(path_saidas)
+        return saidas
+
+    def _prune(self, nome, manter):
+        pasta = os.path.join(self.cache_dir, "objetos", nome)
+        # Mais recentes primeiro (o saidas.json é tocado a cada uso)
+        objetos = sorted((os.path.join(pasta, c) for c in os.listdir(pasta)), reverse=True,
+                         key=lambda o: os.path.getmtime(os.path.join(o, "saidas.json"))
+                         if os.path.exists(os.path.join(o, "saidas.json")) else 0)
+        for objeto in objetos[MANTER_POR_ETAPA:]:
+            if os.path.basename(objeto) != manter:
+                shutil.rmtree(objeto, ignore_errors=True)
+
+    def run(self, alvos=None, forcar=(), simular=False):
+        """Roda o mínimo necessário para os alvos (padrão: todas as etapas).
+
+        Devolve uma lista de (etapa, situação, segundos) com situação em
+        "em cache", "restaurada", "executada" ou, com simular=True, "executaria".
+        """
+        resultado = []
+        for nome in self.required(alvos or list(self.etapas)):
+            etapa = self.etapas[nome]
+            inicio = time.perf_counter()
+            if simular and any(s == "executaria" for n, s, _ in resultado if n in self.dependencies(nome)):
+                # A chave depende de saídas que ainda seriam regravadas
+                resultado.append((nome, "executaria", 0.0))
+                continue
+            chave = self.key(etapa)
+            anterior = self.estado.get(nome, {})
+            if nome not in forcar and anterior.get("chave") == chave and \
+                    self._outputs_match(etapa.saidas, anterior["saidas"], self.data_dir):
+                situacao = "em cache"
+            elif nome not in forcar and not simular and (saidas := self._restore(etapa, chave)) is not None:
+                situacao = "restaurada"
+                self.estado[nome] = {"chave": chave, "saidas": saidas}
+            elif simular:
+                situacao = "executaria"
+            else:
+                # Remove as saídas antes: o arquivo novo não reaproveita o inode de um hard link do cache
+                for saida in etapa.saidas:
+                    if os.path.exists(self._path(saida)):
+                        os.remove(self._path(saida))
+                etapa.funcao(self.data_dir, **etapa.params, **etapa.opcoes)
+                situacao = "executada"
+                self.estado[nome] = {"chave": chave, "saidas": self._store(etapa, chave)}
+            resultado.append((nome, situacao, time.perf_counter() - inicio))
+            if not simular:
+                _write_json(self._path_estado, self.estado)
+        self.hashes.save()
+        return resultado
@@ -0,0 +1,209 @@
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Acima deste número de pontos o gráfico de dispersão deixa de enviar um marcador SVG por
+# paciente: passa a mostrar a densidade agregada por célula (tamanho do payload fixo).
+LIMITE_PONTOS_SCATTER = 20_000
+# Pontos individuais (com hover completo) enviados ao ver uma região do gráfico
+AMOSTRA_REGIAO = 5_000
+
+
+def bin_scatter(df, x, y, grupo, valor=None, bins_x=60, bins_y=40, range_x=None, range_y=None, log_y=False):
+    """Agrega a dispersão numa grade 2D por grupo: uma linha por célula não vazia.
+
+    Devolve o centro e os limites de cada célula, o número de pontos e, com `valor`, a média
+    dessa coluna na célula. Com log_y, range_y é dado em log10 e os valores <= 0 (que não
+    aparecem num eixo logarítmico) ficam de fora.
+    """
+    vx = df[x].to_numpy(dtype=float)
+    vy = df[y].to_numpy(dtype=float)
+    visivel = np.isfinite(vx) & np.isfinite(vy)
+    if log_y:
+        visivel &= vy > 0
+        vy = np.log10(np.where(visivel, vy, 1.0))
+    if not visivel.any():
+        return pd.DataFrame(columns=[grupo, x, y, "x_min", "x_max", "y_min", "y_max", "pacientes"])
+
+    x0, x1 = range_x if range_x is not None else (vx[visivel].min(), vx[visivel].max())
+    y0, y1 = range_y if range_y is not None else (vy[visivel].min(), vy[visivel].max())
+    passo_x = (x1 - x0) / bins_x or 1.0
+    passo_y = (y1 - y0) / bins_y or 1.0
+    # Pontos fora do intervalo vão para a célula da borda
+    ix = np.clip(((vx - x0) // passo_x).astype(np.int64), 0, bins_x - 1)
+    iy = np.clip(((vy - y0) // passo_y).astype(np.int64), 0, bins_y - 1)
+
+    grupos = pd.Categorical(df[grupo])
+    celulas = bins_x * bins_y
+    visivel &= grupos.codes >= 0
+    codigo = (grupos.codes.astype(np.int64) * celulas + ix * bins_y + iy)[visivel]
+    tamanho = len(grupos.categories) * celulas
+    contagem = np.bincount(codigo, minlength=tamanho)
+    ocupadas = np.flatnonzero(contagem)
+
+    cx, cy = (ocupadas % celulas) // bins_y, ocupadas % bins_y
+    limites_y = np.stack([y0 + cy * passo_y, y0 + (cy + 1) * passo_y])
+    if log_y:
+        limites_y = 10 ** limites_y
+    resultado = pd.DataFrame({
+        grupo: grupos.categories[ocupadas // celulas],
+        x: x0 + (cx + 0.5) * passo_x,
+        y: 10 ** (y0 + (cy + 0.5) * passo_y) if log_y else y0 + (cy + 0.5) * passo_y,
+        "x_min": x0 + cx * passo_x,
+        "x_max": x0 + (cx + 1) * passo_x,
+        "y_min": limites_y[0],
+        "y_max": limites_y[1],
+        "pacientes": contagem[ocupadas],
+    })
+    if valor is not None:
+        soma = np.bincount(codigo, weights=df[valor].to_numpy(dtype=float)[visivel], minlength=tamanho)
+        resultado[valor] = soma[ocupadas] / contagem[ocupadas]
+    return resultado
+
+
+def sample_region(df, x, y, range_x, range_y, limite=AMOSTRA_REGIAO, random_state=42):
+    # Pontos de uma região (zoom), com amostra fixa quando passam do limite
+    regiao = df[df[x].between(*range_x) & df[y].between(*range_y)]
+    if len(regiao) > limite:
+        regiao = regiao.sample(n=limite, random_state=random_state)
+    return regiao
+
+
+# --- RESUMO PRÉ-CALCULADO DO DASHBOARD ---
+# Gerado pelo process-data.py junto com pacientes_engajamento_score: KPIs, agregados por cluster,
+# listas de risco já ordenadas e a grade de densidade. O app lê só este arquivo (poucos KB)
+# e a interação não depende do número de pacientes.
+RESUMO = "dashboard_resumo.json"
+# Muda quando o conteúdo do resumo muda; o app recalcula resumos de formato anterior
+FORMATO_RESUMO = 2
+TOP_N = 100
+# Faixa do eixo de valor (escala log) do gráfico de dispersão
+FAIXA_VALOR = (50, 6000)
+COLUNAS_RISCO = ['id_paciente', 'nome', 'cluster_rfm', 'idade', 'plano_saude',
+                 'recencia_dias', 'valor_monetario', 'frequencia_prevista_reg']
+# Data fixa usada pelo dashboard para a idade dos pacientes
+DATA_REFERENCIA_IDADE = "2025-05-20"
+
+
+def map_categorical(serie, mapa, padrao):
+    # Mapeia só as categorias distintas (poucas) e monta o resultado a partir dos códigos,
+    # sem gerar uma string por linha
+    categorias = pd.Categorical(serie)
+    # O último item corresponde ao código -1 (valor ausente), que também recebe o padrão
+    descricoes = [mapa.get(c, padrao) for c in categorias.categories] + [padrao]
+    unicas = list(dict.fromkeys(descricoes))
+    codigos = np.array([unicas.index(d) for d in descricoes], dtype=np.int16)
+    return pd.Categorical.from_codes(codigos[categorias.codes], unicas)
+
+
+def add_idade(df):
+    # Idade em anos completos na data de referência, calculada uma vez pelo pipeline.
+    # Inteiro anulável: consulta de paciente sem cadastro fica sem data de nascimento (e sem idade)
+    dias = (pd.Timestamp(DATA_REFERENCIA_IDADE) - pd.to_datetime(df['data_nascimento'])).dt.days
+    return df.assign(idade=(dias // 365).astype('Int16'))
+
+
+def _records(df):
+    # Tipos numpy/datas viram tipos JSON
+    return json.loads(df.to_json(orient="records", date_format="iso", date_unit="s"))
+
+
+class RiskIndex:
+    """Ranking de risco pré-ordenado, geral e por cluster (ordenação feita uma única vez).
+
+    Maior inatividade primeiro e, no empate, maior valor histórico; pacientes sem
+    classificação (cluster -1) ficam de fora. Cada página custa O(k).
+    """
+
+    def __init__(self, df):
+        self.df = df
+        classificados = np.flatnonzero(df['cluster_rfm'].to_numpy() != -1)
+        chave = np.lexsort((-df['valor_monetario'].to_numpy()[classificados],
+                            -df['recencia_dias'].to_numpy()[classificados]))
+        ordem = classificados[chave]
+        # Ordenação estável por cluster: dentro de cada um, a ordem de risco se mantém
+        clusters = df['cluster_rfm'].to_numpy()[ordem]
+        por_cluster = np.argsort(clusters, kind='stable')
+        clusters, ordem_cluster = clusters[por_cluster], ordem[por_cluster]
+        valores, inicios = np.unique(clusters, return_index=True)
+        fins = np.append(inicios[1:], len(clusters))
+        self._ordem = {"todos": ordem}
+        for cluster, inicio, fim in zip(valores, inicios, fins):
+            self._ordem[str(cluster)] = ordem_cluster[inicio:fim]
+
+    @property
+    def chaves(self):
+        return list(self._ordem)
+
+    def total(self, chave):
+        return len(self._ordem.get(chave, ()))
+
+    def page(self, chave, pagina=0, k=10):
+        posicoes = self._ordem.get(chave, np.empty(0, dtype=np.int64))[pagina * k:(pagina + 1) * k]
+        return self.df.iloc[posicoes]
+
+
+def build_summary(scores, top_n=TOP_N):
+    ativos = scores[scores['valor_monetario'] > 0]
+    classificados = scores[scores['cluster_rfm'] != -1]
+    max_recencia = int(classificados['recencia_dias'].max()) if len(classificados) else 400
+
+    por_cluster = classificados.groupby('cluster_rfm').agg(
+        pacientes=('id_paciente', 'size'),
+        score_medio=('frequencia_prevista_reg', 'mean'),
+        recencia_media=('recencia_dias', 'mean'),
+        valor_medio=('valor_monetario', 'mean'),
+    ).reset_index()
+
+    indice = RiskIndex(classificados[COLUNAS_RISCO])
+    top_risco = {chave: _records(indice.page(chave, 0, top_n)) for chave in indice.chaves}
+
+    grade = bin_scatter(classificados, 'recencia_dias', 'valor_monetario', 'cluster_rfm',
+                        valor='frequencia_prevista_reg', range_x=(0, max_recencia + 10),
+                        range_y=tuple(np.log10(FAIXA_VALOR)), log_y=True)
+    return {
+        "formato": FORMATO_RESUMO,
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "top_n": top_n,
+        "kpis": {
+            "pacientes": int(len(scores)),
+            "pacientes_ativos": int(len(ativos)),
+            "recencia_media_ativos": float(ativos['recencia_dias'].mean().round(0)) if len(ativos) else 0.0,
+            "score_medio": float(scores['frequencia_prevista_reg'].mean()),
+            "pacientes_classificados": int(len(classificados)),
+            "max_recencia": max_recencia,
+        },
+        "clusters": _records(por_cluster),
+        "top_risco": top_risco,
+        "grade": _records(grade),
+    }
+
+
+def save_summary(scores, data_dir, top_n=TOP_N):
+    path = os.path.join(data_dir, RESUMO)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(build_summary(scores, top_n), f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def load_summary(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_model_metadata(models_dir):
+    # Metadados da versão em LATEST (métricas de avaliação incluídas), lidos como JSON puro:
+    # o dashboard não precisa importar sklearn/joblib para mostrá-los
+    path_latest = os.path.join(models_dir, "LATEST")
+    if not os.path.exists(path_latest):
+        return None
+    with open(path_latest, encoding="utf-8") as f:
+        path = os.path.join(models_dir, f.read().strip(), "metadata.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
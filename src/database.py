@@ -0,0 +1,222 @@
+import os
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import (
+    Boolean, Column, Date, Float, Integer, MetaData, Table, Text, create_engine, event, inspect, text,
+)
+
+from .artifacts import DATA_DIR, SCHEMAS, apply_schema, find_artifact, iter_table
+from .rfm import COLUNAS_RFM
+
+# Backend opcional em SQLite: pacientes, médicos e consultas num banco local com índices,
+# RFM calculado no próprio banco (GROUP BY) e os scores numa tabela consultável por
+# cluster ou paciente, sem carregar a base inteira. As datas são gravadas como texto ISO
+# (YYYY-MM-DD), que ordena e compara corretamente.
+BANCO = "clinica.db"
+CHUNKSIZE = 500_000
+
+# Tabela do banco -> schema de tipos (src/artifacts.SCHEMAS) e chave primária
+TABELAS = {
+    "pacientes": ("dados_pacientes", "id_paciente"),
+    "medicos": ("dados_medicos", "id_medico"),
+    "consultas": ("dados_consultas", None),
+    "scores": ("pacientes_engajamento_score", "id_paciente"),
+}
+TIPOS_SQL = {"Int16": Integer, "int32": Integer, "int64": Integer, "float64": Float, "string": Text,
+             "category": Text, "date": Date, "bool": Boolean}
+
+metadata = MetaData()
+for _tabela, (_nome, _chave) in TABELAS.items():
+    Table(_tabela, metadata, *[Column(coluna, TIPOS_SQL[tipo], primary_key=coluna == _chave)
+                               for coluna, tipo in SCHEMAS[_nome].items()])
+
+# Criados depois da carga em massa (inserir com os índices prontos é bem mais lento).
+# O índice de consultas por paciente cobre data e valor: o GROUP BY do RFM lê só o índice.
+INDICES = [
+    "CREATE INDEX ix_consultas_paciente ON consultas (id_paciente, data_consulta, valor_consulta)",
+    "CREATE INDEX ix_consultas_medico ON consultas (id_medico)",
+    "CREATE INDEX ix_consultas_data ON consultas (data_consulta)",
+]
+# Mesma ordem do RiskIndex (maior inatividade, maior valor, id): cada página é uma leitura do índice
+INDICES_SCORES = [
+    "CREATE INDEX ix_scores_risco ON scores (recencia_dias DESC, valor_monetario DESC, id_paciente)",
+    "CREATE INDEX ix_scores_cluster_risco ON scores (cluster_rfm, recencia_dias DESC, valor_monetario DESC, id_paciente)",
+]
+
+# Mesmas colunas (e nomes) do dataset_final gravado em arquivo
+DATASET_FINAL_VIEW = """
+CREATE VIEW dataset_final AS
+SELECT c.id_paciente, c.id_medico, c.data_consulta, c.valor_consulta,
+       p.nome AS nome_x, p.sexo AS sexo_x, p.data_nascimento, p.cidade AS cidade_x,
+       p.plano_saude, p.possui_doenca_cronica, p.data_cadastro,
+       m.nome AS nome_y, m.sexo AS sexo_y, m.especialidade, m.crm, m.cidade AS cidade_y, m.telefone
+FROM consultas c
+LEFT JOIN pacientes p ON p.id_paciente = c.id_paciente
+LEFT JOIN medicos m ON m.id_medico = c.id_medico
+"""
+
+
+def database_path(data_dir=DATA_DIR):
+    return os.path.join(data_dir, BANCO)
+
+
+def get_engine(path):
+    engine = create_engine(f"sqlite:///{path}")
+
+    @event.listens_for(engine, "connect")
+    def _pragmas(conexao, _):
+        cursor = conexao.cursor()
+        # Cache de páginas maior e tabelas temporárias (ordenações do GROUP BY) em memória
+        cursor.execute("PRAGMA cache_size = -200000")
+        cursor.execute("PRAGMA temp_store = MEMORY")
+        cursor.close()
+
+    return engine
+
+
+def has_table(engine, tabela):
+    return inspect(engine).has_table(tabela)
+
+
+def _rows(df, tabela):
+    # Colunas da tabela, na ordem dela, como listas de tipos Python (o sqlite3 não aceita numpy);
+    # datas viram texto ISO e valores ausentes viram NULL
+    nome = TABELAS[tabela][0]
+    df = apply_schema(df, nome)
+    colunas = []
+    for coluna, tipo in SCHEMAS[nome].items():
+        serie = df[coluna]
+        if tipo == "date":
+            datas = serie.to_numpy(dtype="datetime64[D]")
+            valores = np.where(np.isnat(datas), None, datas.astype(str)).tolist()
+        elif tipo in ("string", "category", "Int16"):
+            valores = serie.astype(object).where(serie.notna(), None).tolist()
+        else:
+            valores = serie.tolist()
+        colunas.append(valores)
+    return list(zip(*colunas))
+
+
+def _insert_sql(tabela, modo="INSERT"):
+    colunas = list(SCHEMAS[TABELAS[tabela][0]])
+    return f"{modo} INTO {tabela} ({', '.join(colunas)}) VALUES ({', '.join('?' * len(colunas))})"
+
+
+def insert_frame(conexao, df, tabela, modo="INSERT"):
+    # Inserção em massa (executemany numa única transação); modo="INSERT OR REPLACE" faz upsert pela chave
+    linhas = _rows(df, tabela)
+    if linhas:
+        conexao.exec_driver_sql(_insert_sql(tabela, modo), linhas)
+    return len(linhas)
+
+
+def load_database(data_dir, engine, chunksize=CHUNKSIZE):
+    """Recria pacientes, médicos e consultas a partir dos artefatos de data_dir, em blocos.
+
+    Os índices são criados no fim e o dataset_final vira uma view (junção feita pelo banco).
+    Devolve o número de linhas de cada tabela.
+    """
+    tabelas = [metadata.tables[t] for t in ("pacientes", "medicos", "consultas")]
+    with engine.begin() as conexao:
+        conexao.exec_driver_sql("DROP VIEW IF EXISTS dataset_final")
+        metadata.drop_all(conexao, tables=tabelas)
+        metadata.create_all(conexao, tables=tabelas)
+        linhas = {}
+        for tabela in ("pacientes", "medicos", "consultas"):
+            path = find_artifact(TABELAS[tabela][0], data_dir)
+            if path is None:
+                raise FileNotFoundError(f" Arquivo não encontrado:\n{os.path.join(data_dir, TABELAS[tabela][0])}")
+            linhas[tabela] = sum(insert_frame(conexao, chunk, tabela) for chunk in iter_table(path, chunksize))
+        for indice in INDICES:
+            conexao.exec_driver_sql(indice)
+        conexao.exec_driver_sql(DATASET_FINAL_VIEW)
+        conexao.exec_driver_sql("ANALYZE")
+    return linhas
+
+
+def append_consultas(engine, df_consultas):
+    # Consultas novas entram por INSERT; os índices são atualizados só para essas linhas
+    with engine.begin() as conexao:
+        return insert_frame(conexao, df_consultas, "consultas")
+
+
+def read_sql(engine, sql, nome, params=None):
+    with engine.connect() as conexao:
+        df = pd.read_sql_query(text(sql), conexao, params=params)
+    # Booleanos chegam como 0/1
+    for coluna, tipo in SCHEMAS.get(nome, {}).items():
+        if tipo == "bool" and coluna in df.columns:
+            df[coluna] = df[coluna].astype(bool)
+    return apply_schema(df, nome)
+
+
+def compute_rfm_sql(engine, ref_date, ids=None):
+    """RFM por paciente calculado pelo banco: um GROUP BY sobre o índice de consultas por paciente.
+
+    Mesmo resultado do RFMAccumulator.to_frame (só pacientes com consulta, ordenados pelo id).
+    """
+    filtro = ""
+    params = {"ref": str(pd.Timestamp(ref_date).date())}
+    if ids is not None:
+        filtro = f"WHERE id_paciente IN ({', '.join(str(int(i)) for i in ids)})"
+    rfm = read_sql(engine, f"""
+        SELECT id_paciente,
+               CAST(julianday(:ref) - julianday(MAX(data_consulta)) AS INTEGER) AS recencia_dias,
+               SUM(valor_consulta) AS valor_monetario,
+               COUNT(*) AS frequencia_consultas
+        FROM consultas {filtro}
+        GROUP BY id_paciente
+        ORDER BY id_paciente
+    """, "dados_consultas", params)
+    return rfm.astype({"id_paciente": "int32", "recencia_dias": "int32", "valor_monetario": "int64",
+                       "frequencia_consultas": "int32"})[COLUNAS_RFM]
+
+
+def load_pacientes(engine, colunas):
+    return read_sql(engine, f"SELECT {', '.join(colunas)} FROM pacientes ORDER BY id_paciente", "dados_pacientes")
+
+
+def save_scores(engine, scores):
+    # Recria a tabela de scores numa única transação (leitores veem a versão anterior até o commit)
+    tabela = metadata.tables["scores"]
+    with engine.begin() as conexao:
+        tabela.drop(conexao, checkfirst=True)
+        tabela.create(conexao)
+        linhas = insert_frame(conexao, scores, "scores")
+        for indice in INDICES_SCORES:
+            conexao.exec_driver_sql(indice)
+    return linhas
+
+
+def update_scores(engine, scores, delta_recencia=0):
+    """Atualização incremental: desloca a Recência de todos no banco e regrava só as linhas de `scores`."""
+    with engine.begin() as conexao:
+        if delta_recencia:
+            conexao.execute(text("UPDATE scores SET recencia_dias = recencia_dias + :delta"),
+                            {"delta": int(delta_recencia)})
+        return insert_frame(conexao, scores, "scores", modo="INSERT OR REPLACE")
+
+
+# --- CONSULTAS DO DASHBOARD ---
+def count_scores(engine, cluster=None):
+    filtro, params = ("WHERE cluster_rfm = :cluster", {"cluster": int(cluster)}) if cluster is not None \
+        else ("WHERE cluster_rfm != -1", {})
+    with engine.connect() as conexao:
+        return conexao.execute(text(f"SELECT COUNT(*) FROM scores {filtro}"), params).scalar_one()
+
+
+def risk_page(engine, colunas, cluster=None, pagina=0, k=10):
+    # Mesma ordem e mesma exclusão (cluster -1) do RiskIndex, lida direto do índice
+    filtro, params = ("WHERE cluster_rfm = :cluster", {"cluster": int(cluster)}) if cluster is not None \
+        else ("WHERE cluster_rfm != -1", {})
+    return read_sql(engine, f"""
+        SELECT {', '.join(colunas)} FROM scores {filtro}
+        ORDER BY recencia_dias DESC, valor_monetario DESC, id_paciente
+        LIMIT :k OFFSET :inicio
+    """, "pacientes_engajamento_score", {**params, "k": int(k), "inicio": int(pagina) * int(k)})
+
+
+def get_patient(engine, id_paciente, colunas):
+    return read_sql(engine, f"SELECT {', '.join(colunas)} FROM scores WHERE id_paciente = :id",
+                    "pacientes_engajamento_score", {"id": int(id_paciente)})
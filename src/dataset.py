@@ -0,0 +1,251 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from .artifacts import (
+    DATA_DIR, apply_schema, artifact_path, find_artifact, iter_table, read_table, remove_dataset, save_table,
+)
+
+# Artefatos do modo estrela: tabela fato (uma linha por consulta, só ids/data/valor)
+# e dimensões com os atributos de pacientes e médicos, cada um gravado uma única vez.
+FATO = "dataset_final_fato"
+DIM_PACIENTES = "dataset_final_dim_pacientes"
+DIM_MEDICOS = "dataset_final_dim_medicos"
+
+# Colunas repetidas em muitas linhas do dataset explodido viram category (códigos inteiros)
+COLUNAS_CATEGORICAS = ["nome", "sexo", "cidade", "plano_saude", "especialidade", "crm", "telefone"]
+
+
+def compact_dimension(df):
+    df = df.copy()
+    for coluna in COLUNAS_CATEGORICAS:
+        if coluna in df.columns and not isinstance(df[coluna].dtype, pd.CategoricalDtype):
+            df[coluna] = df[coluna].astype("category")
+    return df
+
+
+def compact_fato(df_consultas):
+    # Tipos fixos (int32 e data em dias no artefato) para que todos os blocos tenham o mesmo schema
+    return apply_schema(df_consultas[["id_paciente", "id_medico", "data_consulta", "valor_consulta"]], "dados_consultas")
+
+
+def _lookup_positions(chaves_dim, chaves_fato):
+    # Posição de cada chave da fato na dimensão (-1 quando não existe), via array indexado pelo id
+    chaves_dim = np.asarray(chaves_dim, dtype=np.int64)
+    chaves_fato = np.asarray(chaves_fato, dtype=np.int64)
+    tabela = np.full(int(chaves_dim.max()) + 1 if len(chaves_dim) else 0, -1, dtype=np.int32)
+    tabela[chaves_dim] = np.arange(len(chaves_dim), dtype=np.int32)
+    posicoes = np.full(len(chaves_fato), -1, dtype=np.int32)
+    dentro = (chaves_fato >= 0) & (chaves_fato < len(tabela))
+    posicoes[dentro] = tabela[chaves_fato[dentro]]
+    return posicoes
+
+
+def _take_left(dim, posicoes):
+    # Equivalente a um left join por posição: copia só códigos/valores, sem tabela hash
+    faltando = posicoes < 0
+    if faltando.any():
+        linha_vazia = pd.DataFrame({
+            c: pd.Series([None], dtype=dim[c].dtype if isinstance(dim[c].dtype, pd.CategoricalDtype) else object)
+            for c in dim.columns
+        })
+        dim = pd.concat([dim, linha_vazia], ignore_index=True)
+        posicoes = np.where(faltando, len(dim) - 1, posicoes)
+    return dim.take(posicoes).reset_index(drop=True)
+
+
+def explode(df_fato, dim_pacientes, dim_medicos):
+    """Monta o dataset_final desnormalizado (mesmas colunas do merge original)."""
+    pacientes = dim_pacientes.drop(columns="id_paciente")
+    medicos = dim_medicos.drop(columns="id_medico")
+    repetidas = set(pacientes.columns) & set(medicos.columns)
+    pacientes = pacientes.rename(columns={c: f"{c}_x" for c in repetidas})
+    medicos = medicos.rename(columns={c: f"{c}_y" for c in repetidas})
+
+    partes = [
+        df_fato.reset_index(drop=True),
+        _take_left(pacientes, _lookup_positions(dim_pacientes["id_paciente"], df_fato["id_paciente"])),
+        _take_left(medicos, _lookup_positions(dim_medicos["id_medico"], df_fato["id_medico"])),
+    ]
+    return pd.concat(partes, axis=1)
+
+
+def remove_stale(data_dir, estrela):
+    # Evita que um artefato do outro modo, de uma execução anterior, seja lido no lugar do atual
+    nomes = ["dataset_final"] if estrela else [FATO, DIM_PACIENTES, DIM_MEDICOS]
+    for nome in nomes:
+        remove_dataset(nome, data_dir)
+        for formato in ("parquet", "feather"):
+            path = artifact_path(nome, data_dir, formato)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def save_dimensions(df_pacientes, df_medicos, data_dir=DATA_DIR, formato="parquet"):
+    return [
+        save_table(compact_dimension(df_pacientes), DIM_PACIENTES, data_dir, formato=formato),
+        save_table(compact_dimension(df_medicos), DIM_MEDICOS, data_dir, formato=formato),
+    ]
+
+
+def save_star(df_consultas, df_pacientes, df_medicos, data_dir=DATA_DIR, formato="parquet"):
+    path_fato = save_table(compact_fato(df_consultas), FATO, data_dir, formato=formato)
+    return [path_fato] + save_dimensions(df_pacientes, df_medicos, data_dir, formato=formato)
+
+
+def load_dataset_final(data_dir=DATA_DIR, columns=None):
+    # Lê o dataset_final explodido ou, no modo estrela, remonta a partir da fato e das dimensões.
+    # O CSV exportado só é usado quando não há nenhum artefato colunar.
+    path = find_artifact("dataset_final", data_dir)
+    if path is not None and not path.endswith(".csv"):
+        return read_table(path, columns=columns)
+    path_fato = find_artifact(FATO, data_dir)
+    if path_fato is not None:
+        df = explode(read_table(path_fato),
+                     read_table(find_artifact(DIM_PACIENTES, data_dir)),
+                     read_table(find_artifact(DIM_MEDICOS, data_dir)))
+        return df if columns is None else df[columns]
+    path = find_artifact("dataset_final", data_dir)
+    if path is None:
+        raise FileNotFoundError(f" Arquivo não encontrado:\n{artifact_path('dataset_final', data_dir)}")
+    return read_table(path, columns=columns)
+
+
+# --- CUBO DE CONSULTAS ---
+# Agregado (médico, plano, mês da consulta, cluster RFM) com consultas, receita e pacientes
+# distintos, calculado em blocos com códigos inteiros (sem group-by sobre strings). A
+# especialidade vem do médico. Como plano e cluster são atributos do paciente, os pacientes
+# distintos somam corretamente entre planos e clusters, mas não entre meses ou médicos.
+CUBO = "cubo_consultas"
+CHUNKSIZE_CUBO = 1_000_000
+# Meses desde 1970 cabem com folga; pares (célula, paciente) usam os 31 bits de baixo para o id
+_MESES = 12 * 400
+_BITS_PACIENTE = 31
+
+
+def _sorted_unique(valores):
+    # Valores distintos por ordenação: o np.unique sem return_inverse usa uma tabela hash que
+    # fica muito lenta com estas chaves (id do paciente nos bits de baixo)
+    valores = np.sort(valores)
+    return valores[np.concatenate(([True], valores[1:] != valores[:-1]))] if len(valores) else valores
+
+
+def _sorted_unique_pairs(celulas, ids):
+    # Mesma coisa para pares que não cabem numa chave int64: ordenados por célula e depois paciente
+    ordem = np.lexsort((ids, celulas))
+    celulas, ids = celulas[ordem], ids[ordem]
+    if not len(ordem):
+        return celulas, ids
+    novos = np.concatenate(([True], (celulas[1:] != celulas[:-1]) | (ids[1:] != ids[:-1])))
+    return celulas[novos], ids[novos]
+
+
+class CubeAccumulator:
+    """Acumula o cubo bloco a bloco; `to_frame()` devolve uma linha por célula com consultas."""
+
+    def __init__(self, df_pacientes, df_medicos, scores):
+        self.medicos = df_medicos.reset_index(drop=True)
+        self._ids_medicos = self.medicos["id_medico"].to_numpy()
+        self.planos = pd.Categorical(df_pacientes["plano_saude"])
+        self._ids_pacientes = df_pacientes["id_paciente"].to_numpy()
+        self._planos_codigos = self.planos.codes.astype(np.int64)
+        self._ids_scores = scores["id_paciente"].to_numpy()
+        self._clusters = scores["cluster_rfm"].to_numpy().astype(np.int64)
+        # Valores ausentes (médico/paciente fora do cadastro, paciente sem cluster) têm código próprio
+        self._n_medicos = len(self.medicos) + 1
+        self._n_planos = len(self.planos.categories) + 1
+        self._cluster_min = min(int(self._clusters.min()), -1) if len(self._clusters) else -1
+        self._n_clusters = (int(self._clusters.max()) if len(self._clusters) else -1) - self._cluster_min + 2
+        self._partes = []
+        self._pares = []
+        # Chave (célula << 31) | paciente só enquanto couber em int64 (ex.: dezenas de milhares de
+        # médicos estouram); senão os pares ficam em dois arrays, ordenados com lexsort
+        self._chave_compacta = (self._n_medicos * self._n_planos * self._n_clusters * _MESES
+                                <= 2 ** (63 - _BITS_PACIENTE))
+
+    def _unpack_pairs(self):
+        self._chave_compacta = False
+        self._pares = [(chaves >> _BITS_PACIENTE, chaves & ((1 << _BITS_PACIENTE) - 1)) for chaves in self._pares]
+
+    def _codes(self, posicoes, valores, ausente):
+        return np.where(posicoes >= 0, valores[np.maximum(posicoes, 0)], ausente)
+
+    def update_frame(self, df_consultas):
+        # Consultas sem data ficam fora do cubo (como num groupby por mês). O mês entra na chave da
+        # célula como meses desde 1970, entre 0 e _MESES - 1; datas fora desse intervalo são recusadas
+        datas = df_consultas["data_consulta"].to_numpy().astype("datetime64[M]")
+        if np.isnat(datas).any():
+            df_consultas, datas = df_consultas[~np.isnat(datas)], datas[~np.isnat(datas)]
+        mes = datas.astype(np.int64)
+        if len(mes) and (mes.min() < 0 or mes.max() >= _MESES):
+            raise ValueError(f" Consultas fora do intervalo do cubo (1970 a {1970 + _MESES // 12 - 1}): "
+                             f"{datas.min()} a {datas.max()}")
+        ids_pacientes = df_consultas["id_paciente"].to_numpy()
+        medico = _lookup_positions(self._ids_medicos, df_consultas["id_medico"]).astype(np.int64)
+        medico[medico < 0] = self._n_medicos - 1
+        plano = self._codes(_lookup_positions(self._ids_pacientes, ids_pacientes), self._planos_codigos, -1)
+        plano[plano < 0] = self._n_planos - 1
+        cluster = self._codes(_lookup_positions(self._ids_scores, ids_pacientes), self._clusters, -1)
+        # -1 (sem classificação) e pacientes fora dos scores ficam no mesmo código
+        cluster = cluster - self._cluster_min
+
+        celula = ((medico * self._n_planos + plano) * self._n_clusters + cluster) * _MESES + mes
+        chaves, inversa = np.unique(celula, return_inverse=True)
+        valores = df_consultas["valor_consulta"].to_numpy()
+        self._partes.append((chaves, np.bincount(inversa), np.bincount(inversa, weights=valores)))
+        ids_pacientes = ids_pacientes.astype(np.int64)
+        if self._chave_compacta and len(ids_pacientes) and (ids_pacientes.min() < 0
+                                                            or ids_pacientes.max() >= 2 ** _BITS_PACIENTE):
+            self._unpack_pairs()
+        if self._chave_compacta:
+            self._pares.append(_sorted_unique((celula << _BITS_PACIENTE) | ids_pacientes))
+        else:
+            self._pares.append(_sorted_unique_pairs(celula, ids_pacientes))
+        return self
+
+    def to_frame(self):
+        if not self._partes:
+            chaves = np.empty(0, dtype=np.int64)
+            consultas = receita = pacientes = np.empty(0, dtype=np.int64)
+        else:
+            chaves, inversa = np.unique(np.concatenate([p[0] for p in self._partes]), return_inverse=True)
+            consultas = np.bincount(inversa, weights=np.concatenate([p[1] for p in self._partes]))
+            receita = np.bincount(inversa, weights=np.concatenate([p[2] for p in self._partes]))
+            if self._chave_compacta:
+                celulas_pares = _sorted_unique(np.concatenate(self._pares)) >> _BITS_PACIENTE
+            else:
+                celulas_pares, _ = _sorted_unique_pairs(np.concatenate([p[0] for p in self._pares]),
+                                                        np.concatenate([p[1] for p in self._pares]))
+            # chaves[-1:] é vazio quando nenhuma consulta foi acumulada (blocos vazios)
+            pacientes = np.diff(np.searchsorted(celulas_pares, np.append(chaves, chaves[-1:] + 1)))
+
+        resto, mes = np.divmod(chaves, _MESES)
+        resto, cluster = np.divmod(resto, self._n_clusters)
+        medico, plano = np.divmod(resto, self._n_planos)
+        medicos = _take_left(self.medicos[["id_medico", "especialidade"]],
+                             np.where(medico < self._n_medicos - 1, medico, -1).astype(np.int32))
+        planos = np.where(plano < self._n_planos - 1, plano, -1)
+        return pd.DataFrame({
+            "especialidade": medicos["especialidade"].astype("category"),
+            "id_medico": medicos["id_medico"].fillna(-1).astype("int32"),
+            "plano_saude": pd.Categorical.from_codes(planos, self.planos.categories),
+            "mes": mes.astype("datetime64[M]").astype("datetime64[ms]"),
+            "cluster_rfm": (cluster + self._cluster_min).astype("int32"),
+            "consultas": consultas.astype("int32"),
+            "receita": receita.astype("int64"),
+            "pacientes": pacientes.astype("int32"),
+        })
+
+
+def build_cube(data_dir, scores, chunksize=CHUNKSIZE_CUBO):
+    """Cubo a partir dos artefatos de data_dir (consultas lidas em blocos) e dos clusters de `scores`."""
+    path = find_artifact("dados_consultas", data_dir)
+    if path is None:
+        raise FileNotFoundError(f" Arquivo não encontrado:\n{os.path.join(data_dir, 'dados_consultas')}")
+    cubo = CubeAccumulator(read_table(find_artifact("dados_pacientes", data_dir), columns=["id_paciente", "plano_saude"]),
+                           read_table(find_artifact("dados_medicos", data_dir), columns=["id_medico", "especialidade"]),
+                           scores)
+    for chunk in iter_table(path, chunksize, columns=["id_paciente", "id_medico", "data_consulta", "valor_consulta"]):
+        cubo.update_frame(chunk)
+    return cubo.to_frame()
@@ -1,181 +1,79 @@
-import pandas as pd
-from faker import Faker
-import random
+import argparse
 import os
-# %%
-
-base_dir = os.path.dirname(__file__)
-pacientes_path = os.path.join(base_dir, '..', '..', 'data', 'dados_pacientes.csv')
-pacientes = pd.read_csv(pacientes_path)
-
-# %%
-Faker.seed(42)
-random.seed(42)
-fake = Faker('pt-BR')
-
-num_consultas = 97083
-num_pacientes_total = pacientes['id_paciente'].max()
-
-def get_valor_consulta(plano):
-    if plano == 'Popular':
-        return 0
-    elif plano == 'Executivo':
-        return 100
-    elif plano == 'Premium':
-        return 500
-    
-consultas = []
-for i in range(1, num_consultas + 1):
-    paciente_id = random.choice(range(1, num_pacientes_total + 1)) 
-    medico_id = random.choice(range(1,501))
-    data_consulta = fake.date_between(start_date='-1y', end_date='today')
-    
-    # Busca o plano de saúde do paciente selecionado
-    try:
-        plano = pacientes[pacientes['id_paciente'] == paciente_id]['plano_saude'].values[0]
-        valor_consulta = get_valor_consulta(plano)
-    except IndexError:
-        plano = 'Popular'
-        valor_consulta = 0
-        
-    consultas.append([
-        paciente_id, 
-        medico_id, 
-        data_consulta,
-        valor_consulta
-        ])
-    
-df_consultas = pd.DataFrame(consultas, columns=[
-    'id_paciente',
-    'id_medico',
-    'data_consulta',
-    'valor_consulta'
-    ])
-# %%
-
-output_path = os.path.join(base_dir, '..', '..', 'data', 'dados_consultas.csv')
-df_consultas.to_csv(output_path, index=False, encoding='utf-8', errors='replace')
-
-# %%
-
-import pandas as pd
-from faker import Faker
-import random
-import os
-# %%
-Faker.seed(42)
-random.seed(42)
-fake = Faker('pt-BR')
-
-num_medicos = 500
-especialidades = ['Cardiologista', 'Pediatra', 'Oftalmologista', 'Dermatologista', 'Ortopedista', 'Ginecologista', 'Urologista']
-sexos = ['M', 'F']
-
-dados_medicos = []
-
-for i in range(1, num_medicos + 1):
-    sexo = random.choice(sexos)
-    if sexo == 'M':
-        nome = fake.name_male()
-        titulo = 'Dr.'
-    else:
-        nome = fake.name_female()
-        titulo = 'Dra.'
-    if 'Dr.' not in nome and 'Dra.' not in nome:
-        nome = f"{titulo} {nome}"
-    especialidade = random.choice(especialidades)
-    crm = f"CRM{random.randint(100000, 999999)}"
-    cidade = fake.city()
-    telefone = fake.phone_number()
-    dados_medicos.append([
-        i,
-        nome,
-        sexo,
-        especialidade,
-        crm,
-        cidade,
-        telefone
-        ])
-
-df_medicos = pd.DataFrame(dados_medicos, columns=[
-    'id_medico',
-    'nome',
-    'sexo',
-    'especialidade',
-    'crm',
-    'cidade',
-    'telefone'
-    ])
-# %% 
-
-base_dir = os.path.dirname(__file__)
-output_path = os.path.join(base_dir, '..', '..', 'data', 'dados_medicos.csv')
-
-df_medicos.to_csv(output_path, index=False, encoding='utf-8', errors='replace')
-
-# %%
-
-import pandas as pd
-from faker import Faker
-import random
-import os
-# %%
-Faker.seed(42)
-random.seed(42)
-fake = Faker('pt-BR')
-num_pacientes = 47295 
-planos = ['Popular', 'Executivo', 'Premium']
-sexos = ['M', 'F']
-
-dados_pacientes = []
-
-for i in range(1, num_pacientes + 1):
-    sexo = random.choice(sexos)
-    nome = fake.name_male() if sexo == 'M' else fake.name_female()
-    data_nascimento = fake.date_of_birth(minimum_age=8, maximum_age=90)
-    cidade = fake.city()
-    plano = random.choices(planos, weights=[0.7, 0.2, 0.1])[0]
-    possui_doenca_cronica = random.choices([True, False], weights=[0.15, 0.85])[0]
-    data_cadastro = fake.date_between(start_date='-15y', end_date='today')
-    dados_pacientes.append([
-        i,
-        nome,
-        sexo,
-        data_nascimento,
-        cidade,
-        plano,
-        possui_doenca_cronica,
-        data_cadastro
-        ])
-    
-df_pacientes = pd.DataFrame(dados_pacientes, columns=[
-    'id_paciente',
-    'nome',
-    'sexo',
-    'data_nascimento',
-    'cidade',
-    'plano_saude',
-    'possui_doenca_cronica',
-    'data_cadastro'
-    ])
-# %% 
-
-base_dir = os.path.dirname(__file__)
-output_path = os.path.join(base_dir, '..', '..', 'data', 'dados_pacientes.csv')
-
-df_pacientes.to_csv(output_path, index=False, encoding='utf-8', errors='replace')
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+import shutil
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+from src.artifacts import EXTENSOES, FORMATO_PADRAO, remove_dataset, remove_shadowing  # noqa: E402
+from src.generators import (  # noqa: E402
+    NUM_CONSULTAS,
+    NUM_MEDICOS,
+    NUM_PACIENTES,
+    SEED,
+    concat_shards,
+    generate_all,
+    generate_sharded,
+)
+
+DATA_DIR = os.path.join(PROJECT_ROOT, 'data')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Gera a base sintética da clínica (pacientes, médicos e consultas).")
+    parser.add_argument('--num-pacientes', type=int, default=NUM_PACIENTES)
+    parser.add_argument('--num-medicos', type=int, default=NUM_MEDICOS)
+    parser.add_argument('--num-consultas', type=int, default=NUM_CONSULTAS)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--hoje', default=None,
+                        help="Data de referência AAAA-MM-DD para as consultas (padrão: hoje). Fixe para reprodutibilidade total.")
+    parser.add_argument('--batch-size', type=int, default=1_000_000,
+                        help="Consultas geradas por lote (limita a memória em bases grandes).")
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--formato', choices=['csv', 'parquet'], default=FORMATO_PADRAO,
+                        help="Formato dos arquivos gerados. Parquet grava tipos (datas, categorias, int32) "
+                             "e é lido diretamente pelo process-data.py. Cópias em outro formato são apagadas.")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Ativa a geração em shards com este número de processos. "
+                             "O resultado é o mesmo para qualquer número de workers.")
+    parser.add_argument('--pool', action='store_true',
+                        help="Preenche nomes, cidades, telefones e datas por amostragem vetorizada de um "
+                             "vocabulário gerado uma vez (sem chamar o Faker por linha).")
+    parser.add_argument('--manter-shards', action='store_true',
+                        help="Mantém os arquivos de shard em <data-dir>/shards após a concatenação.")
+    return parser.parse_args()
+
+
+def main_sharded(args):
+    shard_dir = os.path.join(args.data_dir, 'shards')
+    generate_sharded(shard_dir, args.num_pacientes, args.num_medicos, args.num_consultas,
+                     seed=args.seed, hoje=args.hoje, workers=args.workers, pool=args.pool, formato=args.formato)
+    for tabela in ('dados_pacientes', 'dados_medicos', 'dados_consultas'):
+        remove_shadowing(tabela, args.data_dir, args.formato)
+        remove_dataset(tabela, args.data_dir)
+        output_path = concat_shards(shard_dir, tabela, os.path.join(args.data_dir, tabela + EXTENSOES[args.formato]))
+        print(f" {tabela}: {output_path}")
+    if not args.manter_shards:
+        shutil.rmtree(shard_dir)
+
+
+def main():
+    args = parse_args()
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    if args.workers:
+        main_sharded(args)
+        return
+
+    # Pacientes, médicos e consultas (vetorizado, gravado lote a lote)
+    gerados = generate_all(args.data_dir, args.num_pacientes, args.num_medicos, args.num_consultas, seed=args.seed,
+                           hoje=args.hoje, pool=args.pool, formato=args.formato, batch_size=args.batch_size)
+    for rotulo, tabela in [('Pacientes', 'dados_pacientes'), ('Médicos', 'dados_medicos'),
+                           ('Consultas', 'dados_consultas')]:
+        linhas, path = gerados[tabela]
+        print(f" {rotulo}: {linhas} -> {path}")
+
+
+if __name__ == '__main__':
+    main()
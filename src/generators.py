@@ -0,0 +1,442 @@
+import datetime
+import functools
+import os
+import random
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from faker import Faker
+
+from .artifacts import EXTENSOES, FORMATO_PADRAO, BatchWriter, remove_shadowing, save_table, write_table
+from .profiling import NullReport
+
+# Parâmetros padrão da clínica simulada
+NUM_PACIENTES = 47295
+NUM_MEDICOS = 500
+NUM_CONSULTAS = 97083
+SEED = 42
+
+PLANOS = ['Popular', 'Executivo', 'Premium']
+PLANOS_PESOS = [0.7, 0.2, 0.1]
+ESPECIALIDADES = ['Cardiologista', 'Pediatra', 'Oftalmologista', 'Dermatologista', 'Ortopedista', 'Ginecologista', 'Urologista']
+SEXOS = ['M', 'F']
+
+# Valor cobrado por consulta em cada plano (pacientes sem cadastro pagam como 'Popular')
+VALOR_POR_PLANO = {'Popular': 0, 'Executivo': 100, 'Premium': 500}
+
+COLUNAS_PACIENTES = [
+    'id_paciente',
+    'nome',
+    'sexo',
+    'data_nascimento',
+    'cidade',
+    'plano_saude',
+    'possui_doenca_cronica',
+    'data_cadastro'
+    ]
+COLUNAS_MEDICOS = [
+    'id_medico',
+    'nome',
+    'sexo',
+    'especialidade',
+    'crm',
+    'cidade',
+    'telefone'
+    ]
+COLUNAS_CONSULTAS = [
+    'id_paciente',
+    'id_medico',
+    'data_consulta',
+    'valor_consulta'
+    ]
+
+
+# --- PACIENTES ---
+def _pacientes_rows(ids, seed):
+    # Usa instâncias próprias de Random/Faker: o resultado depende só de (ids, seed),
+    # o que permite gerar shards em processos separados.
+    rnd = random.Random(seed)
+    fake = Faker('pt-BR')
+    fake.seed_instance(seed)
+
+    dados_pacientes = []
+    for i in ids:
+        sexo = rnd.choice(SEXOS)
+        nome = fake.name_male() if sexo == 'M' else fake.name_female()
+        data_nascimento = fake.date_of_birth(minimum_age=8, maximum_age=90)
+        cidade = fake.city()
+        plano = rnd.choices(PLANOS, weights=PLANOS_PESOS)[0]
+        possui_doenca_cronica = rnd.choices([True, False], weights=[0.15, 0.85])[0]
+        data_cadastro = fake.date_between(start_date='-15y', end_date='today')
+        dados_pacientes.append([
+            i,
+            nome,
+            sexo,
+            data_nascimento,
+            cidade,
+            plano,
+            possui_doenca_cronica,
+            data_cadastro
+            ])
+
+    return pd.DataFrame(dados_pacientes, columns=COLUNAS_PACIENTES)
+
+
+def generate_pacientes(num_pacientes=NUM_PACIENTES, seed=SEED, pool=False, hoje=None):
+    if pool:
+        return _pacientes_pool(np.arange(1, num_pacientes + 1), seed, pool_seed=seed, hoje=hoje)
+    return _pacientes_rows(range(1, num_pacientes + 1), seed)
+
+
+# --- MÉDICOS ---
+def _medicos_rows(ids, seed):
+    rnd = random.Random(seed)
+    fake = Faker('pt-BR')
+    fake.seed_instance(seed)
+
+    dados_medicos = []
+    for i in ids:
+        sexo = rnd.choice(SEXOS)
+        if sexo == 'M':
+            nome = fake.name_male()
+            titulo = 'Dr.'
+        else:
+            nome = fake.name_female()
+            titulo = 'Dra.'
+        if 'Dr.' not in nome and 'Dra.' not in nome:
+            nome = f"{titulo} {nome}"
+        especialidade = rnd.choice(ESPECIALIDADES)
+        crm = f"CRM{rnd.randint(100000, 999999)}"
+        cidade = fake.city()
+        telefone = fake.phone_number()
+        dados_medicos.append([
+            i,
+            nome,
+            sexo,
+            especialidade,
+            crm,
+            cidade,
+            telefone
+            ])
+
+    return pd.DataFrame(dados_medicos, columns=COLUNAS_MEDICOS)
+
+
+def generate_medicos(num_medicos=NUM_MEDICOS, seed=SEED, pool=False):
+    if pool:
+        return _medicos_pool(np.arange(1, num_medicos + 1), seed, pool_seed=seed)
+    return _medicos_rows(range(1, num_medicos + 1), seed)
+
+
+# --- MODO POOL (sem chamadas ao Faker por linha) ---
+# Um vocabulário limitado de nomes, cidades e formatos de telefone é gerado uma única vez;
+# as colunas são preenchidas por amostragem vetorizada e as datas são sorteadas como
+# deslocamentos inteiros em dias. Tempo e memória crescem linearmente com o número de linhas.
+POOL_SIZE = 5000
+
+
+@functools.lru_cache(maxsize=4)
+def build_pools(seed=SEED, tamanho=POOL_SIZE):
+    fake = Faker('pt-BR')
+    fake.seed_instance(seed)
+    provider_telefone = fake.provider('faker.providers.phone_number')
+    formatos = getattr(provider_telefone, 'formats', None) or ('+55 (0##) ####-####', '(0##) ####-####')
+    return {
+        'nomes_m': np.array([fake.name_male() for _ in range(tamanho)], dtype=object),
+        'nomes_f': np.array([fake.name_female() for _ in range(tamanho)], dtype=object),
+        'cidades': np.array([fake.city() for _ in range(max(tamanho // 5, 1))], dtype=object),
+        'formatos_telefone': tuple(formatos),
+        }
+
+
+def _fill_digits(rng, formatos, n):
+    # Escolhe um formato por linha e troca cada '#' por um dígito aleatório.
+    # Feito por formato, em matriz de bytes, sem laço por linha.
+    escolhidos = rng.integers(0, len(formatos), size=n)
+    saida = np.empty(n, dtype=object)
+    for k, formato in enumerate(formatos):
+        linhas = np.flatnonzero(escolhidos == k)
+        if len(linhas) == 0:
+            continue
+        molde = np.frombuffer(formato.encode('ascii'), dtype=np.uint8)
+        posicoes = np.flatnonzero(molde == ord('#'))
+        matriz = np.tile(molde, (len(linhas), 1))
+        matriz[:, posicoes] = rng.integers(ord('0'), ord('9') + 1, size=(len(linhas), len(posicoes)), dtype=np.uint8)
+        saida[linhas] = matriz.view(f'S{len(molde)}').ravel().astype(str)
+    return saida
+
+
+def _dias_entre(rng, inicio, fim, n):
+    # Datas uniformes no intervalo fechado [inicio, fim], como deslocamento inteiro em dias
+    inicio = np.datetime64(pd.Timestamp(inicio).date(), 'D')
+    total = int((np.datetime64(pd.Timestamp(fim).date(), 'D') - inicio).astype(int))
+    return inicio + rng.integers(0, total + 1, size=n).astype('timedelta64[D]')
+
+
+def _sample_nomes(rng, pools, sexo):
+    eh_m = sexo == 'M'
+    nomes = pools['nomes_f'][rng.integers(0, len(pools['nomes_f']), size=len(sexo))]
+    nomes[eh_m] = pools['nomes_m'][rng.integers(0, len(pools['nomes_m']), size=int(eh_m.sum()))]
+    return nomes
+
+
+def _pacientes_pool(ids, seed, pool_seed=SEED, pool_size=POOL_SIZE, hoje=None):
+    pools = build_pools(pool_seed, pool_size)
+    rng = np.random.default_rng(seed)
+    ids = np.asarray(ids, dtype=np.int64)
+    n = len(ids)
+    hoje = pd.Timestamp(hoje or datetime.date.today()).normalize()
+
+    sexo = rng.choice(np.array(SEXOS, dtype=object), size=n)
+    # date_of_birth(minimum_age=8, maximum_age=90): nascidos entre hoje-91 anos (+1 dia) e hoje-8 anos
+    nascimento_min = hoje - pd.DateOffset(years=91) + pd.Timedelta(days=1)
+    nascimento_max = hoje - pd.DateOffset(years=8)
+    return pd.DataFrame({
+        'id_paciente': ids,
+        'nome': _sample_nomes(rng, pools, sexo),
+        'sexo': sexo,
+        'data_nascimento': _dias_entre(rng, nascimento_min, nascimento_max, n),
+        'cidade': pools['cidades'][rng.integers(0, len(pools['cidades']), size=n)],
+        'plano_saude': rng.choice(np.array(PLANOS, dtype=object), size=n, p=PLANOS_PESOS),
+        'possui_doenca_cronica': rng.random(n) < 0.15,
+        'data_cadastro': _dias_entre(rng, hoje - pd.DateOffset(years=15), hoje, n),
+        }, columns=COLUNAS_PACIENTES)
+
+
+def _medicos_pool(ids, seed, pool_seed=SEED, pool_size=POOL_SIZE):
+    pools = build_pools(pool_seed, pool_size)
+    rng = np.random.default_rng(seed)
+    ids = np.asarray(ids, dtype=np.int64)
+    n = len(ids)
+
+    sexo = rng.choice(np.array(SEXOS, dtype=object), size=n)
+    nomes = pd.Series(_sample_nomes(rng, pools, sexo))
+    titulos = np.where(sexo == 'M', 'Dr. ', 'Dra. ')
+    sem_titulo = ~nomes.str.contains('Dr.', regex=False) & ~nomes.str.contains('Dra.', regex=False)
+    nomes[sem_titulo] = titulos[sem_titulo] + nomes[sem_titulo]
+    return pd.DataFrame({
+        'id_medico': ids,
+        'nome': nomes.to_numpy(),
+        'sexo': sexo,
+        'especialidade': rng.choice(np.array(ESPECIALIDADES, dtype=object), size=n),
+        'crm': 'CRM' + pd.Series(rng.integers(100000, 1000000, size=n)).astype(str).to_numpy(dtype=object),
+        'cidade': pools['cidades'][rng.integers(0, len(pools['cidades']), size=n)],
+        'telefone': _fill_digits(rng, pools['formatos_telefone'], n),
+        }, columns=COLUNAS_MEDICOS)
+
+
+# --- CONSULTAS ---
+def build_valor_lookup(pacientes):
+    # Tabela indexada pelo id_paciente: valor_por_paciente[id] = valor da consulta do plano.
+    # Ids sem cadastro ficam com 0 (mesmo tratamento do plano 'Popular').
+    ids = pacientes['id_paciente'].to_numpy()
+    valores = pacientes['plano_saude'].map(VALOR_POR_PLANO).fillna(0).to_numpy(dtype=np.int32)
+    valor_por_paciente = np.zeros(ids.max() + 1, dtype=np.int32)
+    valor_por_paciente[ids] = valores
+    return valor_por_paciente
+
+
+def _consultas_lote(rng, n, valor_por_paciente, num_medicos, inicio):
+    num_pacientes_total = len(valor_por_paciente) - 1
+    paciente_ids = rng.integers(1, num_pacientes_total + 1, size=n, dtype=np.int32)
+    medico_ids = rng.integers(1, num_medicos + 1, size=n, dtype=np.int32)
+    dias = rng.integers(0, 366, size=n, dtype=np.int32)
+    return pd.DataFrame({
+        'id_paciente': paciente_ids,
+        'id_medico': medico_ids,
+        'data_consulta': inicio + dias.astype('timedelta64[D]'),
+        'valor_consulta': valor_por_paciente[paciente_ids],
+        })
+
+
+def _inicio_janela(hoje):
+    hoje = np.datetime64(hoje or datetime.date.today(), 'D')
+    return hoje - np.timedelta64(365, 'D')  # equivalente ao '-1y' do Faker
+
+
+def generate_consultas_batches(valor_por_paciente, num_consultas=NUM_CONSULTAS, num_medicos=NUM_MEDICOS,
+                               seed=SEED, hoje=None, batch_size=1_000_000):
+    # Gera as consultas em lotes de arrays NumPy. Para o mesmo seed, batch_size e hoje
+    # a sequência de lotes é sempre a mesma.
+    rng = np.random.default_rng(seed)
+    inicio = _inicio_janela(hoje)
+    for inicio_lote in range(0, num_consultas, batch_size):
+        n = min(batch_size, num_consultas - inicio_lote)
+        yield _consultas_lote(rng, n, valor_por_paciente, num_medicos, inicio)
+
+
+def generate_consultas(pacientes, num_consultas=NUM_CONSULTAS, num_medicos=NUM_MEDICOS,
+                       seed=SEED, hoje=None, batch_size=1_000_000):
+    valor_por_paciente = build_valor_lookup(pacientes)
+    lotes = generate_consultas_batches(valor_por_paciente, num_consultas, num_medicos,
+                                       seed=seed, hoje=hoje, batch_size=batch_size)
+    lotes = list(lotes)
+    if not lotes:
+        return pd.DataFrame(columns=COLUNAS_CONSULTAS)
+    return pd.concat(lotes, ignore_index=True)
+
+
+def generate_all(data_dir, num_pacientes=NUM_PACIENTES, num_medicos=NUM_MEDICOS, num_consultas=NUM_CONSULTAS,
+                 seed=SEED, hoje=None, pool=False, formato=FORMATO_PADRAO, batch_size=1_000_000, report=None):
+    """Gera e grava dados_pacientes, dados_medicos e dados_consultas (estas lote a lote) em data_dir.
+
+    Devolve {tabela: (linhas, caminho)}.
+    """
+    report = report or NullReport()
+    for tabela in ('dados_pacientes', 'dados_medicos', 'dados_consultas'):
+        remove_shadowing(tabela, data_dir, formato)
+    with report.stage("gerar_pacientes") as etapa:
+        df_pacientes = generate_pacientes(num_pacientes, seed=seed, pool=pool, hoje=hoje)
+        path_pacientes = save_table(df_pacientes, 'dados_pacientes', data_dir, formato=formato)
+        etapa.linhas_saida = len(df_pacientes)
+
+    with report.stage("gerar_medicos") as etapa:
+        df_medicos = generate_medicos(num_medicos, seed=seed, pool=pool)
+        path_medicos = save_table(df_medicos, 'dados_medicos', data_dir, formato=formato)
+        etapa.linhas_saida = len(df_medicos)
+
+    with report.stage("gerar_consultas") as etapa:
+        lotes = generate_consultas_batches(build_valor_lookup(df_pacientes), num_consultas, num_medicos,
+                                           seed=seed, hoje=hoje, batch_size=batch_size)
+        with BatchWriter('dados_consultas', data_dir, formato=formato) as writer:
+            for lote in lotes:
+                writer.write(lote)
+        etapa.linhas_saida = writer.linhas
+
+    return {
+        'dados_pacientes': (len(df_pacientes), path_pacientes),
+        'dados_medicos': (len(df_medicos), path_medicos),
+        'dados_consultas': (writer.linhas, writer.path),
+    }
+
+
+# --- GERAÇÃO EM SHARDS (multiprocessos) ---
+# O espaço de ids é dividido em shards de tamanho fixo. Cada shard tem seed derivado de
+# (seed base, tabela, índice do shard), então o conteúdo de cada arquivo não depende de
+# quantos workers foram usados nem da ordem de execução.
+SHARD_SIZE_PACIENTES = 50_000
+SHARD_SIZE_CONSULTAS = 1_000_000
+
+_STREAM_PACIENTES = 1
+_STREAM_MEDICOS = 2
+_STREAM_CONSULTAS = 3
+
+# Tabela de valores compartilhada pelos workers de consultas (definida no initializer do pool)
+_valor_por_paciente_worker = None
+
+
+def shard_seed(seed, stream, shard):
+    return int(np.random.SeedSequence([seed, stream, shard]).generate_state(1)[0])
+
+
+def shard_ranges(total, shard_size):
+    # [(índice, primeiro, último_exclusivo)] com ids/linhas a partir de 1
+    return [(k, inicio + 1, min(inicio + shard_size, total) + 1)
+            for k, inicio in enumerate(range(0, total, shard_size))]
+
+
+def shard_path(shard_dir, tabela, shard, formato='csv'):
+    return os.path.join(shard_dir, tabela, f"part-{shard:05d}{EXTENSOES[formato]}")
+
+
+def _salvar_shard(df, shard_dir, tabela, shard, formato):
+    path = shard_path(shard_dir, tabela, shard, formato)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_table(df, path, tabela)
+
+
+def write_pacientes_shard(shard_dir, shard, primeiro, fim, seed, pool=False, hoje=None, formato='csv'):
+    seed_shard = shard_seed(seed, _STREAM_PACIENTES, shard)
+    if pool:
+        # O vocabulário vem do seed base, igual em todos os shards
+        df = _pacientes_pool(np.arange(primeiro, fim), seed_shard, pool_seed=seed, hoje=hoje)
+    else:
+        df = _pacientes_rows(range(primeiro, fim), seed_shard)
+    _salvar_shard(df, shard_dir, 'dados_pacientes', shard, formato)
+    # Devolve só o necessário para montar a tabela de preços das consultas
+    return primeiro, df['plano_saude'].map(VALOR_POR_PLANO).to_numpy(dtype=np.int32)
+
+
+def write_medicos_shard(shard_dir, shard, primeiro, fim, seed, pool=False, formato='csv'):
+    seed_shard = shard_seed(seed, _STREAM_MEDICOS, shard)
+    if pool:
+        df = _medicos_pool(np.arange(primeiro, fim), seed_shard, pool_seed=seed)
+    else:
+        df = _medicos_rows(range(primeiro, fim), seed_shard)
+    _salvar_shard(df, shard_dir, 'dados_medicos', shard, formato)
+    return len(df)
+
+
+def _init_consultas_worker(valor_por_paciente):
+    global _valor_por_paciente_worker
+    _valor_por_paciente_worker = valor_por_paciente
+
+
+def write_consultas_shard(shard_dir, shard, primeiro, fim, seed, num_medicos, hoje, formato='csv'):
+    rng = np.random.default_rng(shard_seed(seed, _STREAM_CONSULTAS, shard))
+    df = _consultas_lote(rng, fim - primeiro, _valor_por_paciente_worker, num_medicos, _inicio_janela(hoje))
+    _salvar_shard(df, shard_dir, 'dados_consultas', shard, formato)
+    return len(df)
+
+
+def concat_shards(shard_dir, tabela, output_path):
+    # Concatena os shards na ordem dos índices. CSV: mantém só o primeiro cabeçalho;
+    # Parquet: reescreve os row groups de cada parte num único arquivo.
+    pasta = os.path.join(shard_dir, tabela)
+    partes = [os.path.join(pasta, f) for f in sorted(os.listdir(pasta)) if f.startswith('part-')]
+    if output_path.endswith('.parquet'):
+        writer = None
+        for parte in partes:
+            dados = pq.read_table(parte, memory_map=True)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, dados.schema)
+            writer.write_table(dados)
+        if writer is not None:
+            writer.close()
+        return output_path
+    with open(output_path, 'wb') as saida:
+        for i, parte in enumerate(partes):
+            with open(parte, 'rb') as entrada:
+                cabecalho = entrada.readline()
+                if i == 0:
+                    saida.write(cabecalho)
+                shutil.copyfileobj(entrada, saida)
+    return output_path
+
+
+def generate_sharded(shard_dir, num_pacientes=NUM_PACIENTES, num_medicos=NUM_MEDICOS,
+                     num_consultas=NUM_CONSULTAS, seed=SEED, hoje=None, workers=None, pool=False, formato='csv',
+                     shard_size_pacientes=SHARD_SIZE_PACIENTES, shard_size_consultas=SHARD_SIZE_CONSULTAS):
+    hoje = str(np.datetime64(hoje or datetime.date.today(), 'D'))
+    for tabela in ('dados_pacientes', 'dados_medicos', 'dados_consultas'):
+        shutil.rmtree(os.path.join(shard_dir, tabela), ignore_errors=True)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futuros_pacientes = [
+            executor.submit(write_pacientes_shard, shard_dir, k, primeiro, fim, seed, pool, hoje, formato)
+            for k, primeiro, fim in shard_ranges(num_pacientes, shard_size_pacientes)
+            ]
+        futuros_medicos = [
+            executor.submit(write_medicos_shard, shard_dir, k, primeiro, fim, seed, pool, formato)
+            for k, primeiro, fim in shard_ranges(num_medicos, shard_size_pacientes)
+            ]
+
+        valor_por_paciente = np.zeros(num_pacientes + 1, dtype=np.int32)
+        for futuro in futuros_pacientes:
+            primeiro, valores = futuro.result()
+            valor_por_paciente[primeiro:primeiro + len(valores)] = valores
+        for futuro in futuros_medicos:
+            futuro.result()
+
+    # As consultas dependem dos planos de todos os pacientes: novo pool com a tabela já carregada
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_consultas_worker,
+                             initargs=(valor_por_paciente,)) as executor:
+        futuros = [
+            executor.submit(write_consultas_shard, shard_dir, k, primeiro, fim, seed, num_medicos, hoje, formato)
+            for k, primeiro, fim in shard_ranges(num_consultas, shard_size_consultas)
+            ]
+        for futuro in futuros:
+            futuro.result()
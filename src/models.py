@@ -0,0 +1,290 @@
+import json
+import os
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from joblib import Parallel, delayed
+from scipy.optimize import linear_sum_assignment
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_absolute_error, r2_score, silhouette_score
+from sklearn.model_selection import KFold
+
+from .artifacts import DATA_DIR
+
+MODELS_DIR = os.path.join(DATA_DIR, "models")
+
+# Variáveis usadas pelos dois modelos, nesta ordem
+FEATURES = ["recencia_dias", "frequencia_consultas", "valor_monetario"]
+
+
+# Motores de clusterização disponíveis
+CLUSTER_ENGINES = ["kmeans", "minibatch", "warm"]
+
+
+def fit_clusters(X, k, engine="kmeans", centroides_anteriores=None, random_state=42):
+    """Treina o agrupamento RFM e mantém os ids de cluster da execução anterior.
+
+    kmeans: K-Means completo (n_init=10), como sempre foi.
+    minibatch: MiniBatchKMeans, para populações de milhões de pacientes.
+    warm: K-Means iniciado nos centróides da última execução (n_init=1), converge em poucas iterações.
+    """
+    n_features = np.shape(X)[1]
+    tem_anteriores = centroides_anteriores is not None and np.shape(centroides_anteriores) == (k, n_features)
+    if engine == "minibatch":
+        modelo = MiniBatchKMeans(n_clusters=k, random_state=random_state, batch_size=4096, n_init=3)
+    elif engine == "warm" and tem_anteriores:
+        modelo = KMeans(n_clusters=k, init=np.asarray(centroides_anteriores, dtype=float), n_init=1, random_state=random_state)
+    else:
+        modelo = KMeans(n_clusters=k, random_state=random_state, n_init=10)
+    modelo.fit(X)
+    if tem_anteriores:
+        align_clusters(modelo, centroides_anteriores, escala=np.asarray(X, dtype=float).std(axis=0))
+    return modelo
+
+
+def align_clusters(modelo, centroides_anteriores, escala=None):
+    # O app.py associa um significado fixo a cada id de cluster (CLUSTER_RFM_MAP). Cada novo
+    # centróide recebe o id do centróide anterior mais próximo (atribuição húngara, com as
+    # variáveis padronizadas), reordenando cluster_centers_ e labels_ do próprio modelo.
+    anteriores = np.asarray(centroides_anteriores, dtype=float)
+    escala = np.where(np.asarray(escala if escala is not None else 1.0) > 0, escala, 1.0)
+    novos = modelo.cluster_centers_
+    custo = np.linalg.norm((anteriores[:, None, :] - novos[None, :, :]) / escala, axis=2)
+    _, ordem = linear_sum_assignment(custo)  # ordem[id_anterior] = índice do novo centróide
+
+    modelo.cluster_centers_ = novos[ordem]
+    novo_id = np.empty_like(ordem)
+    novo_id[ordem] = np.arange(len(ordem))
+    modelo.labels_ = novo_id[modelo.labels_].astype(modelo.labels_.dtype)
+    return modelo
+
+
+# --- SELEÇÃO DE K (Elbow + Silhouette) ---
+K_RANGE = range(1, 11)
+SILHOUETTE_SAMPLE = 10_000
+
+
+def stratified_sample(labels, tamanho, random_state=42):
+    # Amostra com a mesma proporção de cada cluster da população (pelo menos 1 por cluster)
+    rng = np.random.default_rng(random_state)
+    labels = np.asarray(labels)
+    if len(labels) <= tamanho:
+        return np.arange(len(labels))
+    indices = []
+    for rotulo in np.unique(labels):
+        membros = np.flatnonzero(labels == rotulo)
+        n = max(1, int(round(tamanho * len(membros) / len(labels))))
+        indices.append(rng.choice(membros, size=min(n, len(membros)), replace=False))
+    return np.sort(np.concatenate(indices))
+
+
+def simplified_silhouette(X, labels, centroides):
+    # Silhueta simplificada: distância ao próprio centróide (a) e ao centróide vizinho mais
+    # próximo (b). O(N·K) em vez do O(N²) da silhueta exata.
+    distancias = np.linalg.norm(X[:, None, :] - centroides[None, :, :], axis=2)
+    a = distancias[np.arange(len(X)), labels]
+    distancias[np.arange(len(X)), labels] = np.inf
+    b = distancias.min(axis=1)
+    denominador = np.maximum(a, b)
+    return float(np.mean(np.where(denominador > 0, (b - a) / np.where(denominador > 0, denominador, 1), 0.0)))
+
+
+def _evaluate_k(X, k, engine, sample_size, random_state):
+    inicio = time.perf_counter()
+    modelo = fit_clusters(X, k, engine=engine, random_state=random_state)
+    resultado = {"k": k, "inercia": float(modelo.inertia_),
+                 "silhouette_amostra": np.nan, "silhouette_simplificada": np.nan}
+    if k >= 2:
+        amostra = stratified_sample(modelo.labels_, sample_size, random_state)
+        if len(np.unique(modelo.labels_[amostra])) >= 2:
+            resultado["silhouette_amostra"] = float(silhouette_score(X[amostra], modelo.labels_[amostra]))
+        resultado["silhouette_simplificada"] = simplified_silhouette(X, modelo.labels_, modelo.cluster_centers_)
+    resultado["segundos"] = round(time.perf_counter() - inicio, 3)
+    return resultado
+
+
+def sweep_k(X, k_values=K_RANGE, engine="kmeans", sample_size=SILHOUETTE_SAMPLE, n_jobs=-1, random_state=42):
+    """Treina cada K candidato em paralelo e devolve inércia e silhuetas por K."""
+    X = np.asarray(X, dtype=float)
+    k_values = [k for k in k_values if k <= len(X)]
+    resultados = Parallel(n_jobs=n_jobs)(
+        delayed(_evaluate_k)(X, k, engine, sample_size, random_state) for k in k_values
+    )
+    return pd.DataFrame(resultados)
+
+
+# --- AVALIAÇÃO DO MODELO DE ENGAJAMENTO ---
+# K-fold numa amostra (custo limitado em bases grandes) com os folds treinados em paralelo e
+# importância por permutação nos dados fora do fold de cada modelo. Tudo roda em threads: a
+# construção e a previsão das árvores liberam o GIL e os modelos dos folds não são copiados
+# entre processos.
+CV_FOLDS = 5
+AMOSTRA_AVALIACAO = 20_000
+REPETICOES_IMPORTANCIA = 3
+
+
+def _fit_fold(X, y, treino, teste, params):
+    modelo = RandomForestRegressor(**{**params, "n_jobs": 1}).fit(X[treino], y[treino])
+    previsto = modelo.predict(X[teste])
+    return modelo, {"r2": float(r2_score(y[teste], previsto)), "mae": float(mean_absolute_error(y[teste], previsto))}
+
+
+def _permuted_r2(modelo, X, y, coluna, semente):
+    X = X.copy()
+    X[:, coluna] = np.random.default_rng(semente).permutation(X[:, coluna])
+    return float(r2_score(y, modelo.predict(X)))
+
+
+def evaluate_model(X, y, params=None, n_splits=CV_FOLDS, amostra=AMOSTRA_AVALIACAO,
+                   n_repeats=REPETICOES_IMPORTANCIA, n_jobs=-1, random_state=42):
+    """R² e MAE por validação cruzada e importância por permutação de cada variável.
+
+    A importância é a queda média do R² fora do fold ao embaralhar a variável (folds x
+    repetições); `percentual` é a parte de cada variável na soma das quedas positivas.
+    """
+    inicio = time.perf_counter()
+    params = {"random_state": 42, **(params or {})}
+    features = list(X.columns)
+    alvo = getattr(y, "name", None)
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(X) > amostra:
+        linhas = np.random.default_rng(random_state).choice(len(X), size=amostra, replace=False)
+        X, y = X[linhas], y[linhas]
+    divisoes = list(KFold(n_splits=n_splits, shuffle=True, random_state=random_state).split(X))
+
+    with Parallel(n_jobs=n_jobs, prefer="threads") as parallel:
+        folds = parallel(delayed(_fit_fold)(X, y, treino, teste, params) for treino, teste in divisoes)
+        tarefas = [(i, coluna, repeticao) for i in range(n_splits) for coluna in range(len(features))
+                   for repeticao in range(n_repeats)]
+        permutados = parallel(
+            delayed(_permuted_r2)(folds[i][0], X[divisoes[i][1]], y[divisoes[i][1]], coluna,
+                                  random_state + 1000 * i + 10 * coluna + repeticao)
+            for i, coluna, repeticao in tarefas
+        )
+
+    quedas = np.zeros((len(features), n_splits * n_repeats))
+    contador = np.zeros(len(features), dtype=int)
+    for (i, coluna, _), r2 in zip(tarefas, permutados):
+        quedas[coluna, contador[coluna]] = folds[i][1]["r2"] - r2
+        contador[coluna] += 1
+    medias = quedas.mean(axis=1)
+    total = np.clip(medias, 0, None).sum()
+    r2 = np.array([m["r2"] for _, m in folds])
+    return {
+        "folds": n_splits,
+        "linhas": len(X),
+        "r2_medio": float(r2.mean()),
+        "r2_desvio": float(r2.std()),
+        "mae_medio": float(np.mean([m["mae"] for _, m in folds])),
+        "r2_por_fold": r2.round(4).tolist(),
+        "importancia_permutacao": {
+            feature: {"queda_r2": float(medias[j]), "desvio": float(quedas[j].std()),
+                      "percentual": float(max(medias[j], 0) / total) if total > 0 else 0.0}
+            for j, feature in enumerate(features)
+        },
+        "repeticoes": n_repeats,
+        # O alvo também como variável de entrada explica um R² próximo de 1
+        "alvo": alvo,
+        "alvo_nas_features": alvo in features,
+        "segundos": round(time.perf_counter() - inicio, 3),
+    }
+
+
+# --- ARTEFATOS VERSIONADOS ---
+# Cada treino grava uma pasta <models_dir>/<versão>/ com os modelos, os centróides, o schema
+# das variáveis e os metadados do treino. O arquivo LATEST aponta para a versão mais recente.
+LATEST = "LATEST"
+
+
+def new_version(models_dir=MODELS_DIR):
+    # Reserva a pasta da versão: com microssegundos no nome e, se ainda assim já existir (outro
+    # processo no mesmo instante), um sufixo. Uma versão gravada nunca é sobrescrita
+    base = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    versao, n = base, 0
+    while True:
+        try:
+            os.makedirs(os.path.join(models_dir, versao))
+            return versao
+        except FileExistsError:
+            n += 1
+            versao = f"{base}-{n}"
+
+
+def resolve_version(models_dir=MODELS_DIR, versao=None):
+    if versao is None:
+        path_latest = os.path.join(models_dir, LATEST)
+        if not os.path.exists(path_latest):
+            return None
+        with open(path_latest, encoding="utf-8") as f:
+            versao = f.read().strip()
+    path = os.path.join(models_dir, versao)
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f" Versão de modelo não encontrada:\n{path}")
+    return path
+
+
+def load_centroids(models_dir=MODELS_DIR):
+    path = resolve_version(models_dir)
+    if path is None:
+        return None
+    with open(os.path.join(path, "centroides.json"), encoding="utf-8") as f:
+        return np.asarray(json.load(f)["centroides"], dtype=float)
+
+
+def score_rfm(rfm, kmeans, model):
+    # Aplica os modelos já treinados sobre uma tabela RFM (sem re-treinar)
+    rfm = rfm.copy()
+    X = rfm[FEATURES]
+    rfm["cluster_rfm"] = kmeans.predict(X).astype("int32")
+    rfm["frequencia_prevista_reg"] = model.predict(X)
+    return rfm
+
+
+def save_models(kmeans, model, X, models_dir=MODELS_DIR, versao=None, **metadata):
+    if versao is None:
+        versao = new_version(models_dir)
+    else:
+        # Versão explícita: falha (FileExistsError) em vez de misturar arquivos com uma versão existente
+        os.makedirs(os.path.join(models_dir, versao))
+    path = os.path.join(models_dir, versao)
+    joblib.dump(kmeans, os.path.join(path, "kmeans.joblib"))
+    joblib.dump(model, os.path.join(path, "random_forest.joblib"))
+    with open(os.path.join(path, "centroides.json"), "w", encoding="utf-8") as f:
+        json.dump({"features": FEATURES, "centroides": kmeans.cluster_centers_.tolist()}, f, indent=2)
+
+    metadata = {
+        "versao": versao,
+        "treinado_em": datetime.now().isoformat(timespec="seconds"),
+        "features": {coluna: str(X[coluna].dtype) for coluna in FEATURES},
+        "linhas_treino": len(X),
+        "sklearn": sklearn.__version__,
+        "kmeans": {"n_clusters": int(kmeans.n_clusters), "n_iter": int(kmeans.n_iter_), "inercia": float(kmeans.inertia_)},
+        "random_forest": {k: v for k, v in model.get_params().items() if isinstance(v, (int, float, str, bool, type(None)))},
+        **metadata,
+    }
+    with open(os.path.join(path, "metadata.json"), "w", encoding="utf-8") as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2, default=str)
+
+    # LATEST só muda depois que todos os arquivos da versão foram gravados
+    path_latest = os.path.join(models_dir, LATEST)
+    with open(path_latest + ".tmp", "w", encoding="utf-8") as f:
+        f.write(versao)
+    os.replace(path_latest + ".tmp", path_latest)
+    return path
+
+
+def load_models(models_dir=MODELS_DIR, versao=None):
+    path = resolve_version(models_dir, versao)
+    if path is None:
+        raise FileNotFoundError(f" Modelos não encontrados em:\n{models_dir}\nRode o process-data.py completo antes.")
+    kmeans = joblib.load(os.path.join(path, "kmeans.joblib"))
+    model = joblib.load(os.path.join(path, "random_forest.joblib"))
+    with open(os.path.join(path, "metadata.json"), encoding="utf-8") as f:
+        metadata = json.load(f)
+    return kmeans, model, metadata
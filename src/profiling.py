@@ -0,0 +1,154 @@
+import cProfile
+import json
+import os
+import platform
+import pstats
+import resource
+import time
+from contextlib import nullcontext
+from datetime import datetime
+from types import SimpleNamespace
+
+# Medição por etapa: tempo de parede, tempo de CPU (processo + filhos encerrados), pico de
+# memória residente (RSS) e linhas de entrada/saída. No Linux o pico é zerado no início de
+# cada etapa (/proc/self/clear_refs), então vale só para ela; nos demais sistemas é o pico
+# do processo desde o início.
+#
+# Uma etapa pode ser perfilada com cProfile: o .prof vai para o caminho indicado e um resumo
+# (funções por tempo acumulado) para um .txt ao lado. O perfilador deixa a etapa mais lenta,
+# então os tempos dela no relatório não são comparáveis com os de uma execução sem perfil.
+
+
+def _status_kb(campo):
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for linha in f:
+                if linha.startswith(campo + ":"):
+                    return int(linha.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def rss_mb():
+    kb = _status_kb("VmRSS")
+    return kb / 1024 if kb is not None else None
+
+
+def peak_rss_mb():
+    kb = _status_kb("VmHWM")
+    if kb is None:
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if platform.system() == "Darwin":  # bytes no macOS, KB no Linux
+            kb /= 1024
+    return kb / 1024
+
+
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _cpu_s():
+    filhos = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + filhos.ru_utime + filhos.ru_stime
+
+
+class Stage:
+    """Uma etapa medida. Use como context manager e preencha `linhas_saida` dentro do bloco."""
+
+    def __init__(self, nome, linhas_entrada=None, perfil=None):
+        self.nome = nome
+        self.linhas_entrada = linhas_entrada
+        self.linhas_saida = None
+        self.perfil = perfil
+        self.resultado = None
+
+    def __enter__(self):
+        self._pico_por_etapa = reset_peak_rss()
+        self._rss_inicio = rss_mb()
+        self._cpu = _cpu_s()
+        self._inicio = time.perf_counter()
+        self._profiler = None
+        if self.perfil:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if self._profiler is not None:
+            self._profiler.disable()
+        parede = time.perf_counter() - self._inicio
+        self.resultado = {
+            "etapa": self.nome,
+            "parede_s": round(parede, 4),
+            "cpu_s": round(_cpu_s() - self._cpu, 4),
+            "rss_inicio_mb": round(self._rss_inicio, 1) if self._rss_inicio is not None else None,
+            "pico_rss_mb": round(peak_rss_mb(), 1),
+            "pico_da_etapa": self._pico_por_etapa,
+            "linhas_entrada": self.linhas_entrada,
+            "linhas_saida": self.linhas_saida,
+        }
+        if self._profiler is not None:
+            self.resultado["perfil"] = save_profile(self._profiler, self.perfil)
+        return False
+
+
+def save_profile(profiler, path, linhas=40):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    profiler.dump_stats(path)
+    with open(os.path.splitext(path)[0] + ".txt", "w", encoding="utf-8") as f:
+        pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(linhas)
+    return path
+
+
+def format_stage(resultado):
+    linhas = f"  {resultado['linhas_saida']:>12,} linhas" if resultado.get("linhas_saida") is not None else ""
+    return (f"   {resultado['etapa']:<30} {resultado['parede_s']:8.2f}s  CPU {resultado['cpu_s']:8.2f}s"
+            f"  pico {resultado['pico_rss_mb']:7.0f} MB{linhas}")
+
+
+class RunReport:
+    """Lista de etapas medidas de uma execução, gravada como JSON.
+
+    Com `perfil=(etapa, caminho)`, a etapa com esse nome roda sob o cProfile.
+    """
+
+    def __init__(self, perfil=None, **contexto):
+        self.contexto = contexto
+        self.perfil = perfil
+        self.etapas = []
+        self._inicio = time.perf_counter()
+
+    def stage(self, nome, linhas_entrada=None):
+        perfil = self.perfil[1] if self.perfil and self.perfil[0] == nome else None
+        etapa = Stage(nome, linhas_entrada, perfil=perfil)
+        self.etapas.append(etapa)
+        return etapa
+
+    def to_dict(self):
+        return {
+            "data": datetime.now().isoformat(timespec="seconds"),
+            "maquina": {"python": platform.python_version(), "sistema": platform.platform(),
+                        "cpus": os.cpu_count()},
+            **self.contexto,
+            "total_s": round(time.perf_counter() - self._inicio, 4),
+            "etapas": [etapa.resultado for etapa in self.etapas if etapa.resultado is not None],
+        }
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        return path
+
+
+class NullReport:
+    """Mesma interface do RunReport sem medir nada (funções chamadas fora de uma execução medida)."""
+
+    def stage(self, nome, linhas_entrada=None):
+        return nullcontext(SimpleNamespace(linhas_saida=None))
@@ -0,0 +1,207 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Data de referência padrão do projeto para a Recência
+REF_DATE = "2025-11-22"
+
+COLUNAS_RFM = ["id_paciente", "recencia_dias", "valor_monetario", "frequencia_consultas"]
+
+# Sentinela para "paciente sem consulta" no array de última data
+SEM_CONSULTA = np.iinfo(np.int32).min
+
+
+def to_day_numbers(datas):
+    # Datas -> número inteiro de dias desde 1970-01-01 (int32)
+    datas = pd.to_datetime(pd.Series(datas) if not isinstance(datas, pd.Series) else datas)
+    return datas.to_numpy(dtype="datetime64[D]").astype(np.int32)
+
+
+def ref_day_number(ref_date):
+    return int(np.datetime64(pd.Timestamp(ref_date).date(), "D").astype(np.int32))
+
+
+class RFMAccumulator:
+    """Agregados RFM por paciente em arrays indexados pelo id_paciente.
+
+    Guarda a última data (em dias), a contagem e a soma de valor de cada paciente. Lotes de
+    consultas podem ser somados em qualquer ordem e o resultado é o mesmo, então a mesma
+    estrutura serve para o cálculo completo, para leitura em chunks e para atualização incremental.
+    """
+
+    def __init__(self, tamanho=0):
+        self.ultimo_dia = np.full(tamanho, SEM_CONSULTA, dtype=np.int32)
+        self.frequencia = np.zeros(tamanho, dtype=np.int64)
+        self.monetario = np.zeros(tamanho, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.frequencia)
+
+    def _grow(self, tamanho):
+        if tamanho <= len(self):
+            return
+        extra = tamanho - len(self)
+        self.ultimo_dia = np.concatenate([self.ultimo_dia, np.full(extra, SEM_CONSULTA, dtype=np.int32)])
+        self.frequencia = np.concatenate([self.frequencia, np.zeros(extra, dtype=np.int64)])
+        self.monetario = np.concatenate([self.monetario, np.zeros(extra, dtype=np.int64)])
+
+    def update(self, ids, dias, valores):
+        # Uma varredura vetorizada por agregado; nenhum callback Python por grupo
+        ids = np.asarray(ids)
+        if len(ids) == 0:
+            return self
+        self._grow(int(ids.max()) + 1)
+        n = len(self)
+        np.maximum.at(self.ultimo_dia, ids, np.asarray(dias, dtype=np.int32))
+        self.frequencia += np.bincount(ids, minlength=n)
+        self.monetario += np.rint(np.bincount(ids, weights=valores, minlength=n)).astype(np.int64)
+        return self
+
+    def update_frame(self, df_consultas):
+        return self.update(
+            df_consultas["id_paciente"].to_numpy(),
+            to_day_numbers(df_consultas["data_consulta"]),
+            df_consultas["valor_consulta"].to_numpy(),
+        )
+
+    @classmethod
+    def from_frame(cls, rfm, ref_date=REF_DATE):
+        # Inverso do to_frame: agregados a partir de uma tabela RFM já calculada (ex.: pelo banco)
+        ids = rfm["id_paciente"].to_numpy()
+        acumulador = cls(int(ids.max()) + 1 if len(ids) else 0)
+        acumulador.ultimo_dia[ids] = ref_day_number(ref_date) - rfm["recencia_dias"].to_numpy()
+        acumulador.frequencia[ids] = rfm["frequencia_consultas"].to_numpy()
+        acumulador.monetario[ids] = rfm["valor_monetario"].to_numpy()
+        return acumulador
+
+    def merge(self, outro):
+        self._grow(len(outro))
+        n = len(outro)
+        np.maximum(self.ultimo_dia[:n], outro.ultimo_dia, out=self.ultimo_dia[:n])
+        self.frequencia[:n] += outro.frequencia
+        self.monetario[:n] += outro.monetario
+        return self
+
+    def patient_ids(self):
+        return np.flatnonzero(self.frequencia > 0)
+
+    def to_frame(self, ref_date=REF_DATE, ids=None):
+        # Só entram pacientes com pelo menos uma consulta (mesmo resultado do groupby)
+        ids = self.patient_ids() if ids is None else np.asarray(ids, dtype=np.int64)
+        return pd.DataFrame({
+            "id_paciente": ids.astype(np.int32),
+            "recencia_dias": (ref_day_number(ref_date) - self.ultimo_dia[ids]).astype(np.int32),
+            "valor_monetario": self.monetario[ids],
+            "frequencia_consultas": self.frequencia[ids].astype(np.int32),
+        }, columns=COLUNAS_RFM)
+
+
+def save_state(acumulador, path, ref_date):
+    # Persiste só os pacientes com consulta; a data de referência vai nos metadados do Parquet
+    ids = acumulador.patient_ids()
+    tabela = pa.table({
+        "id_paciente": ids.astype(np.int32),
+        "ultimo_dia": acumulador.ultimo_dia[ids],
+        "frequencia": acumulador.frequencia[ids],
+        "monetario": acumulador.monetario[ids],
+    })
+    tabela = tabela.replace_schema_metadata({"ref_date": str(pd.Timestamp(ref_date).date())})
+    pq.write_table(tabela, path)
+    return path
+
+
+def load_state(path):
+    tabela = pq.read_table(path, memory_map=True)
+    ref_date = tabela.schema.metadata[b"ref_date"].decode()
+    ids = tabela.column("id_paciente").to_numpy()
+    acumulador = RFMAccumulator(int(ids.max()) + 1 if len(ids) else 0)
+    acumulador.ultimo_dia[ids] = tabela.column("ultimo_dia").to_numpy()
+    acumulador.frequencia[ids] = tabela.column("frequencia").to_numpy()
+    acumulador.monetario[ids] = tabela.column("monetario").to_numpy()
+    return acumulador, ref_date
+
+
+def shift_recency(rfm, ref_antiga, ref_nova):
+    # Recência de quem não teve consulta nova só anda junto com a data de referência
+    rfm = rfm.copy()
+    delta = ref_day_number(ref_nova) - ref_day_number(ref_antiga)
+    rfm["recencia_dias"] = (rfm["recencia_dias"] + delta).astype(np.int32)
+    return rfm
+
+
+def compute_rfm(df_consultas, ref_date=REF_DATE):
+    """Calcula Recência, Frequência e Valor Monetário por paciente em relação a ref_date."""
+    return RFMAccumulator().update_frame(df_consultas).to_frame(ref_date)
+
+
+class RFMSnapshots:
+    """RFM de todos os pacientes em várias datas de corte, com uma única ordenação das consultas.
+
+    As consultas são ordenadas por (paciente, dia) uma vez e ficam com somas acumuladas de
+    contagem e valor. Em cada data de corte, um searchsorted acha para cada paciente a última
+    consulta até a data (inclusive): frequência e valor saem da diferença das somas acumuladas
+    e a recência, do dia dessa consulta. Cada corte custa O(P log N), sem novo groupby.
+    """
+
+    def __init__(self, ids, dias, valores):
+        ids = np.asarray(ids, dtype=np.int64)
+        dias = np.asarray(dias, dtype=np.int64)
+        ordem = np.lexsort((dias, ids))
+        self.dias = dias[ordem]
+        # Chave composta (paciente, dia) ordenada: o corte de um paciente é um searchsorted nela
+        self._base = int(self.dias.max()) - int(self.dias.min()) + 2 if len(ordem) else 1
+        self._dia_min = int(self.dias.min()) if len(ordem) else 0
+        ids = ids[ordem]
+        self._chave = ids * self._base + (self.dias - self._dia_min)
+        self._valor_acumulado = np.concatenate([[0], np.cumsum(np.asarray(valores)[ordem], dtype=np.int64)])
+        self.pacientes, self._inicio = np.unique(ids, return_index=True)
+        self.ultimo_dia_dados = int(self.dias.max()) if len(ordem) else None
+
+    @classmethod
+    def from_frame(cls, df_consultas):
+        return cls(df_consultas["id_paciente"].to_numpy(), to_day_numbers(df_consultas["data_consulta"]),
+                   df_consultas["valor_consulta"].to_numpy())
+
+    def _position(self, dia):
+        # Posição (exclusiva) da última consulta de cada paciente com dia <= `dia`
+        deslocamento = np.clip(dia - self._dia_min, -1, self._base - 1)
+        return np.searchsorted(self._chave, self.pacientes * self._base + deslocamento, side="right")
+
+    def _frame(self, dia, fim):
+        frequencia = fim - self._inicio
+        ativos = frequencia > 0
+        fim_ativos, inicio = fim[ativos], self._inicio[ativos]
+        rfm = pd.DataFrame({
+            "id_paciente": self.pacientes[ativos].astype(np.int32),
+            "recencia_dias": (dia - self.dias[fim_ativos - 1]).astype(np.int32),
+            "valor_monetario": self._valor_acumulado[fim_ativos] - self._valor_acumulado[inicio],
+            "frequencia_consultas": frequencia[ativos].astype(np.int32),
+        }, columns=COLUNAS_RFM)
+        return rfm, ativos
+
+    def at(self, ref_date):
+        """RFM na data de corte: mesmo resultado do RFMAccumulator com as consultas até ref_date."""
+        dia = ref_day_number(ref_date)
+        return self._frame(dia, self._position(dia))[0]
+
+    def long_table(self, datas_corte, horizonte_dias=None):
+        """Tabela longa (paciente, data de corte) com o RFM de cada corte.
+
+        Com horizonte_dias, inclui o rótulo à frente: consultas em (corte, corte + horizonte],
+        churn (nenhuma consulta no horizonte) e rotulo_completo, falso quando o horizonte passa
+        do último dia com dados (o churn desse corte ainda não é conhecido).
+        """
+        partes = []
+        for data_corte in datas_corte:
+            dia = ref_day_number(data_corte)
+            fim = self._position(dia)
+            rfm, ativos = self._frame(dia, fim)
+            rfm.insert(1, "data_corte", np.datetime64(pd.Timestamp(data_corte).date(), "s"))
+            if horizonte_dias is not None:
+                futuras = (self._position(dia + horizonte_dias) - fim)[ativos]
+                rfm["consultas_futuras"] = futuras.astype(np.int32)
+                rfm["churn"] = futuras == 0
+                rfm["rotulo_completo"] = dia + horizonte_dias <= self.ultimo_dia_dados
+            partes.append(rfm)
+        return pd.concat(partes, ignore_index=True)
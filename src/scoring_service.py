@@ -0,0 +1,282 @@
+import http.client
+import json
+import queue
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from .models import FEATURES
+from .rfm import ref_day_number
+
+MAX_BATCH = 256
+MAX_WAIT_MS = 2.0
+MAX_SIMILARES = 100
+
+
+class _Pedido:
+    __slots__ = ("linhas", "evento", "clusters", "scores", "erro")
+
+    def __init__(self, linhas):
+        self.linhas = linhas
+        self.evento = threading.Event()
+        self.clusters = self.scores = self.erro = None
+
+
+class MicroBatcher:
+    """Junta pedidos concorrentes num único predict vetorizado.
+
+    Uma thread dedicada espera o primeiro pedido e agrega os que chegarem em até max_wait_ms
+    (ou até max_batch linhas). K-Means e Random Forest rodam uma vez por lote.
+    """
+
+    def __init__(self, kmeans, model, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self.kmeans = kmeans
+        self.model = model
+        # Lotes pequenos: paralelizar as árvores em threads só acrescenta latência
+        if hasattr(model, "n_jobs"):
+            model.set_params(n_jobs=1)
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.fila = queue.Queue()
+        self.lotes = 0
+        self.linhas = 0
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def score(self, linhas, timeout=5.0):
+        pedido = _Pedido(np.asarray(linhas, dtype=float).reshape(-1, len(FEATURES)))
+        self.fila.put(pedido)
+        if not pedido.evento.wait(timeout):
+            raise TimeoutError("tempo esgotado aguardando o lote de pontuação")
+        if pedido.erro is not None:
+            raise pedido.erro
+        return pedido.clusters, pedido.scores
+
+    def _loop(self):
+        while True:
+            lote = [self.fila.get()]
+            n = len(lote[0].linhas)
+            prazo = time.monotonic() + self.max_wait
+            while n < self.max_batch:
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    pedido = self.fila.get(timeout=restante)
+                except queue.Empty:
+                    break
+                lote.append(pedido)
+                n += len(pedido.linhas)
+            self._run(lote)
+
+    def _predict(self, linhas):
+        X = pd.DataFrame(linhas, columns=FEATURES)
+        return self.kmeans.predict(X), self.model.predict(X)
+
+    def _run(self, lote):
+        try:
+            clusters, scores = self._predict(np.vstack([p.linhas for p in lote]))
+        except Exception:
+            # Um pedido ruim não derruba os outros do lote: cada um é refeito sozinho e o
+            # erro fica só com quem o causou
+            for pedido in lote:
+                try:
+                    pedido.clusters, pedido.scores = self._predict(pedido.linhas)
+                except Exception as e:
+                    pedido.erro = e
+                pedido.evento.set()
+            return
+        inicio = 0
+        for pedido in lote:
+            fim = inicio + len(pedido.linhas)
+            pedido.clusters = clusters[inicio:fim]
+            pedido.scores = scores[inicio:fim]
+            inicio = fim
+            pedido.evento.set()
+        self.lotes += 1
+        self.linhas += len(clusters)
+
+
+class PatientIndex:
+    """Features RFM por id_paciente a partir do estado salvo (acesso O(1) por array)."""
+
+    def __init__(self, acumulador, ref_date):
+        self.acumulador = acumulador
+        self.ref_date = str(ref_date)
+        self._ref_dia = ref_day_number(ref_date)
+
+    def features(self, id_paciente):
+        acc = self.acumulador
+        if id_paciente < 0 or id_paciente >= len(acc) or acc.frequencia[id_paciente] == 0:
+            return None
+        return [self._ref_dia - int(acc.ultimo_dia[id_paciente]),
+                int(acc.frequencia[id_paciente]),
+                int(acc.monetario[id_paciente])]
+
+
+def _resultado(features, cluster, score):
+    resultado = dict(zip(FEATURES, features))
+    resultado["cluster_rfm"] = int(cluster)
+    resultado["frequencia_prevista_reg"] = float(score)
+    return resultado
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 mantém a conexão aberta entre pedidos (keep-alive)
+    protocol_version = "HTTP/1.1"
+    # Cabeçalho e corpo saem em escritas separadas: sem isso, Nagle + ACK atrasado somam ~40 ms
+    disable_nagle_algorithm = True
+    ROTA_PACIENTE = re.compile(r"^/pacientes/(\d+)$")
+    ROTA_SIMILARES = re.compile(r"^/pacientes/(\d+)/similares(?:\?k=(\d+))?$")
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, corpo):
+        dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_GET(self):
+        servico = self.server.servico
+        if self.path == "/health":
+            return self._json(200, {"status": "ok", **servico["info"]})
+        if self.path == "/stats":
+            batcher = servico["batcher"]
+            return self._json(200, {"lotes": batcher.lotes, "linhas": batcher.linhas,
+                                    "media_por_lote": batcher.linhas / max(batcher.lotes, 1)})
+        rota = self.ROTA_SIMILARES.match(self.path)
+        if rota is not None:
+            return self._similar(int(rota.group(1)), int(rota.group(2) or 10))
+        rota = self.ROTA_PACIENTE.match(self.path)
+        if rota is None:
+            return self._json(404, {"erro": "rota não encontrada"})
+        indice = servico["pacientes"]
+        if indice is None:
+            return self._json(503, {"erro": "estado RFM não carregado"})
+        id_paciente = int(rota.group(1))
+        features = indice.features(id_paciente)
+        if features is None:
+            return self._json(404, {"erro": f"paciente {id_paciente} sem consultas"})
+        try:
+            clusters, scores = servico["batcher"].score([features])
+        except TimeoutError as e:
+            return self._json(503, {"erro": str(e)})
+        except Exception as e:
+            return self._json(500, {"erro": f"falha na pontuação: {e}"})
+        return self._json(200, {"id_paciente": id_paciente, "ref_date": indice.ref_date,
+                                **_resultado(features, clusters[0], scores[0])})
+
+    def _similar(self, id_paciente, k):
+        indice = self.server.servico["similares"]
+        if indice is None:
+            return self._json(503, {"erro": "índice de pacientes semelhantes não carregado"})
+        similares = indice.similar(id_paciente, min(k, MAX_SIMILARES))
+        if similares is None:
+            return self._json(404, {"erro": f"paciente {id_paciente} fora do índice"})
+        ids, _, distancias = similares
+        return self._json(200, {"id_paciente": id_paciente, "similares": [
+            {"id_paciente": int(i), "distancia": round(float(d), 6)} for i, d in zip(ids, distancias)]})
+
+    def do_POST(self):
+        # Corpo: {"recencia_dias": .., "frequencia_consultas": .., "valor_monetario": ..} ou uma lista deles
+        if self.path != "/score":
+            return self._json(404, {"erro": "rota não encontrada"})
+        try:
+            corpo = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"null")
+            itens = corpo if isinstance(corpo, list) else [corpo]
+            linhas = [[float(item[f]) for f in FEATURES] for item in itens]
+        except (ValueError, KeyError, TypeError) as e:
+            return self._json(400, {"erro": f"entrada inválida: {e}", "campos": FEATURES})
+        # Validado antes do lote: o json aceita NaN/Infinity, que o predict rejeitaria
+        if not linhas:
+            return self._json(400, {"erro": "lista vazia", "campos": FEATURES})
+        if not np.isfinite(np.asarray(linhas)).all():
+            return self._json(400, {"erro": "entrada inválida: valores devem ser números finitos", "campos": FEATURES})
+        try:
+            clusters, scores = self.server.servico["batcher"].score(linhas)
+        except TimeoutError as e:
+            return self._json(503, {"erro": str(e)})
+        except Exception as e:
+            return self._json(500, {"erro": f"falha na pontuação: {e}"})
+        resultados = [_resultado(l, c, s) for l, c, s in zip(linhas, clusters, scores)]
+        return self._json(200, resultados if isinstance(corpo, list) else resultados[0])
+
+
+class ScoringServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # O padrão (5) descarta conexões quando muitos clientes conectam ao mesmo tempo
+    request_queue_size = 128
+
+
+def make_server(host, port, kmeans, model, pacientes=None, info=None,
+                max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS, similares=None):
+    servidor = ScoringServer((host, port), ScoringHandler)
+    servidor.servico = {
+        "batcher": MicroBatcher(kmeans, model, max_batch=max_batch, max_wait_ms=max_wait_ms),
+        "pacientes": pacientes,
+        "similares": similares,
+        "info": info or {},
+    }
+    return servidor
+
+
+# --- GERADOR DE CARGA ---
+def run_load(host, port, total=2000, concorrencia=16, ids=None, seed=42):
+    """Dispara `total` pedidos com `concorrencia` conexões keep-alive e mede latência e vazão.
+
+    Com `ids`, consulta GET /pacientes/<id>; sem, envia POST /score com RFM aleatório.
+    """
+    por_thread = [total // concorrencia + (1 if i < total % concorrencia else 0) for i in range(concorrencia)]
+    latencias = [[] for _ in range(concorrencia)]
+    erros = [0] * concorrencia
+
+    def worker(i):
+        conexao = http.client.HTTPConnection(host, port, timeout=10)
+        rng_local = np.random.default_rng([seed, i])
+        for _ in range(por_thread[i]):
+            if ids is not None:
+                metodo, rota, corpo = "GET", f"/pacientes/{int(rng_local.choice(ids))}", None
+            else:
+                corpo = json.dumps({"recencia_dias": int(rng_local.integers(0, 366)),
+                                    "frequencia_consultas": int(rng_local.integers(1, 8)),
+                                    "valor_monetario": int(rng_local.choice([0, 100, 500, 1000, 2500]))})
+                metodo, rota = "POST", "/score"
+            inicio = time.perf_counter()
+            try:
+                conexao.request(metodo, rota, body=corpo, headers={"Content-Type": "application/json"})
+                resposta = conexao.getresponse()
+                resposta.read()
+            except OSError:
+                erros[i] += 1
+                conexao.close()
+                continue
+            latencias[i].append(time.perf_counter() - inicio)
+            if resposta.status != 200:
+                erros[i] += 1
+        conexao.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concorrencia)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - inicio
+
+    todas = np.concatenate([np.asarray(l) for l in latencias]) * 1000
+    return {
+        "pedidos": total,
+        "erros": int(sum(erros)),
+        "concorrencia": concorrencia,
+        "p50_ms": round(float(np.percentile(todas, 50)), 3),
+        "p99_ms": round(float(np.percentile(todas, 99)), 3),
+        "max_ms": round(float(todas.max()), 3),
+        "vazao_rps": round(len(todas) / duracao, 1),
+    }
@@ -0,0 +1,19 @@
+import importlib.util
+import os
+import sys
+
+from .artifacts import PROJECT_ROOT
+
+# Scripts da raiz reaproveitados por outros scripts (pipeline.py, benchmark.py, process-clinics.py).
+# O process-data.py tem hífen no nome e não pode ser importado com import.
+PROCESS_DATA = "process_data"
+
+
+def load_process_data():
+    """O process-data.py como módulo, carregado uma vez por processo."""
+    if PROCESS_DATA not in sys.modules:
+        spec = importlib.util.spec_from_file_location(PROCESS_DATA, os.path.join(PROJECT_ROOT, "process-data.py"))
+        modulo = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(modulo)
+        sys.modules[PROCESS_DATA] = modulo
+    return sys.modules[PROCESS_DATA]
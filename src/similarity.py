@@ -0,0 +1,93 @@
+import os
+
+import joblib
+import numpy as np
+from sklearn.neighbors import KDTree
+
+from .models import FEATURES
+
+# "Pacientes semelhantes": KD-tree sobre o RFM em escala log (np.log1p, como no README) e
+# padronizado (média 0, desvio 1), para que dias, consultas e reais pesem igual na distância.
+# Construído pelo pipeline junto com o arquivo final e gravado ao lado dele; cada consulta
+# custa O(log N) em vez de percorrer a tabela inteira. Pacientes sem classificação
+# (cluster -1, sem consultas) ficam de fora.
+INDICE = "indice_similares.joblib"
+FOLHA = 40
+
+
+def _transform(X):
+    # Recência negativa (consultas depois da data de referência) conta como 0
+    return np.log1p(np.clip(np.asarray(X, dtype=float), 0, None))
+
+
+class SimilarityIndex:
+    """K vizinhos mais próximos por id_paciente ou por um vetor RFM qualquer.
+
+    `posicoes` são as linhas dos pacientes no frame usado na construção (a ordem do
+    pacientes_engajamento_score gravado), para buscar os demais dados sem outra junção.
+    """
+
+    def __init__(self, df, leaf_size=FOLHA):
+        classificados = np.flatnonzero(df['cluster_rfm'].to_numpy() != -1)
+        self.ids = df['id_paciente'].to_numpy()[classificados].astype(np.int64)
+        self.posicoes = classificados
+        X = _transform(df[FEATURES].to_numpy()[classificados])
+        self.media = X.mean(axis=0) if len(X) else np.zeros(len(FEATURES))
+        desvio = X.std(axis=0) if len(X) else np.ones(len(FEATURES))
+        self.desvio = np.where(desvio > 0, desvio, 1.0)
+        self.arvore = KDTree((X - self.media) / self.desvio, leaf_size=leaf_size)
+        # id_paciente -> ponto da árvore (-1: fora do índice); ids são inteiros densos
+        self._ponto = np.full(int(self.ids.max()) + 1 if len(self.ids) else 0, -1, dtype=np.int64)
+        self._ponto[self.ids] = np.arange(len(self.ids))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _scale(self, features):
+        return (_transform(features).reshape(-1, len(FEATURES)) - self.media) / self.desvio
+
+    def point(self, id_paciente):
+        if id_paciente < 0 or id_paciente >= len(self._ponto) or self._ponto[id_paciente] < 0:
+            return None
+        return int(self._ponto[id_paciente])
+
+    def _query(self, x, k):
+        k = min(k, len(self))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        distancias, pontos = self.arvore.query(x.reshape(1, -1), k=k)
+        return pontos[0], distancias[0]
+
+    def neighbors(self, features, k=10):
+        """Os k pacientes mais próximos de um vetor RFM (recência, frequência, valor).
+
+        Devolve (ids, posicoes, distancias).
+        """
+        pontos, distancias = self._query(self._scale(features), k)
+        return self.ids[pontos], self.posicoes[pontos], distancias
+
+    def similar(self, id_paciente, k=10):
+        """Os k pacientes mais parecidos com `id_paciente` (ele mesmo excluído).
+
+        Devolve (ids, posicoes, distancias) ou None se o paciente não está no índice.
+        """
+        ponto = self.point(id_paciente)
+        if ponto is None:
+            return None
+        pontos, distancias = self._query(np.asarray(self.arvore.data[ponto]), k + 1)
+        # Com RFM repetido (empates a distância 0) o próprio paciente pode não vir primeiro
+        manter = pontos != ponto
+        pontos, distancias = pontos[manter][:k], distancias[manter][:k]
+        return self.ids[pontos], self.posicoes[pontos], distancias
+
+
+def save_index(indice, data_dir):
+    path = os.path.join(data_dir, INDICE)
+    joblib.dump(indice, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def load_index(data_dir):
+    path = os.path.join(data_dir, INDICE)
+    return joblib.load(path) if os.path.exists(path) else None
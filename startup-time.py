@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+# Mede o tempo de partida a frio do dashboard: cada repetição roda o app.py uma vez num
+# processo Python novo (sem módulos importados nem cache do Streamlit) via AppTest.
+# O resultado é acrescentado a um histórico JSONL para acompanhar a evolução entre versões.
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+HISTORICO = os.path.join(PROJECT_ROOT, "data", "startup_tempos.jsonl")
+
+MEDICAO = """
+import json, resource, sys, time
+inicio = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+# Uma execução vazia antes: a inicialização do próprio Streamlit não entra na medição
+AppTest.from_string("import streamlit as st").run()
+pronto = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=600)
+at.run()
+fim = time.perf_counter()
+print(json.dumps({
+    "harness_s": pronto - inicio,
+    "primeira_execucao_s": fim - pronto,
+    "modulos": len(sys.modules),
+    "pico_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "erro": str(at.exception[0].value) if at.exception else None,
+}))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Mede o tempo de partida a frio do dashboard (app.py).")
+    parser.add_argument("--app", default=os.path.join(PROJECT_ROOT, "app.py"))
+    parser.add_argument("--data-dir", default=None,
+                        help="Pasta de dados do dashboard (padrão: a do app, data/).")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--historico", default=HISTORICO, help="Arquivo JSONL onde cada medição é acrescentada.")
+    parser.add_argument("--sem-historico", action="store_true", help="Só imprime, sem gravar no histórico.")
+    return parser.parse_args()
+
+
+def measure(app, data_dir=None):
+    env = dict(os.environ)
+    if data_dir:
+        env["DASHBOARD_DATA_DIR"] = os.path.abspath(data_dir)
+    saida = subprocess.run([sys.executable, "-c", MEDICAO, app], env=env, capture_output=True, text=True, check=True)
+    resultado = json.loads(saida.stdout.strip().splitlines()[-1])
+    if resultado["erro"]:
+        raise RuntimeError(f" O app falhou durante a medição:\n{resultado['erro']}")
+    return resultado
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    args = parse_args()
+    medicoes = []
+    for i in range(args.repeticoes):
+        medicoes.append(measure(args.app, args.data_dir))
+        print(f" Execução {i + 1}: {medicoes[-1]['primeira_execucao_s']:.2f}s")
+
+    registro = {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "data_dir": os.path.abspath(args.data_dir) if args.data_dir else None,
+        "repeticoes": args.repeticoes,
+        "primeira_execucao_s": round(statistics.median(m["primeira_execucao_s"] for m in medicoes), 3),
+        "primeira_execucao_min_s": round(min(m["primeira_execucao_s"] for m in medicoes), 3),
+        "modulos": medicoes[-1]["modulos"],
+        "pico_rss_mb": round(max(m["pico_rss_mb"] for m in medicoes), 1),
+    }
+    print("\n" + json.dumps(registro, ensure_ascii=False, indent=2))
+
+    if args.sem_historico:
+        return
+    anteriores = []
+    if os.path.exists(args.historico):
+        with open(args.historico, encoding="utf-8") as f:
+            anteriores = [json.loads(linha) for linha in f if linha.strip()]
+    mesma_base = [r for r in anteriores if r.get("data_dir") == registro["data_dir"]]
+    if mesma_base:
+        anterior = mesma_base[-1]
+        variacao = registro["primeira_execucao_s"] / anterior["primeira_execucao_s"] - 1
+        print(f"\n Anterior ({anterior['commit']}, {anterior['data']}): {anterior['primeira_execucao_s']:.2f}s "
+              f"-> {registro['primeira_execucao_s']:.2f}s ({variacao:+.0%})")
+    os.makedirs(os.path.dirname(os.path.abspath(args.historico)), exist_ok=True)
+    with open(args.historico, "a", encoding="utf-8") as f:
+        f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+    print(args.historico)
+
+
+if __name__ == "__main__":
+    main()